@@ -1,55 +1,70 @@
 import asyncio
+import functools
 import logging
 import os
+import re
 import shutil
 import time
-from typing import List, Union
+from typing import Callable, List, Optional, Tuple, Union
+
 import pyrogram
 from loguru import logger
-from typing import AsyncGenerator, Optional
-import re
 from rich.logging import RichHandler
+
+from module import metrics
 from module.app import Application, ChatDownloadConfig, DownloadStatus, TaskNode
+from module.async_db import AsyncDB
 from module.bot import start_download_bot, stop_download_bot
-from module.download_stat import update_download_status
-from module.get_chat_history_v2 import get_chat_history_v2
+from module.chat_scan_scheduler import ChatScanScheduler, set_chat_scan_scheduler
+from module.download_scheduler import DownloadScheduler
+from module.download_stat import (
+    finish_download_status,
+    get_download_pacer,
+    update_download_status,
+)
+from module.finalize import FinalizeJob, FinalizeStage
+from module.get_chat_history_v2 import get_chat_history_v2, get_latest_message_id
 from module.language import _t
 from module.pyrogram_extension import (
     HookClient,
     fetch_message,
     record_download_status,
     report_bot_download_status,
+    set_download_cache_status,
     set_max_concurrent_transmissions,
     set_meta_data,
     update_cloud_upload_stat,
     upload_telegram_chat,
 )
-from module.web import init_web
-
-from utils.format import (
-    validate_title,
+from module.rate_limiter import get_rate_limiter
+from module.scan_watermark import ScanWatermark, split_segments
+from module.segmented_download import (
+    download_segments,
+    get_missing_size,
+    set_max_download_segments,
 )
-
+from module.sqlmodel import Downloaded
+from module.task_events import task_progress_changed
+from module.web import init_web, stop_web
+from utils.chunk_manifest import ChunkManifest
+from utils.format import validate_title
 from utils.format_addon import (
-    process_string,
-    find_missing_files,
-    merge_files_cat,
-    merge_files_write,
-    merge_files_shutil,
-    get_folder_files_size,
-    _get_msg_db_status,
     Msg_db_Status,
     Msg_file_Status,
+    _get_msg_db_status,
     _get_msg_file_status,
+    get_folder_files_size,
+    merge_files_auto,
+    merge_files_cat,
+    merge_files_shutil,
+    merge_files_write,
+    process_string,
     save_chunk_to_file,
 )
-
-
 from utils.log import LogFilter
 from utils.meta import print_meta
 from utils.meta_data import MetaData
-
-from module.sqlmodel import Downloaded
+from utils.sparse_file import SparseFileWriter
 
 logging.basicConfig(
     level=logging.INFO,
@@ -64,9 +79,20 @@ APPLICATION_NAME = "media_downloader"
 app = Application(CONFIG_NAME, DATA_FILE_NAME, APPLICATION_NAME)
 
 queue_maxsize = 1000
-queue: asyncio.Queue = asyncio.Queue(maxsize=queue_maxsize)
+# 与 get_chat_history_v2 每次请求的条数一致
+HISTORY_PAGE_SIZE = 100
+DB_OPTIMIZE_INTERVAL = 60 * 60
+# 每段至少这么多个消息ID才分段扫描
+SCAN_SEGMENT_MIN = 1000
+queue: DownloadScheduler = DownloadScheduler(maxsize=queue_maxsize)
 
 RETRY_TIME_OUT = 3
+# get_messages 每次最多取的消息数
+RETRY_BATCH_SIZE = 200
+# 同时请求的重试批次数 请求频率由 rate_limiter 的 history 限额控制
+RETRY_FETCH_CONCURRENCY = 4
+# 每次从数据库读取的重试id数
+RETRY_DB_PAGE_SIZE = 1000
 
 CHUNK_MIN = 10
 
@@ -79,6 +105,11 @@ logging.getLogger("pyrogram.client").addFilter(LogFilter())
 logging.getLogger("pyrogram").setLevel(logging.WARNING)
 
 db = Downloaded()
+async_db = AsyncDB(db)
+
+download_pacer = get_download_pacer()
+rate_limiter = get_rate_limiter()
+finalize_stage = FinalizeStage()
 
 def need_skip_message(message, chat_download_config, app):
     try:
@@ -101,7 +132,8 @@ def need_skip_message(message, chat_download_config, app):
     except Exception as e:
         logger.exception(f"{e}")
 
-def check_download_finish(media_size: int, download_path: str, ui_file_name: str, chunk_count: int) -> bool:
+def check_download_finish(media_size: int, download_path: str, ui_file_name: str, chunk_count: int,
+                          manifest: Optional[ChunkManifest] = None) -> bool:
     # 类型检查
     if not isinstance(media_size, int) or not isinstance(download_path, str) or not isinstance(ui_file_name,
                                                                                                str) or not isinstance(
@@ -112,6 +144,12 @@ def check_download_finish(media_size: int, download_path: str, ui_file_name: str
     if media_size <= 0 or chunk_count <= 0:
         return False
 
+    if manifest:
+        # 清单记录了每个分块的大小 有校验值时重新校验
+        if manifest.verify(download_path):
+            return False
+        return manifest.chunk_count == chunk_count and manifest.is_complete()
+
     try:
         files_count, total_size, files_size = get_folder_files_size(download_path)
     except Exception as e:
@@ -139,20 +177,70 @@ def merge_chunkfile(folder_path: str, output_file: str, chunk_count: int, file_s
         return False
 
     # 根据方法选择合并方式
-    if method == 'cat':
+    start_time = time.perf_counter()
+    if method == 'auto':
+        merge_files_auto(folder_path, output_file)
+    elif method == 'cat':
         merge_files_cat(folder_path, output_file)
     elif method == 'write':
         merge_files_write(folder_path, output_file)
     elif method == 'shutil':
         merge_files_shutil(folder_path, output_file)
     else:
-        raise ValueError(f"Invalid method '{method}'. Supported methods are 'cat', 'write', and 'shutil'.")
+        raise ValueError(
+            f"Invalid method '{method}'. Supported methods are 'auto', 'cat', 'write', and 'shutil'.")
+    metrics.MERGE_SECONDS.observe(time.perf_counter() - start_time, method=method)
 
     # 检查文件是否存在且大小正确
-    while not _is_exist(output_file) and os.path.getsize(output_file) != file_size:
-        time.sleep(RETRY_TIME_OUT)
+    return _is_exist(output_file) and os.path.getsize(output_file) == file_size
+
+
+def _finalize_chunk_download(media_dict: dict, chunk_dir: str, file_name: str, chunk_count: int,
+                             chunk_manifest: Optional[ChunkManifest]) -> bool:
+    """Merge, verify and clean up a finished chunk download, runs on a finalize thread"""
+    media_size = media_dict.get('media_size')
+    if not merge_chunkfile(folder_path=chunk_dir, output_file=file_name, chunk_count=chunk_count,
+                           file_size=media_size, method=app.merge_method):
+        return False
+
+    shutil.rmtree(chunk_dir)
+    if chunk_manifest:
+        chunk_manifest.remove()
+
+    media_dict['status'] = 1
+    db.insert_into_db(media_dict)
+    return True
+
+
+def _finalize_sparse_download(media_dict: dict, sparse_writer: SparseFileWriter, file_name: str) -> bool:
+    """Flush and move a finished sparse download, runs on a finalize thread"""
+    sparse_writer.finish()
+    _move_to_download_path(sparse_writer.path, file_name)
+    if not _is_exist(file_name) or os.path.getsize(file_name) != media_dict.get('media_size'):
+        return False
+
+    media_dict['status'] = 1
+    db.insert_into_db(media_dict)
     return True
 
+
+async def _submit_finalize(client: pyrogram.Client, message: pyrogram.types.Message, node: TaskNode,
+                           file_name: str, run: Callable[[], bool]):
+    """Hand a finished download to the finalize stage"""
+
+    async def _on_done(success: bool):
+        if success:
+            logger.success(f"完成下载{file_name}...剩余：{queue.qsize()}")
+            download_status = DownloadStatus.SuccessDownload
+        else:
+            logger.error(f"[{node.chat_id}]{message.id}: failed to finalize {file_name}")
+            download_status = DownloadStatus.FailedDownload
+        set_download_cache_status(node.chat_id, message.id, download_status)
+        await _finish_download_task(client, message, node, download_status,
+                                    file_name if success else None)
+
+    await finalize_stage.submit(FinalizeJob(file_name, run, _on_done))
+
 def _move_to_download_path(temp_download_path: str, download_path: str):
     """Move file to download path
 
@@ -235,6 +323,13 @@ def _is_exist(file_path: str) -> bool:
 
 
 # pylint: disable = R0912
+def _get_db_chat_id(chat_id: int) -> int:
+    """Chat id as stored in the database, channel ids without the -100 prefix"""
+    if chat_id < 0:
+        return 0 - chat_id - 1000000000000
+    return chat_id
+
+
 def _get_media_meta(
         message: pyrogram.types.Message
 ) -> dict:
@@ -243,10 +338,7 @@ def _get_media_meta(
 
     try:
 
-        if message.chat.id < 0:
-            msg_real_chat_id = 0 - message.chat.id - 1000000000000
-        else:
-            msg_real_chat_id = message.chat.id
+        msg_real_chat_id = _get_db_chat_id(message.chat.id)
 
         msg_real_chat_username = message.chat.username
         msg_real_message_id = message.id
@@ -437,56 +529,142 @@ async def add_download_task(
     if message.empty:
         return False
 
+    return await add_download_tasks([message], node) > 0
+
+
+async def add_download_tasks(
+        messages: List[pyrogram.types.Message],
+        node: TaskNode,
+) -> int:
+    """Classify one page of messages with batched DB lookups and queue the ones to download
+
+    Returns the number of queued messages
+    """
+    msg_dicts = [(message, _get_media_meta(message)) for message in messages if not message.empty]
+    if not msg_dicts:
+        return 0
+
+    # 每个聊天一次IN查询取回整页的数据库状态
+    db_statuses = await _get_page_db_statuses(msg_dicts)
+
+    # 文件状态只与自身有关 在事务外先查好
+    file_statuses = {}
+    for message, msg_dict in msg_dicts:
+        if db_statuses.get(message.id) == 2:
+            file_statuses[message.id] = await _get_msg_file_status(msg_dict)
+
+    def _classify_page() -> List[DownloadStatus]:
+        with db.atomic():  # 整页的写入只提交一次
+            # 依次判断 同一页里先入库的消息对后面的去重判断可见
+            return [_classify_download_task(msg_dict, db_statuses.get(message.id, 0), file_statuses.get(message.id))
+                    for message, msg_dict in msg_dicts]
+
+    # 去重判断要查库 放到数据库线程上执行
+    download_statuses = await async_db.run(_classify_page, name='classify_page')
+
+    to_queue = []
+    for (message, msg_dict), download_status in zip(msg_dicts, download_statuses):
+        node.download_status[message.id] = download_status
+        if download_status == DownloadStatus.Downloading:
+            to_queue.append((message, msg_dict))
+
+    # 机器人和链接下载走优先通道
+    priority = node.bot is not None
+    for message, msg_dict in to_queue:
+        await queue.put((message, node), key=node, size=_get_queue_size(msg_dict), priority=priority)
+
+        if not msg_dict.get('chat_username') or msg_dict.get('chat_username') == '':
+            show_chat_username = str(msg_dict.get('chat_id'))
+        else:
+            show_chat_username = msg_dict.get('chat_username')
+        logger.info(f"加入队列[{show_chat_username}]{msg_dict.get('filename')}   当前队列长：{queue.qsize()}")
+        node.total_task += 1
+
+    return len(to_queue)
+
+
+def _get_db_key(message: pyrogram.types.Message, msg_dict: dict) -> Tuple[int, int]:
+    """(chat_id, message_id) the record of a message is stored under
+
+    转发到allowed_user_ids聊天的消息按来源聊天的id入库 元数据读取失败时退回消息本身的id
+    """
+    if msg_dict.get('chat_id') is not None and msg_dict.get('message_id') is not None:
+        return msg_dict['chat_id'], msg_dict['message_id']
+    return _get_db_chat_id(message.chat.id), message.id
+
+
+async def _get_page_db_statuses(msg_dicts: List[Tuple[pyrogram.types.Message, dict]]) -> dict:
+    """数据库状态 按消息id返回 按入库的聊天分组 每组一次IN查询"""
+    by_chat: dict = {}
+    for message, msg_dict in msg_dicts:
+        chat_id, db_message_id = _get_db_key(message, msg_dict)
+        by_chat.setdefault(chat_id, []).append((message.id, db_message_id))
+
+    db_statuses = {}
+    for chat_id, ids in by_chat.items():
+        statuses = await async_db.get_status_batch(chat_id, [db_message_id for _, db_message_id in ids])
+        for message_id, db_message_id in ids:
+            if db_message_id in statuses:
+                db_statuses[message_id] = statuses[db_message_id]
+    return db_statuses
+
+
+def _get_queue_size(msg_dict: dict) -> int:
+    """Sort key of a queued message for the size aware download orders"""
+    media_size = msg_dict.get('media_size') or 0
+    temp_file_name = msg_dict.get('temp_file_fullname')
+    if app.download_order != 'remaining' or not temp_file_name or media_size < 1024 * 1024 * CHUNK_MIN:
+        return media_size
+
+    # 分块清单里记录了已完成的字节数
+    manifest_path = os.path.join(os.path.dirname(temp_file_name),
+                                 f"{msg_dict.get('message_id')}_chunk.manifest")
+    if not os.path.exists(manifest_path):
+        return media_size
+    try:
+        return media_size - ChunkManifest(manifest_path, media_size).done_size
+    except Exception:
+        return media_size
+
+
+def _classify_download_task(msg_dict: dict, db_status: int,
+                            msg_file_status: Optional[Msg_file_Status]) -> DownloadStatus:
+    """Decide if a message has to be downloaded, record it as queued in the DB if so
+
+    Runs on the database thread, returns DownloadStatus.Downloading for a message to queue
+    """
     To_Down = False
 
-    msg_dict = _get_media_meta(message)
-    msg_db_status = _get_msg_db_status(msg_dict, db, similar_set, sizerange_min)
+    msg_db_status = _get_msg_db_status(msg_dict, db, similar_set, sizerange_min, db_status)
 
     if msg_db_status == Msg_db_Status.DB_Exist:  # 数据库有完成
-        node.download_status[message.id] = DownloadStatus.SuccessDownload
-        return
+        return DownloadStatus.SuccessDownload
     elif msg_db_status == Msg_db_Status.DB_Aka_Exist:  # 数据库有 标记为与其他等价
         # 文件有没有暂时不管
-        node.download_status[message.id] = DownloadStatus.SkipDownload
-        return
+        return DownloadStatus.SkipDownload
     elif msg_db_status == Msg_db_Status.DB_Downloading:  # 数据库标识为正在下载
 
-        msg_file_status = await _get_msg_file_status(msg_dict)
         if msg_file_status == Msg_file_Status.File_Exist or msg_file_status == Msg_file_Status.File_Aka_Exist:
             # 文件存在
-            node.download_status[message.id] = DownloadStatus.SkipDownload
             msg_dict['status'] = 1
             db.insert_into_db(msg_dict)  # 补写入数据库
-            return
+            return DownloadStatus.SkipDownload
         else:
             # 文件没了
             To_Down = True  # 重新下载
     elif msg_db_status == Msg_db_Status.DB_Aka_Downloading:  # 数据库有其他等价文件在下载
-        node.download_status[message.id] = DownloadStatus.SkipDownload
-        return
+        return DownloadStatus.SkipDownload
     elif msg_db_status == Msg_db_Status.DB_No_Exist:  # 数据库没有
         To_Down = True
     elif msg_db_status == Msg_db_Status.DB_Passed:  #标记为人为跳过
-        node.download_status[message.id] = DownloadStatus.SkipDownload
-        return
+        return DownloadStatus.SkipDownload
 
     if not To_Down:
-        node.download_status[message.id] = DownloadStatus.SkipDownload
-        return
+        return DownloadStatus.SkipDownload
 
-    node.download_status[message.id] = DownloadStatus.Downloading
-    await queue.put((message, node))
     msg_dict['status'] = 2  # 写入数据库 记录进入下载队列
     db.insert_into_db(msg_dict)
-
-    if not msg_dict.get('chat_username') or msg_dict.get('chat_username') == '':
-        show_chat_username = str(msg_dict.get('chat_id'))
-    else:
-        show_chat_username = msg_dict.get('chat_username')
-    logger.info(f"加入队列[{show_chat_username}]{msg_dict.get('filename')}   当前队列长：{queue.qsize()}")
-    node.total_task += 1
-
-    return True
+    return DownloadStatus.Downloading
 
 
 async def save_msg_to_file(
@@ -522,14 +700,28 @@ async def download_task(client: pyrogram.Client, message: pyrogram.types.Message
     download_status, file_name = await download_media(client=client, message=message, media_types=app.media_types,
                                                       file_formats=app.file_formats, node=node)
 
+    if download_status is DownloadStatus.Downloading and file_name:
+        # 已交给合并阶段 由其完成后续处理
+        return
 
     if app.enable_download_txt and message.text and not message.media:
         download_status, file_name = await save_msg_to_file(app, node.chat_id, message)
 
+    await _finish_download_task(client, message, node, download_status, file_name)
+
+
+async def _finish_download_task(client: pyrogram.Client, message: pyrogram.types.Message, node: TaskNode,
+                                download_status: DownloadStatus, file_name: Optional[str]):
+    """Record, upload and report a download once its file is final"""
     if not node.bot:
         app.set_download_id(node, message.id, download_status)
 
     node.download_status[message.id] = download_status
+    if download_status is DownloadStatus.SuccessDownload:
+        finish_download_status(node, message.id, "done")
+    else:
+        finish_download_status(node, message.id,
+                               "failed" if download_status is DownloadStatus.FailedDownload else "skipped")
 
     file_size = os.path.getsize(file_name) if file_name else 0
 
@@ -583,12 +775,14 @@ async def download_media(
                                      time.time(),
                                      node, client)
         media_dict['status'] = 1
-        db.insert_into_db(media_dict)
+        await async_db.insert_into_db(media_dict)
 
         return DownloadStatus.SuccessDownload, media_dict.get('filename')
 
     task_start_time: float = time.time()
     _media = None
+    # 出错只让本文件退避 FloodWait 仍让所有下载一起冷却
+    pacer = download_pacer.transfer()
 
     message_id = media_dict.get('message_id')
     _media = media_dict
@@ -608,7 +802,10 @@ async def download_media(
         ui_file_name = f"****{os.path.splitext(file_name.split('/')[0])}"
 
     for retry in range(3):
+        sparse_writer = None
+        chunk_manifest = None
         try:
+            await pacer.wait()
             temp_file_path = os.path.dirname(temp_file_name)
             chunk_dir = f"{temp_file_path}/{message_id}_chunk"
 
@@ -632,6 +829,7 @@ async def download_media(
                             client,
                         ),
                     )
+                    pacer.on_success()
                 except pyrogram.errors.exceptions.bad_request_400.BadRequest:
                     logger.warning(
                         f"[{show_chat_username}]{message_id}: {_t('file reference expired, refetching')}..."
@@ -645,15 +843,26 @@ async def download_media(
                             f"{_t('file reference expired for 3 retries, download skipped.')}"
                         )
                 except pyrogram.errors.exceptions.flood_420.FloodWait as wait_err:
-                    await asyncio.sleep(wait_err.value)
+                    pacer.on_flood_wait(wait_err.value)
+                    await pacer.wait()
                     logger.warning(f"[{show_chat_username}]: FlowWait ", message_id, wait_err.value)
                     _check_timeout(retry, message_id)
                 except Exception as e:
+                    pacer.on_error()
                     logger.exception(f"{e}")
                     pass
+            elif app.download_chunk_mode == 'sparse':  # 大文件 预分配单文件按偏移写入
+                sparse_writer = SparseFileWriter(os.path.join(temp_file_path, f"{message_id}.part"), media_size)
+                chunks_to_down = sparse_writer.missing_ranges()
+                save_chunk = sparse_writer.write_chunk
             else:  #大文件 采用分快下载模式
+                # 已完成的分块记录在清单中 不再每次列目录
+                manifest_path = f"{chunk_dir}.manifest"
+                first_chunk_removed = False
                 if not os.path.exists(chunk_dir):
                     os.makedirs(chunk_dir, exist_ok=True)
+                    if os.path.exists(manifest_path):  # 分块目录已被删除 清单作废
+                        os.remove(manifest_path)
                 else:
                     temp_file = os.path.join(chunk_dir, '00000000.temp')
                     temp_file_end = os.path.join(chunk_dir, '00000000')
@@ -661,62 +870,81 @@ async def download_media(
                         os.remove(temp_file)
                     if os.path.exists(temp_file_end) and os.path.getsize(temp_file_end) > 1024 * 1024:
                         os.remove(temp_file_end)
-                chunk_count = int(media_size / 1024 / 1024) + 1
-                chunks_to_down = find_missing_files(chunk_dir, chunk_count)
+                        first_chunk_removed = True
+                chunk_manifest = ChunkManifest(manifest_path, media_size, chunk_dir=chunk_dir)
+                if first_chunk_removed:
+                    chunk_manifest.discard([0])
+                chunk_count = chunk_manifest.chunk_count
+                chunks_to_down = chunk_manifest.missing_ranges()
+
+                def save_chunk(chunk_idx: int, chunk: bytes) -> bool:
+                    if not save_chunk_to_file(chunk, chunk_dir, f"{chunk_idx:08d}"):
+                        return False
+                    return chunk_manifest.mark_done(chunk_idx, chunk, app.chunk_checksum)
+
+            if media_size >= 1024 * 1024 * CHUNK_MIN:
                 if chunks_to_down and len(chunks_to_down) >= 1:  # 至少有一批
-                    for start_id, end_id in chunks_to_down:  # 遍历缺失的文件批次
-                        down_byte = int(start_id) * 1024 * 1024
-                        chunk_it = start_id
-                        try:
-                            async for chunk in client.stream_media(message, offset=start_id,
-                                                                   limit=end_id - start_id + 1):
-                                chunk_filename = f"{str(int(chunk_it)).zfill(8)}"
-                                chunk_it += 1
-                                down_byte += len(chunk)
-                                save_chunk_to_file(chunk, chunk_dir, chunk_filename)
-                                await update_download_status(down_byte, media_size, message_id, ui_file_name,
-                                                             task_start_time,
-                                                             node, client)
-                                await asyncio.sleep(RETRY_TIME_OUT)
-                        except pyrogram.errors.exceptions.bad_request_400.BadRequest:
-                            logger.warning(
-                                f"[{show_chat_username}]{message_id}: {_t('file reference expired, refetching')}..."
-                            )
-                            await asyncio.sleep(RETRY_TIME_OUT)
-                            message = await fetch_message(client, message)
-                            if _check_timeout(retry, message_id):
-                                # pylint: disable = C0301
-                                logger.error(
-                                    f"[{show_chat_username}]{message_id}]: "
-                                    f"{_t('file reference expired for 3 retries, download skipped.')}"
-                                )
-                        except pyrogram.errors.exceptions.flood_420.FloodWait as wait_err:
-                            await asyncio.sleep(wait_err.value)
-                            logger.warning(f"[{show_chat_username}]: FlowWait ", message_id, wait_err.value)
-                            _check_timeout(retry, message_id)
-                        except Exception as e:
-                            logger.exception(f"{e}")
-                            pass
-
-            #判断一下是否下载完成
-            if chunk_dir and os.path.exists(chunk_dir):  #chunk_dir存在
-                if check_download_finish(media_size, chunk_dir, ui_file_name, chunk_count):  # 大小数量一致
-                    try:
-                        if merge_chunkfile(folder_path=chunk_dir, output_file=file_name, chunk_count=chunk_count,
-                                           file_size=media_size, method='shutil'):
-                            # await asyncio.sleep(RETRY_TIME_OUT)
-                            if _is_exist(file_name) and os.path.getsize(file_name) == media_size:
-                                shutil.rmtree(chunk_dir)
-
-                            media_dict['status'] = 1
-                            db.insert_into_db(media_dict)
-
-                            logger.success(f"完成下载{file_name}...剩余：{queue.qsize()}")
+                    down_byte = media_size - get_missing_size(chunks_to_down, media_size)
+
+                    async def _save_chunk(chunk_idx: int, chunk: bytes):
+                        nonlocal down_byte
+                        if not save_chunk(chunk_idx, chunk):
+                            raise ValueError(f"failed to save chunk {chunk_idx} of {message_id}")
+                        if sparse_writer and sparse_writer.needs_sync:
+                            # fsync不阻塞事件循环
+                            await asyncio.get_running_loop().run_in_executor(None, sparse_writer.sync)
+                        down_byte += len(chunk)
+                        await update_download_status(down_byte, media_size, message_id, ui_file_name,
+                                                     task_start_time,
+                                                     node, client)
+                        pacer.on_success()
+                        await pacer.wait()
 
-                            return DownloadStatus.SuccessDownload, file_name
+                    try:
+                        # 缺失的批次切分成多段并发下载
+                        await download_segments(client, message, chunks_to_down, _save_chunk,
+                                                app.max_download_segments_per_file)
+                    except pyrogram.errors.exceptions.bad_request_400.BadRequest:
+                        logger.warning(
+                            f"[{show_chat_username}]{message_id}: {_t('file reference expired, refetching')}..."
+                        )
+                        await asyncio.sleep(RETRY_TIME_OUT)
+                        message = await fetch_message(client, message)
+                        if _check_timeout(retry, message_id):
+                            # pylint: disable = C0301
+                            logger.error(
+                                f"[{show_chat_username}]{message_id}]: "
+                                f"{_t('file reference expired for 3 retries, download skipped.')}"
+                            )
+                    except pyrogram.errors.exceptions.flood_420.FloodWait as wait_err:
+                        pacer.on_flood_wait(wait_err.value)
+                        await pacer.wait()
+                        logger.warning(f"[{show_chat_username}]: FlowWait ", message_id, wait_err.value)
+                        _check_timeout(retry, message_id)
                     except Exception as e:
-                        logger.exception(f"Failed to merge files: {e}")
+                        pacer.on_error()
+                        logger.exception(f"{e}")
                         pass
+
+            # 判断一下是否下载完成 合并/移动/写库交给后台合并阶段 不阻塞事件循环
+            if sparse_writer:
+                if sparse_writer.is_complete():  # 所有分块都已写入 无需合并
+                    await _submit_finalize(client, message, node, file_name,
+                                           functools.partial(_finalize_sparse_download, media_dict,
+                                                             sparse_writer, file_name))
+                    sparse_writer = None  # 由合并阶段关闭
+                    return DownloadStatus.Downloading, file_name
+            elif chunk_dir and os.path.exists(chunk_dir):  #chunk_dir存在
+                # 校验要重读每个分块 放到线程里执行
+                if await asyncio.get_running_loop().run_in_executor(
+                        None, check_download_finish, media_size, chunk_dir, ui_file_name, chunk_count,
+                        chunk_manifest):  # 大小数量一致
+                    if chunk_manifest:
+                        chunk_manifest.close()
+                    await _submit_finalize(client, message, node, file_name,
+                                           functools.partial(_finalize_chunk_download, media_dict, chunk_dir,
+                                                             file_name, chunk_count, chunk_manifest))
+                    return DownloadStatus.Downloading, file_name
             else:
                 pass
         except pyrogram.errors.exceptions.bad_request_400.BadRequest:
@@ -732,7 +960,8 @@ async def download_media(
                     f"{_t('file reference expired for 3 retries, download skipped.')}"
                 )
         except pyrogram.errors.exceptions.flood_420.FloodWait as wait_err:
-            await asyncio.sleep(wait_err.value)
+            pacer.on_flood_wait(wait_err.value)
+            await pacer.wait()
             logger.warning(f"[{show_chat_username}]: FlowWait ", message_id, wait_err.value)
             _check_timeout(retry, message_id)
 
@@ -742,6 +971,7 @@ async def download_media(
                 f"{_t('Timeout Error occurred when downloading Message')}[{show_chat_username}]{message_id}, "
                 f"{_t('retrying after')} {RETRY_TIME_OUT} {_t('seconds')}"
             )
+            pacer.on_error()
             await asyncio.sleep(RETRY_TIME_OUT)
             if _check_timeout(retry, message_id):
                 logger.error(
@@ -755,6 +985,11 @@ async def download_media(
                 exc_info=True,
             )
             break
+        finally:
+            if sparse_writer:
+                sparse_writer.close()
+            if chunk_manifest:
+                chunk_manifest.close()
 
     return DownloadStatus.FailedDownload, None
 
@@ -791,100 +1026,187 @@ async def worker(client: pyrogram.client.Client):
             node: TaskNode = item[1]
 
             if node.is_stop_transmission:
+                # 整个任务的剩余队列一次丢弃
+                queue.purge(node)
                 continue
 
-            if node.client:
-                await download_task(node.client, message, node)
-            else:
-                await download_task(client, message, node)
+            metrics.WORKERS_BUSY.inc()
+            start_time = time.perf_counter()
+            try:
+                if node.client:
+                    await download_task(node.client, message, node)
+                else:
+                    await download_task(client, message, node)
+            finally:
+                metrics.WORKERS_BUSY.dec()
+                metrics.WORKER_BUSY_SECONDS.inc(time.perf_counter() - start_time)
         except Exception as e:
             logger.exception(f"{e}")
 
 
 
 
+def _get_real_chat_id(chat_id: Union[int, str]) -> Union[int, str]:
+    """Chat id as used by the API, positive ids in the config are channel ids"""
+    if str(chat_id).isdigit():
+        return 0 - chat_id - 1000000000000
+    return chat_id
+
+
+async def _fetch_retry_batch(client: pyrogram.Client, real_chat_id, chat_download_config: ChatDownloadConfig,
+                             node: TaskNode, message_ids: List[int]):
+    """取回一批重试消息 取到就分类入队"""
+    try:
+        # FloodWait时同类请求一起冷却后重试
+        messages = await rate_limiter.call(  # type: ignore
+            'history', client.get_messages, chat_id=real_chat_id, message_ids=message_ids
+        )
+    except pyrogram.errors.exceptions.flood_420.FloodWait as wait_err:
+        logger.warning(f"[{node.chat_id}]: FloodWait {wait_err.value}, retry next run")
+        return
+    except asyncio.TimeoutError:
+        logger.error(_t("Operation timed out"))
+        return
+    except ConnectionError:
+        logger.error(_t("Network connection error"))
+        return
+    except Exception as e:
+        logger.exception("{}", e)
+        return
+
+    if not messages:
+        return
+    try:
+        page = []
+        for message in messages:
+            if need_skip_message(message, chat_download_config, app):  # 不在下载范围内
+                node.download_status[message.id] = DownloadStatus.SkipDownload
+                msg = await async_db.getMsg(node.chat_id, message.id, 2)
+                msg.status = 5
+                await async_db.run(msg.save, name='save')
+                logger.info(f"[{node.chat_id}]{msg.filename}文件已被频道删除，跳过")
+            else:
+                page.append(message)
+
+        if page:
+            await add_download_tasks(page, node)
+            chat_download_config.need_check = True
+            chat_download_config.total_task = node.total_task
+            node.is_running = True
+    except Exception as e:
+        logger.exception(f"{e}")
+
+
+async def _iter_retry_batches(chat_download_config: ChatDownloadConfig, node: TaskNode):
+    """按批产出要重试的消息id 先是配置里记录的 再从数据库逐页读取下载中的"""
+    batch: List[int] = []
+    seen = set()
+    for it in chat_download_config.ids_to_retry:
+        it = int(it)
+        if it in seen:
+            continue
+        seen.add(it)
+        batch.append(it)
+        if len(batch) == RETRY_BATCH_SIZE:
+            yield batch
+            batch = []
+
+    for chat_id, chat_username in chat_download_config.retry_db_keys:
+        after_id = None
+        while True:
+            page = await async_db.get_retry_ids_page(chat_id, chat_username, after_id, RETRY_DB_PAGE_SIZE)
+            if not page:
+                break
+            after_id = page[-1]
+            for it in page:
+                # 本次运行已入队的消息(包括扫描新加的下载中记录)不再重复重试
+                if it in seen or it in node.download_status:
+                    continue
+                batch.append(it)
+                if len(batch) == RETRY_BATCH_SIZE:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
+
+
+async def _download_retry_messages(client: pyrogram.Client, real_chat_id, chat_download_config: ChatDownloadConfig,
+                                   node: TaskNode):
+    """重试上次未完成的消息
+
+    一个任务逐页读取重试id 凑成批次放入小队列 RETRY_FETCH_CONCURRENCY 个请求同时从队列取批次 取回即入下载队列
+    下载队列满时请求暂停 读库也随之暂停 内存中最多只有几批id
+    """
+    batches: asyncio.Queue = asyncio.Queue(RETRY_FETCH_CONCURRENCY)
+
+    async def _producer():
+        try:
+            async for message_ids in _iter_retry_batches(chat_download_config, node):
+                await batches.put(message_ids)
+        except Exception as e:
+            logger.exception(f"{e}")
+        for _ in range(RETRY_FETCH_CONCURRENCY):
+            await batches.put(None)
+
+    async def _fetcher():
+        while True:
+            message_ids = await batches.get()
+            if message_ids is None:
+                return
+            await _fetch_retry_batch(client, real_chat_id, chat_download_config, node, message_ids)
+
+    producer = app.loop.create_task(_producer())
+    fetch_tasks = [app.loop.create_task(_fetcher()) for _ in range(RETRY_FETCH_CONCURRENCY)]
+    try:
+        await asyncio.gather(producer, *fetch_tasks)
+    finally:
+        producer.cancel()
+        for task in fetch_tasks:
+            task.cancel()
+
+
 async def download_chat_task(client: pyrogram.Client,chat_download_config: ChatDownloadConfig,node: TaskNode,):
 
-    if str(node.chat_id).isdigit():
-        real_chat_id = 0 - node.chat_id - 1000000000000
-    else:
-        real_chat_id = node.chat_id
+    real_chat_id = _get_real_chat_id(node.chat_id)
 
     logger.info(f"开始读取Chat:[{real_chat_id}]...")
 
     chat_download_config.node = node
 
-    if chat_download_config.ids_to_retry:
-        retry_ids = list(chat_download_config.ids_to_retry)
+    if chat_download_config.ids_to_retry or chat_download_config.retry_db_keys:
         logger.info(f"[{node.chat_id}]{_t('Downloading files failed during last run')}...")
-        downloading_messages = Optional[AsyncGenerator["types.Message", None]]
-        batch_size = 200
-        for i in range(0, len(retry_ids), batch_size):
-            batch_files = retry_ids[i:i + batch_size]
-            try:
-                downloading_messages = await client.get_messages(  # type: ignore
-                    chat_id=real_chat_id, message_ids=batch_files
-                )
-            except pyrogram.errors.exceptions.flood_420.FloodWait as wait_err:
-                await asyncio.sleep(wait_err.value)
-            except asyncio.TimeoutError:
-                logger.error(_t("Operation timed out"))
-            except ConnectionError:
-                logger.error(_t("Network connection error"))
-            except Exception as e:
-                logger.exception("{}", e)
-
-            if downloading_messages and len(downloading_messages) > 0:
-                try:
-                    for message in downloading_messages:
-                        if need_skip_message(message, chat_download_config, app):  # 不在下载范围内
-                            node.download_status[message.id] = DownloadStatus.SkipDownload
-                            msg = db.getMsg(node.chat_id, message.id, 2)
-                            msg.status = 5
-                            msg.save()
-                            logger.info(f"[{node.chat_id}]{msg.filename}文件已被频道删除，跳过")
-                            continue
-                        else:
-                            await add_download_task(message, node)
-                            chat_download_config.need_check = True
-                            chat_download_config.total_task = node.total_task
-                            node.is_running = True
-
-                    await asyncio.sleep(RETRY_TIME_OUT)
-                except pyrogram.errors.exceptions.flood_420.FloodWait as wait_err:
-                    await asyncio.sleep(wait_err.value)
-                except Exception as e:
-                    logger.exception(f"{e}")
-
-            await asyncio.sleep(RETRY_TIME_OUT)
-
+        await _download_retry_messages(client, real_chat_id, chat_download_config, node)
 
     """Download all task"""
 
     try:
-        messages_iter = get_chat_history_v2(
-            client,
-            real_chat_id,
-            limit=node.limit,
-            max_id=node.end_offset_id,
-            offset_id=chat_download_config.last_read_message_id,
-            reverse=True,
-        )
-
-        async for message in messages_iter:  # type: ignore
-
-            if need_skip_message(message, chat_download_config, app):  # 不在下载范围内
-                node.download_status[message.id] = DownloadStatus.SkipDownload
-                continue
-            else:
-                await add_download_task(message, node)
+        segments = await _get_scan_segments(client, real_chat_id, chat_download_config, node)
+        if segments:
+            logger.info(f"[{real_chat_id}]分{len(segments)}段并行读取: {segments[0][0]}-{segments[-1][1]}")
+            node.scan_watermark = ScanWatermark(segments)
+            scan_tasks = [
+                app.loop.create_task(
+                    _scan_chat_history(client, real_chat_id, chat_download_config, node, low, high, idx))
+                for idx, (low, high) in enumerate(segments)
+            ]
+            try:
+                await asyncio.gather(*scan_tasks)
+            finally:
+                for task in scan_tasks:
+                    task.cancel()
+        else:
+            # 顺序扫描也是一段 检查点只记录已分类入队的前缀
+            low = chat_download_config.last_read_message_id + 1
+            node.scan_watermark = ScanWatermark([(low, max(low, node.end_offset_id or 0))])
+            await _scan_chat_history(client, real_chat_id, chat_download_config, node,
+                                     chat_download_config.last_read_message_id, node.end_offset_id)
 
         chat_download_config.need_check = True
         chat_download_config.total_task = node.total_task
         node.is_running = True
 
     except pyrogram.errors.exceptions.flood_420.FloodWait as wait_err:
-        await asyncio.sleep(wait_err.value)
+        rate_limiter.on_flood_wait('history', wait_err.value)
     except asyncio.TimeoutError:
         logger.error(_t("Operation timed out"))
     except ConnectionError:
@@ -894,35 +1216,129 @@ async def download_chat_task(client: pyrogram.Client,chat_download_config: ChatD
             logger.exception("{e}")
 
 
-    app.update_config()
+    app.checkpoint()
     logger.info(f"读取Chat:[{real_chat_id}]完毕, 处理数量{node.total_task}")
 
 
-async def download_all_chat(client: pyrogram.Client, chat_download_items ):
-    """Download All chat"""
+async def _get_scan_segments(client: pyrogram.Client, chat_id: Union[int, str],
+                             chat_download_config: ChatDownloadConfig,
+                             node: TaskNode) -> List[Tuple[int, int]]:
+    """Id segments to scan in parallel, empty for one sequential scan"""
+    if app.scan_segments <= 1 or node.limit:  # 有数量限制时必须按顺序读取
+        return []
+
+    low = max(chat_download_config.last_read_message_id, 1)
+    high = await get_latest_message_id(client, chat_id)
+    if node.end_offset_id:
+        high = min(high, node.end_offset_id)
+    if high - low + 1 < app.scan_segments * SCAN_SEGMENT_MIN:
+        return []
 
-    for key, value in chat_download_items:
+    return split_segments(low, high, app.scan_segments)
+
+
+async def _scan_chat_history(client: pyrogram.Client, chat_id: Union[int, str],
+                             chat_download_config: ChatDownloadConfig, node: TaskNode,
+                             offset_id: int, max_id: int, segment: Optional[int] = None):
+    """Read the history from offset_id up to max_id and queue it page by page"""
+    messages_iter = get_chat_history_v2(
+        client,
+        chat_id,
+        limit=node.limit if segment is None else 0,
+        max_id=max_id,
+        offset_id=offset_id,
+        reverse=True,
+        prefetch_depth=app.history_prefetch_depth,
+    )
+
+    page = []
+    last_id = 0
+    # 缓冲在page里的消息还没有下载状态 水位只在整页入队后推进
+    watermark_segment = 0 if segment is None else segment
+    try:
+        async for message in messages_iter:  # type: ignore
+            last_id = message.id
+
+            if need_skip_message(message, chat_download_config, app):  # 不在下载范围内
+                node.download_status[message.id] = DownloadStatus.SkipDownload
+                continue
+            else:
+                page.append(message)
+
+            if len(page) >= HISTORY_PAGE_SIZE:  # 按页批量查库入队
+                await add_download_tasks(page, node)
+                page = []
+                if node.scan_watermark:
+                    node.scan_watermark.advance(watermark_segment, last_id)
+    finally:
+        if page:  # 读取中断时已读到的消息照样入队
+            await add_download_tasks(page, node)
+        if node.scan_watermark and last_id:
+            node.scan_watermark.advance(watermark_segment, last_id)
+
+    if segment is not None:
+        node.scan_watermark.finish(segment)
+
+
+async def download_all_chat(client: pyrogram.Client, chat_download_items=None, concurrency: int = 1):
+    """Download All chat, `concurrency` chats are scanned at the same time"""
+
+    async def _scan_chat(key, value: ChatDownloadConfig):
         value.node = TaskNode(chat_id=key)
         try:
             await download_chat_task(client, value, value.node)
-        except Exception as e:
-            logger.warning(f"Download {key} error: {e}")
         finally:
             value.need_check = True
+            task_progress_changed.notify()
 
+    async def _estimate_new_messages(key, value: ChatDownloadConfig) -> int:
+        latest_id = await get_latest_message_id(client, _get_real_chat_id(key))
+        return max(0, latest_id - value.last_read_message_id)
 
-async def run_until_all_task_finish():
-    """Normal download"""
-    while True:
-        finish: bool = True
-        for _, value in app.chat_download_config.items():
-            if not value.need_check or value.total_task != value.finish_task:
-                finish = False
+    if chat_download_items is None:
+        chat_download_items = app.chat_download_config.items()
 
-        if (not app.bot_token and finish) or app.restart_program:
-            break
+    scheduler = ChatScanScheduler(_scan_chat, concurrency,
+                                  _estimate_new_messages if app.scan_order == 'backlog' else None)
+    set_chat_scan_scheduler(scheduler)
+    await scheduler.run(list(chat_download_items))
+
+
+async def optimize_db_task():
+    """Let SQLite refresh its query statistics every DB_OPTIMIZE_INTERVAL"""
+    while app.is_running:
+        await asyncio.sleep(DB_OPTIMIZE_INTERVAL)
+        try:
+            await async_db.optimize_db()
+        except Exception as e:
+            logger.warning(f"optimize database failed: {e}")
+
+
+async def checkpoint_task():
+    """Append the scan progress to the checkpoint journal every checkpoint_interval"""
+    while app.is_running:
+        await asyncio.sleep(app.checkpoint_interval)
+        app.checkpoint()
+
+
+def _is_all_task_finish() -> bool:
+    """If every configured chat is scanned and downloaded"""
+    if app.restart_program:
+        return True
+    if app.bot_token:  # 机器人模式一直运行
+        return False
+    for _, value in app.chat_download_config.items():
+        if not value.need_check or value.total_task != value.finish_task:
+            return False
+    return True
 
-        await asyncio.sleep(1)
+
+async def run_until_all_task_finish():
+    """Normal download"""
+    # 扫描结束和每个下载完成时才重新检查
+    await task_progress_changed.wait_for(_is_all_task_finish)
+    # 下载完的文件还要合并、入库、上传
+    await finalize_stage.join()
 
 
 def _exec_loop():
@@ -960,28 +1376,38 @@ def main():
         app.pre_run()
         init_web(app)
 
+        logger.info(f"database schema version {db.migrate_db()}")
+
+        if app.enable_dedup_index:
+            start = time.time()
+            count = db.load_dedup_index()
+            logger.info(f"loaded {count} records into dedup index in {time.time() - start:.2f}s")
+
+        db.start_writer(app.db_write_batch_size, app.db_flush_interval)
+
         set_max_concurrent_transmissions(client, app.max_concurrent_transmissions)
+        set_max_download_segments(app.max_download_segments)
+        finalize_stage.start(app.loop, app.max_finalize_task)
+        queue.order = app.download_order
+        metrics.QUEUE_DEPTH.set_function(queue.qsize)
+        metrics.WORKERS.set(app.max_download_task)
 
         app.loop.run_until_complete(start_server(client))
         logger.success(_t("Successfully started (Press Ctrl+C to stop)"))
 
-        # 假设 self.app.chat_download_config.items() 返回一个列表
-        items = list(app.chat_download_config.items())
-
-        # 计算每份的大小
-        n = len(items)
-        chunk_size = len(items) // app.max_download_task
-        chunks = [items[i:i + chunk_size] for i in range(0, n, chunk_size)]
-
-        # 分段循环处理
-        for chunk in chunks:
-            task = app.loop.create_task(download_all_chat(client, chunk))
-            tasks.append(task)
+        # 所有聊天共用一个待扫描队列 空闲的扫描任务取下一个
+        tasks.append(app.loop.create_task(
+            download_all_chat(client, list(app.chat_download_config.items()),
+                              app.max_scan_task or app.max_download_task)))
 
         for _ in range(app.max_download_task):
             task = app.loop.create_task(worker(client))
             tasks.append(task)
 
+        tasks.append(app.loop.create_task(optimize_db_task()))
+        if app.checkpoint_interval > 0:
+            tasks.append(app.loop.create_task(checkpoint_task()))
+
         if app.bot_token:
             app.loop.run_until_complete(
                 start_download_bot(app, client, add_download_task, download_chat_task)
@@ -999,9 +1425,16 @@ def main():
         app.is_running = False
         if app.bot_token:
             app.loop.run_until_complete(stop_download_bot())
-        app.loop.run_until_complete(stop_server(client))
         for task in tasks:
             task.cancel()
+        # 已下载完的文件合并、入库、上传完再退出 上传还要用到client
+        app.loop.run_until_complete(finalize_stage.join())
+        app.loop.run_until_complete(stop_server(client))
+        app.loop.run_until_complete(stop_web())
+        finalize_stage.shutdown()
+        async_db.shutdown()
+        db.stop_writer()
+        db.optimize_db()
         logger.info(_t("Stopped!"))
         logger.info(f"{_t('update config')}......")
         app.update_config()
@@ -3,26 +3,30 @@
 import asyncio
 import os
 import random
-import shutil
 import time
 from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
-from typing import Callable, List, Optional, Union
+from typing import Callable, Dict, List, Optional, Union
 
 from loguru import logger
 from ruamel import yaml
 from ruamel.yaml.comments import CommentedSeq
+
+from module import metrics, sqlmodel
 from module.cloud_drive import CloudDrive, CloudDriveConfig
 from module.filter import Filter
-from utils.format_addon import add_commented_map_to_seq
 from module.language import Language, set_language
+from module.message_status import MessageStatusStore
+from module.rate_limiter import RATE_CLASSES, get_rate_limiter
+from module.scan_watermark import ScanWatermark
+from module.task_events import download_state_changed, task_progress_changed
+from utils.checkpoint_journal import CheckpointJournal, atomic_write
 from utils.format import replace_date_time, validate_title
+from utils.format_addon import add_commented_map_to_seq, set_waste_word_file
 from utils.meta_data import MetaData
 
-from module import sqlmodel
-
 _yaml = yaml.YAML()
 # pylint: disable = R0902
 
@@ -172,8 +176,12 @@ class TaskNode:
         self.client = None
         self.upload_success_count: int = 0
         self.is_stop_transmission = False
+        # 分段并行扫描时已连续扫描到的位置
+        self.scan_watermark: Optional[ScanWatermark] = None
         self.media_group_ids: dict = {}
-        self.download_status: dict = {}
+        self.download_status = MessageStatusStore(
+            DownloadStatus, (DownloadStatus.SuccessDownload, DownloadStatus.SkipDownload)
+        )
         self.upload_status: dict = {}
         self.upload_stat_dict: dict = {}
         self.topic_id = topic_id
@@ -201,6 +209,12 @@ class TaskNode:
     def stop_transmission(self):
         """Stop task"""
         self.is_stop_transmission = True
+        download_state_changed.notify()
+        task_progress_changed.notify()
+
+    async def wait_finish(self):
+        """Wait until the task is finished or stopped"""
+        await task_progress_changed.wait_for(self.is_finish)
 
     def stat(self, status: DownloadStatus):
         """
@@ -219,6 +233,7 @@ class TaskNode:
             self.skip_download_task += 1
         else:
             self.failed_download_task += 1
+        task_progress_changed.notify()
 
     def stat_forward(self, status: ForwardStatus, count: int = 1):
         """Stat upload"""
@@ -267,34 +282,31 @@ class LimitCall:
         Returns:
             None
         """
+        # 转发限速交给共享限速器的forward令牌桶 FloodWait时所有转发一起冷却
+        self.bucket = get_rate_limiter().bucket("forward")
         self.max_limit_call_times = max_limit_call_times
         self.limit_call_times = limit_call_times
         self.last_call_time = last_call_time
 
+    @property
+    def max_limit_call_times(self) -> int:
+        """Calls allowed per minute"""
+        return self._max_limit_call_times
+
+    @max_limit_call_times.setter
+    def max_limit_call_times(self, value: int):
+        self._max_limit_call_times = value
+        self.bucket.configure(value / 60 if value > 0 else 0, max(1, value))
+
     async def wait(self, node: TaskNode):
         """
         Wait for a certain period of time before continuing execution.
 
-        This function does not take any parameters.
-
-        This function does not return anything.
+        Returns right away once the node is stopped.
         """
-        while True:
-            now = time.time()
-            time_span = now - self.last_call_time
-            if node.is_stop_transmission:
-                break
-
-            if time_span > 60:
-                self.limit_call_times = 0
-                self.last_call_time = now
-
-            if self.limit_call_times + 1 <= self.max_limit_call_times:
-                self.limit_call_times += 1
-                break
-
-            # logger.debug("Waiting for 10 seconds...")
-            await asyncio.sleep(1)
+        if await self.bucket.acquire(lambda: node.is_stop_transmission):
+            self.limit_call_times += 1
+            self.last_call_time = time.time()
 
 
 class ChatDownloadConfig:
@@ -306,6 +318,8 @@ class ChatDownloadConfig:
         # need storage
         self.download_filter: str = None
         self.ids_to_retry: list = []
+        # 数据库中下载中消息的 (chat_id, chat_username) 重试时逐页读取
+        self.retry_db_keys: list = []
         self.last_read_message_id = 0
         self.total_task: int = 0
         self.finish_task: int = 0
@@ -403,6 +417,23 @@ class Application:
         self.web_host: str = "0.0.0.0"
         self.web_port: int = 5000
         self.max_download_task: int = 5
+        self.max_download_segments_per_file: int = 4
+        self.max_download_segments: int = 0
+        self.download_chunk_mode: str = "chunk"
+        self.chunk_checksum: bool = False
+        self.max_finalize_task: int = 2
+        self.merge_method: str = "auto"
+        self.enable_dedup_index: bool = True
+        self.waste_word_file: str = "waste_words.json"
+        self.db_write_batch_size: int = 200
+        self.db_flush_interval: float = 1.0
+        self.download_order: str = "fifo"
+        self.history_prefetch_depth: int = 4
+        self.scan_segments: int = 1
+        self.max_scan_task: int = 0
+        self.scan_order: str = "config"
+        self.checkpoint_interval: float = 5
+        self.checkpoint_journal: Optional[CheckpointJournal] = None
         self.language = Language.EN
         self.after_upload_telegram_delete: bool = True
         self.web_login_secret: str = ""
@@ -515,6 +546,83 @@ class Application:
             "max_concurrent_transmissions", self.max_concurrent_transmissions
         )
 
+        self.max_download_segments_per_file = get_config(
+            _config,
+            "max_download_segments_per_file",
+            self.max_download_segments_per_file,
+            int,
+        )
+
+        self.max_download_segments = get_config(
+            _config,
+            "max_download_segments",
+            self.max_concurrent_transmissions,
+            int,
+        )
+
+        self.download_chunk_mode = get_config(
+            _config, "download_chunk_mode", self.download_chunk_mode, str
+        )
+        if self.download_chunk_mode not in ["chunk", "sparse"]:
+            logger.warning(
+                f"download_chunk_mode {self.download_chunk_mode} is not supported"
+            )
+            self.download_chunk_mode = "chunk"
+
+        self.chunk_checksum = get_config(
+            _config, "chunk_checksum", self.chunk_checksum, bool
+        )
+        self.max_finalize_task = get_config(
+            _config, "max_finalize_task", self.max_finalize_task, int
+        )
+        self.merge_method = get_config(
+            _config, "merge_method", self.merge_method, str
+        )
+        if self.merge_method not in ["auto", "cat", "write", "shutil"]:
+            logger.warning(
+                f"unknown merge_method {self.merge_method}, use auto instead"
+            )
+            self.merge_method = "auto"
+
+        self.enable_dedup_index = get_config(
+            _config, "enable_dedup_index", self.enable_dedup_index, bool
+        )
+        self.waste_word_file = get_config(
+            _config, "waste_word_file", self.waste_word_file, str
+        )
+        set_waste_word_file(self.waste_word_file)
+
+        self.db_write_batch_size = get_config(
+            _config, "db_write_batch_size", self.db_write_batch_size, int
+        )
+        self.db_flush_interval = get_config(
+            _config, "db_flush_interval", self.db_flush_interval, float
+        )
+        self.download_order = get_config(
+            _config, "download_order", self.download_order, str
+        )
+        if self.download_order not in ["fifo", "smallest", "remaining"]:
+            logger.warning(
+                f"unknown download_order {self.download_order}, use fifo instead"
+            )
+            self.download_order = "fifo"
+        self.history_prefetch_depth = get_config(
+            _config, "history_prefetch_depth", self.history_prefetch_depth, int
+        )
+        self.scan_segments = get_config(
+            _config, "scan_segments", self.scan_segments, int
+        )
+        self.max_scan_task = get_config(
+            _config, "max_scan_task", self.max_scan_task, int
+        )
+        self.scan_order = get_config(_config, "scan_order", self.scan_order, str)
+        if self.scan_order not in ["config", "backlog"]:
+            logger.warning(f"unknown scan_order {self.scan_order}, use config instead")
+            self.scan_order = "config"
+        self.checkpoint_interval = get_config(
+            _config, "checkpoint_interval", self.checkpoint_interval, float
+        )
+
         language = _config.get("language", "EN")
 
         try:
@@ -565,6 +673,20 @@ class Application:
             logger.warning(f"config date format error: {e}")
             self.date_format = "%Y_%m"
 
+        rate_limit = _config.get("rate_limit", None)
+        if isinstance(rate_limit, dict):
+            for name, calls_per_minute in rate_limit.items():
+                if name not in RATE_CLASSES or name == "forward":
+                    logger.warning(f"unknown rate_limit class {name}")
+                    continue
+                try:
+                    calls_per_minute = int(calls_per_minute)
+                except (TypeError, ValueError):
+                    continue
+                get_rate_limiter().bucket(name).configure(
+                    calls_per_minute / 60, max(1, calls_per_minute // 6)
+                )
+
         forward_limit = _config.get("forward_limit", None)
         if forward_limit:
             try:
@@ -680,6 +802,7 @@ class Application:
             return False
 
         ret: bool = False
+        start_time = time.time()
         if self.cloud_drive_config.upload_adapter == "rclone":
             ret = await CloudDrive.rclone_upload_file(
                 self.cloud_drive_config,
@@ -696,6 +819,11 @@ class Application:
                 ),
             )
 
+        metrics.UPLOAD_FILE_SECONDS.observe(
+            time.time() - start_time,
+            target=self.cloud_drive_config.upload_adapter,
+            result="success" if ret else "failed",
+        )
         return ret
 
     def get_file_save_path(
@@ -808,38 +936,33 @@ class Application:
         return True
 
     # pylint: disable = R0912
-    def update_config(self, immediate: bool = True):
-        """update config
-
-        Parameters
-        ----------
-        immediate: bool
-            If update config immediate,default True
-        """
+    def _collect_progress(self) -> Dict[Union[int, str], dict]:
+        """Fold the message status of every chat into the config, returns the progress per chat"""
         # TODO: fix this not exist chat
         if not self.app_data.get("chat") and self.config.get("chat"):
             self.app_data["chat"] = [
                 {"chat_id": i} for i in range(0, len(self.config["chat"]))
             ]
+        progress: Dict[Union[int, str], dict] = {}
         idx = 0
         # pylint: disable = R1733
         for key, value in self.chat_download_config.items():
             # pylint: disable = W0201
-            unfinished_ids = set(value.ids_to_retry)
-            max_try = 0
-
-            for _idx, _value in value.node.download_status.items():
-                if _idx > max_try:
-                    max_try = _idx  # 记录最后一个下载id
-                if  DownloadStatus.SuccessDownload == _value or DownloadStatus.SkipDownload == _value: #成功或需要跳过的从老retry列表删除
-                    if _idx in unfinished_ids:
-                        unfinished_ids.remove(_idx)
-
-                elif DownloadStatus.Downloading == _value or DownloadStatus.FailedDownload == _value:  # 正在下载或下载失败的添加到retry列表
-                    unfinished_ids.add(_idx)
+            download_status = value.node.download_status
+            # 记录最后一个下载id
+            max_try = download_status.max_id
+            # 成功或需要跳过的从老retry列表删除 正在下载或下载失败的添加到retry列表
+            unfinished_ids = {
+                _idx for _idx in value.ids_to_retry if not download_status.is_finished(_idx)
+            }
+            unfinished_ids |= download_status.unfinished_ids()
 
             self.chat_download_config[key].ids_to_retry = list(unfinished_ids)
 
+            # 分段扫描时只记录连续扫描完的部分 中断的分段下次从头扫描
+            if value.node.scan_watermark:
+                max_try = min(max_try, value.node.scan_watermark.value)
+
 
 
             if idx >= len(self.app_data.get("chat")):
@@ -847,8 +970,13 @@ class Application:
 
             try:
                 self.config["chat"][idx]["last_read_message_id"] = max(self.config["chat"][idx]["last_read_message_id"],max_try)
+                max_try = self.config["chat"][idx]["last_read_message_id"]
             except:
                 pass
+            progress[key] = {
+                "last_read_message_id": max_try,
+                "ids_to_retry": sorted(value.ids_to_retry),
+            }
 
             self.app_data["chat"][idx]["chat_id"] = key
             self.app_data["chat"][idx]["ids_to_retry"] = value.ids_to_retry
@@ -874,22 +1002,44 @@ class Application:
         #    self.already_download_ids_set.add(it)
 
         # self.app_data["already_download_ids"] = list(self.already_download_ids_set)
+        return progress
+
+    def checkpoint(self):
+        """Append the changed progress of every chat to the checkpoint journal"""
+        progress = self._collect_progress()
+        if not self.checkpoint_journal:
+            return
+        try:
+            for key, value in progress.items():
+                self.checkpoint_journal.append(key, **value)
+            if self.checkpoint_journal.needs_compact:
+                self.checkpoint_journal.compact(progress)
+        except Exception as e:
+            logger.warning(f"checkpoint journal save error: {e}")
+
+    def update_config(self, immediate: bool = True):
+        """update config
+
+        Parameters
+        ----------
+        immediate: bool
+            If update config immediate,default True
+        """
+        progress = self._collect_progress()
 
         if immediate:
-            bak_config_file = f"{self.config_file}.bak"
-            shutil.copyfile(self.config_file, bak_config_file)
+            # 先写临时文件再改名 写到一半出问题不会清空配置文件
             try:
-                with open(self.config_file, "w", encoding="utf-8") as yaml_file:
-                    _yaml.dump(self.config, yaml_file)
+                atomic_write(self.config_file, lambda f: _yaml.dump(self.config, f))
             except Exception as e:
                 logger.warning(f"config file save error: {e}")
-                # 如果写入失败，将 a.bak 复制回 a
-                shutil.copyfile(bak_config_file, self.config_file)
-                logger.warning(f"config.bak file is recovered")
-
-            # 写到一半出问题会清空配置文件 更改为先写入临时文件 没问题再改名
-
-
+                return
+            # 配置文件已包含全部进度 日志只需保留快照
+            if self.checkpoint_journal:
+                try:
+                    self.checkpoint_journal.compact(progress)
+                except Exception as e:
+                    logger.warning(f"checkpoint journal save error: {e}")
 
     def set_language(self, language: Language):
         """Set Language"""
@@ -927,14 +1077,37 @@ class Application:
                                     'download_filter': self.chat_download_config[chat_id_aka].download_filter}
                         add_commented_map_to_seq(self.config['chat'], map_data)
 
-                    self.chat_download_config[chat_id_aka].ids_to_retry = chat.get('ids_to_retry', [])
-                    for it_str in self.chat_download_config[chat_id_aka].ids_to_retry:
-                        it = int(it_str)
-                        self.chat_download_config[chat_id_aka].ids_to_retry_dict[
-                            it
-                        ] = True
+                    self.chat_download_config[chat_id_aka].retry_db_keys.append(
+                        (chat.get('chat_id'), chat.get('chat_username')))
 
-        return
+        self.load_checkpoint_journal()
+
+    def load_checkpoint_journal(self):
+        """Merge the progress saved in the checkpoint journal since the last config save"""
+        self.checkpoint_journal = CheckpointJournal(
+            os.path.join(os.path.abspath("."), f"{self.config_file}.journal")
+        )
+        try:
+            journal = self.checkpoint_journal.load()
+        except Exception as e:
+            logger.warning(f"checkpoint journal load error: {e}")
+            return
+        for key, value in journal.items():
+            download_config = self.chat_download_config.get(key)
+            if not download_config:
+                continue
+            last_read_message_id = value.get("last_read_message_id", 0)
+            if last_read_message_id > download_config.last_read_message_id:
+                download_config.last_read_message_id = last_read_message_id
+                for item in self.config.get("chat", []):
+                    if item.get("chat_id") == key:
+                        item["last_read_message_id"] = last_read_message_id
+            # 日志在每次保存配置后都会压缩 总比配置文件新 完成的id已不在其中
+            if "ids_to_retry" in value:
+                download_config.ids_to_retry = list(value["ids_to_retry"])
+                download_config.ids_to_retry_dict = {
+                    it: True for it in download_config.ids_to_retry
+                }
 
     def pre_run(self):
         """before run application do"""
@@ -1031,3 +1204,4 @@ class Application:
         self.chat_download_config[node.chat_id].last_read_message_id = max(
             self.chat_download_config[node.chat_id].last_read_message_id, message_id
         )
+        task_progress_changed.notify()
@@ -0,0 +1,125 @@
+"""Run the blocking database API off the event loop"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from loguru import logger
+
+from module import metrics
+
+
+class QueryStat:
+    """Latency of one database method"""
+
+    __slots__ = ("calls", "errors", "wait", "seconds", "max_seconds")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.wait = 0.0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def to_dict(self) -> dict:
+        """Stat with the average time in milliseconds"""
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "avg_wait_ms": round(self.wait * 1000 / self.calls, 3) if self.calls else 0,
+            "avg_ms": round(self.seconds * 1000 / self.calls, 3) if self.calls else 0,
+            "max_ms": round(self.max_seconds * 1000, 3),
+        }
+
+
+_query_stats: Dict[str, QueryStat] = {}
+_query_stats_lock = threading.Lock()
+
+
+def get_db_stats() -> Dict[str, dict]:
+    """Latency of every database method called through an ``AsyncDB``"""
+    with _query_stats_lock:
+        return {name: stat.to_dict() for name, stat in _query_stats.items()}
+
+
+def _record_stat(name: str, wait: float, seconds: float, error: bool):
+    with _query_stats_lock:
+        stat = _query_stats.get(name)
+        if stat is None:
+            stat = _query_stats[name] = QueryStat()
+        stat.calls += 1
+        stat.wait += wait
+        stat.seconds += seconds
+        stat.max_seconds = max(stat.max_seconds, seconds)
+        if error:
+            stat.errors += 1
+    metrics.DB_QUERY_SECONDS.observe(seconds, method=name)
+
+
+class AsyncDB:
+    """Awaitable mirror of a blocking database object.
+
+    ``await AsyncDB(db).getStatus(chat_id, message_id)`` runs
+    ``db.getStatus(chat_id, message_id)`` on the database thread, so a slow
+    query or a WAL checkpoint only delays the coroutine waiting for it. One
+    worker keeps the calls in submission order and SQLite allows one writer
+    anyway. The time spent queued and running is recorded per method, calls
+    slower than ``slow_query`` seconds are logged.
+    """
+
+    def __init__(self, db: Any, max_workers: int = 1, slow_query: float = 1.0):
+        self.db = db
+        self.max_workers = max(1, max_workers)
+        self.slow_query = slow_query
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="db"
+            )
+        return self._executor
+
+    def _timed(self, name: str, func: Callable, args, kwargs) -> Callable[[], Any]:
+        submitted = time.perf_counter()
+
+        def _call():
+            start = time.perf_counter()
+            error = True
+            try:
+                result = func(*args, **kwargs)
+                error = False
+                return result
+            finally:
+                seconds = time.perf_counter() - start
+                _record_stat(name, start - submitted, seconds, error)
+                if seconds >= self.slow_query:
+                    logger.warning(f"slow database call {name} took {seconds:.3f}s")
+
+        return _call
+
+    async def run(self, func: Callable, *args, name: str = None, **kwargs) -> Any:
+        """Run ``func(*args, **kwargs)`` on the database thread"""
+        call = self._timed(name or func.__name__, func, args, kwargs)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._get_executor(), call
+        )
+
+    def __getattr__(self, name: str) -> Callable:
+        method = getattr(self.db, name)
+        if not callable(method):
+            return method
+
+        async def _method(*args, **kwargs):
+            return await self.run(method, *args, name=name, **kwargs)
+
+        _method.__name__ = name
+        return _method
+
+    def shutdown(self):
+        """Wait for the queued calls and stop the database thread"""
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
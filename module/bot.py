@@ -36,6 +36,7 @@ from module.pyrogram_extension import (
     set_meta_data,
     upload_telegram_chat_message,
 )
+from module.task_events import task_progress_changed
 from utils.format import replace_date_time, validate_title
 from utils.meta_data import MetaData
 
@@ -77,6 +78,7 @@ class DownloadBot:
     def add_task_node(self, node: TaskNode):
         """Add task node"""
         self.task_node[node.task_id] = node
+        task_progress_changed.notify()
 
     def remove_task_node(self, task_id: int):
         """Remove task node"""
@@ -98,6 +100,10 @@ class DownloadBot:
     async def update_reply_message(self):
         """Update reply message"""
         while self.is_running:
+            # 没有任务时挂起 直到添加了新任务
+            await task_progress_changed.wait_for(
+                lambda: bool(self.task_node) or not self.is_running
+            )
             for key, value in self.task_node.copy().items():
                 if value.is_running:
                     await report_bot_status(self.bot, value)
@@ -0,0 +1,157 @@
+"""Scan the configured chats with a bounded number of concurrent scans"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from module.app import ChatDownloadConfig
+
+ScanFunc = Callable[[Hashable, ChatDownloadConfig], Awaitable[None]]
+EstimateFunc = Callable[[Hashable, ChatDownloadConfig], Awaitable[int]]
+
+
+class ChatScan:
+    """State of the scan of one chat"""
+
+    __slots__ = ("key", "config", "backlog", "state", "start_time", "end_time", "error")
+
+    def __init__(self, key: Hashable, config: ChatDownloadConfig):
+        self.key = key
+        self.config = config
+        self.backlog: Optional[int] = None
+        self.state = "pending"
+        self.start_time = 0.0
+        self.end_time = 0.0
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        """Progress of the scan"""
+        node = self.config.node
+        end_time = self.end_time or (time.time() if self.start_time else 0)
+        return {
+            "chat_id": self.key,
+            "state": self.state,
+            "backlog": self.backlog,
+            "last_read_message_id": self.config.last_read_message_id,
+            "watermark": node.scan_watermark.value
+            if node and node.scan_watermark
+            else None,
+            "queued": node.total_task if node else 0,
+            "seconds": round(end_time - self.start_time, 1) if self.start_time else 0,
+            "error": self.error,
+        }
+
+
+class ChatScanScheduler:
+    """Shared queue of chats served by ``concurrency`` scanners.
+
+    Instead of fixed slices of the chat list, every scanner takes the next
+    chat as soon as its current one is done, so one slow channel only holds
+    up one scanner. With an ``estimate`` callback the chats are ordered by
+    their estimated number of new messages, the largest backlog first.
+    Estimates are taken ``concurrency`` at a time before scanning starts,
+    a chat whose estimate fails keeps its configured position.
+    """
+
+    def __init__(
+        self,
+        scan: ScanFunc,
+        concurrency: int = 1,
+        estimate: Optional[EstimateFunc] = None,
+    ):
+        self.scan = scan
+        self.concurrency = max(1, concurrency)
+        self.estimate = estimate
+        self.scans: List[ChatScan] = []
+        self._heap: List[Tuple[int, int, ChatScan]] = []
+
+    async def _estimate(self, estimate: EstimateFunc, scans: List[ChatScan]):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def _one(scan: ChatScan):
+            async with semaphore:
+                try:
+                    scan.backlog = await estimate(scan.key, scan.config)
+                except Exception as e:
+                    logger.warning(f"estimate new messages of {scan.key} failed: {e}")
+
+        await asyncio.gather(*[_one(scan) for scan in scans])
+
+    async def _worker(self):
+        while self._heap:
+            _, _, scan = heapq.heappop(self._heap)
+            scan.state = "scanning"
+            scan.start_time = time.time()
+            try:
+                await self.scan(scan.key, scan.config)
+                scan.state = "done"
+            except asyncio.CancelledError:
+                scan.state = "cancelled"
+                raise
+            except Exception as e:
+                scan.state = "failed"
+                scan.error = str(e)
+                logger.warning(f"Download {scan.key} error: {e}")
+            finally:
+                scan.end_time = time.time()
+            logger.info(
+                f"scanned chat {scan.key} in {scan.end_time - scan.start_time:.1f}s, "
+                f"{self.finished}/{len(self.scans)} chats done"
+            )
+
+    async def run(self, items: Iterable[Tuple[Hashable, ChatDownloadConfig]]):
+        """Scan every ``(chat_id, config)`` of ``items``"""
+        scans = [ChatScan(key, config) for key, config in items]
+        self.scans.extend(scans)
+        if self.estimate:
+            await self._estimate(self.estimate, scans)
+
+        seq = itertools.count(len(self._heap))
+        for scan in scans:
+            # chats without an estimate keep the configured order, after the others
+            priority = -scan.backlog if scan.backlog is not None else 0
+            heapq.heappush(self._heap, (priority, next(seq), scan))
+
+        workers = [
+            asyncio.create_task(self._worker())
+            for _ in range(min(self.concurrency, len(self._heap)))
+        ]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    @property
+    def finished(self) -> int:
+        """Number of chats scanned"""
+        return sum(1 for scan in self.scans if scan.state in ("done", "failed"))
+
+    def progress(self) -> Dict[str, object]:
+        """Overall and per chat progress"""
+        return {
+            "total": len(self.scans),
+            "finished": self.finished,
+            "scanning": sum(1 for scan in self.scans if scan.state == "scanning"),
+            "chats": [scan.to_dict() for scan in self.scans],
+        }
+
+
+_chat_scan_scheduler: Optional[ChatScanScheduler] = None
+
+
+def set_chat_scan_scheduler(scheduler: ChatScanScheduler):
+    """Scheduler reported by ``get_chat_scan_progress``"""
+    global _chat_scan_scheduler
+    _chat_scan_scheduler = scheduler
+
+
+def get_chat_scan_progress() -> Dict[str, object]:
+    """Progress of the chat scans, empty before they start"""
+    if _chat_scan_scheduler is None:
+        return {}
+    return _chat_scan_scheduler.progress()
@@ -0,0 +1,108 @@
+"""Versioned schema migrations for downloaded.db"""
+
+import os
+import sqlite3
+from typing import Callable, List, Optional, Tuple
+
+from loguru import logger
+from peewee import Database
+
+# rows of a message after the best one, a finished row first, then the newest
+_DUPLICATE_IDS = (
+    "SELECT ID FROM (SELECT ID, ROW_NUMBER() OVER (PARTITION BY CHAT_ID, MESSAGE_ID "
+    "ORDER BY STATUS = 1 DESC, ID DESC) AS RN FROM Downloaded "
+    "WHERE CHAT_ID IS NOT NULL AND MESSAGE_ID IS NOT NULL) WHERE RN > 1"
+)
+
+
+def backup_database(database: Database, suffix: str) -> Optional[str]:
+    """Copy the database file to ``<file>.<suffix>``, returns the copy's path"""
+    path = getattr(database, "database", None)
+    if not path or path == ":memory:" or not os.path.exists(path):
+        return None
+    backup_path = f"{path}.{suffix}"
+    target = sqlite3.connect(backup_path)
+    try:
+        database.connection().backup(target)
+    finally:
+        target.close()
+    return backup_path
+
+
+def _unique_message_key(database: Database):
+    """Drop duplicate rows of a message, keep the finished or else the newest one"""
+    duplicates = database.execute_sql(
+        f"SELECT COUNT(*) FROM ({_DUPLICATE_IDS})"
+    ).fetchone()[0]
+    if duplicates:
+        backup_path = backup_database(database, "v1.bak")
+        if backup_path:
+            logger.info(
+                f"backed up the database to {backup_path} before removing duplicates"
+            )
+    cursor = database.execute_sql(
+        f"DELETE FROM Downloaded WHERE ID IN ({_DUPLICATE_IDS})"
+    )
+    if cursor.rowcount:
+        logger.info(f"removed {cursor.rowcount} duplicate download records")
+    database.execute_sql(
+        "CREATE UNIQUE INDEX IF NOT EXISTS downloaded_chat_id_message_id "
+        "ON Downloaded (CHAT_ID, MESSAGE_ID)"
+    )
+
+
+def _lookup_indexes(database: Database):
+    """Indexes for the lookups by chat name, status and size"""
+    for sql in [
+        # getMsg / retry ids by chat name
+        "CREATE INDEX IF NOT EXISTS downloaded_chat_username_message_id "
+        "ON Downloaded (CHAT_USERNAME, MESSAGE_ID)",
+        # get2Down, MAX(MESSAGE_ID) of get_last_read_message_id
+        "CREATE INDEX IF NOT EXISTS downloaded_chat_username_status_message_id "
+        "ON Downloaded (CHAT_USERNAME, STATUS, MESSAGE_ID)",
+        # exact size match of get_similar_files
+        "CREATE INDEX IF NOT EXISTS downloaded_mime_type_media_size_status "
+        "ON Downloaded (MIME_TYPE, MEDIA_SIZE, STATUS)",
+        # covers load_retry_msg_from_db
+        "CREATE INDEX IF NOT EXISTS downloaded_status_chat_id "
+        "ON Downloaded (STATUS, CHAT_ID, CHAT_USERNAME, MESSAGE_ID)",
+    ]:
+        database.execute_sql(sql)
+    database.execute_sql("ANALYZE")
+
+
+# (user_version, name, step), applied in order, never edit a released step
+MIGRATIONS: List[Tuple[int, str, Callable[[Database], None]]] = [
+    (1, "unique (chat_id, message_id)", _unique_message_key),
+    (2, "lookup indexes", _lookup_indexes),
+]
+
+
+def get_schema_version(database: Database) -> int:
+    """``PRAGMA user_version`` of ``database``"""
+    return int(database.execute_sql("PRAGMA user_version").fetchone()[0])
+
+
+def migrate(
+    database: Database,
+    migrations: List[Tuple[int, str, Callable[[Database], None]]] = None,
+) -> int:
+    """Apply the migrations newer than the database, each in its own transaction
+
+    Returns the schema version after migrating
+    """
+    version = get_schema_version(database)
+    for step_version, name, step in migrations or MIGRATIONS:
+        if step_version <= version:
+            continue
+        logger.info(f"migrating database to version {step_version}: {name}")
+        with database.atomic():
+            step(database)
+            database.execute_sql(f"PRAGMA user_version = {int(step_version)}")
+        version = step_version
+    return version
+
+
+def optimize(database: Database):
+    """Let SQLite refresh the statistics it finds stale"""
+    database.execute_sql("PRAGMA optimize")
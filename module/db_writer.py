@@ -0,0 +1,146 @@
+"""Write-behind writer for download records"""
+
+import threading
+import time
+from typing import Callable, Dict, Hashable, List, Optional
+
+from loguru import logger
+
+
+class DBWriter:
+    """Coalesce row writes and flush them in batches on a background thread.
+
+    ``submit`` only stores the row under its key, a later write of the same
+    key replaces the earlier one, so queued -> downloading -> done turns into
+    a single write. A flush runs when ``batch_size`` rows are pending or the
+    oldest pending row is ``flush_interval`` seconds old, and hands the rows
+    to ``write_rows`` which is expected to write them in one transaction.
+
+    Rows stay readable through ``get_pending`` until their batch committed.
+    """
+
+    def __init__(
+        self,
+        write_rows: Callable[[List[dict]], None],
+        batch_size: int = 200,
+        flush_interval: float = 1.0,
+    ):
+        self.write_rows = write_rows
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._pending: Dict[Hashable, dict] = {}
+        self._inflight: Dict[Hashable, dict] = {}
+        self._first_pending: float = 0
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self.written_rows = 0
+        self.batches = 0
+
+    def start(self):
+        """Start the writer thread"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="db_writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def is_running(self) -> bool:
+        """If rows are written behind"""
+        return self._running
+
+    def submit(self, key: Hashable, row: dict):
+        """Queue ``row`` for ``key``, replacing a pending row of the same key"""
+        with self._cond:
+            if not self._pending:
+                self._first_pending = time.monotonic()
+            self._pending[key] = row
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+
+    def get_pending(self, key: Hashable) -> Optional[dict]:
+        """The newest row for ``key`` that is not committed yet"""
+        with self._cond:
+            row = self._pending.get(key)
+            if row is None:
+                row = self._inflight.get(key)
+            return row
+
+    def _take_batch(self) -> Dict[Hashable, dict]:
+        with self._cond:
+            while self._running:
+                if self._pending and (
+                    len(self._pending) >= self.batch_size
+                    or time.monotonic() - self._first_pending >= self.flush_interval
+                ):
+                    break
+                timeout = self.flush_interval
+                if self._pending:
+                    timeout = max(
+                        0, self._first_pending + self.flush_interval - time.monotonic()
+                    )
+                self._cond.wait(timeout)
+            batch, self._pending = self._pending, {}
+            self._inflight = batch
+            return batch
+
+    def _commit(self, batch: Dict[Hashable, dict]) -> bool:
+        success = True
+        if batch:
+            try:
+                self.write_rows(list(batch.values()))
+                self.written_rows += len(batch)
+                self.batches += 1
+            except Exception as e:
+                success = False
+                logger.exception(f"write {len(batch)} rows failed: {e}")
+                with self._cond:
+                    # keep them for the next flush, newer writes win
+                    for key, row in batch.items():
+                        self._pending.setdefault(key, row)
+                    self._first_pending = time.monotonic()
+        with self._cond:
+            self._inflight = {}
+            self._cond.notify_all()
+        return success
+
+    def _run(self):
+        while True:
+            success = self._commit(self._take_batch())
+            with self._cond:
+                # shutting down: write the rest without waiting, give up on errors
+                if not self._running and (not self._pending or not success):
+                    return
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Write everything pending now and wait until it is committed"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if not self._running:
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+            else:
+                self._first_pending = 0
+                self._cond.notify_all()
+                while self._pending or self._inflight:
+                    remaining = (
+                        None if deadline is None else deadline - time.monotonic()
+                    )
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                return True
+        return self._commit(batch)
+
+    def stop(self):
+        """Durable flush of everything pending and stop the thread"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        # rows submitted after the thread exited
+        self.flush()
@@ -0,0 +1,221 @@
+"""In-memory candidate index for duplicate detection"""
+
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+NGRAM_SIZE = 3
+
+
+class DedupRecord:
+    """The columns of a ``Downloaded`` row the dedup check looks at"""
+
+    __slots__ = (
+        "id",
+        "chat_id",
+        "message_id",
+        "filename",
+        "title",
+        "mime_type",
+        "msg_type",
+        "media_size",
+        "media_duration",
+        "status",
+    )
+
+    # pylint: disable = R0913
+    def __init__(
+        self,
+        id: Optional[int],  # pylint: disable = W0622
+        chat_id: int,
+        message_id: int,
+        filename: Optional[str],
+        title: Optional[str],
+        mime_type: Optional[str],
+        msg_type: Optional[str],
+        media_size: Optional[int],
+        media_duration: Optional[int],
+        status: int,
+    ):
+        self.id = id
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.filename = filename or ""
+        self.title = title or ""
+        self.mime_type = mime_type
+        self.msg_type = msg_type
+        self.media_size = media_size or 0
+        self.media_duration = media_duration or 0
+        self.status = status
+
+
+def _ngrams(text: str) -> Set[str]:
+    return {text[i : i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+
+
+def match_segments(text: str, segments: List[str]) -> bool:
+    """If ``segments`` appear in ``text`` in order, like GLOB ``*a*b*``"""
+    pos = 0
+    for segment in segments:
+        pos = text.find(segment, pos)
+        if pos < 0:
+            return False
+        pos += len(segment)
+    return True
+
+
+class DedupIndex:
+    """Candidate lookup for ``Downloaded.get_similar_files`` without table scans.
+
+    Rows are bucketed by ``(mime_type, media_size)`` for the exact size match
+    and by mime type and message type for the name match. Name matches go
+    through case sensitive trigram postings of filename and title: the rarest
+    trigram of the pattern is intersected with the others and the survivors
+    are verified against the pattern, so the result is the same as the
+    ``GLOB '*core*name*'`` queries it replaces.
+
+    Rows are keyed by ``(chat_id, message_id)`` so a row can be indexed before
+    it has a database id. Postings are append only, rows whose name changed
+    are filtered out by the verification step.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # slot numbers are internal and stand for one (chat_id, message_id)
+        self._records: Dict[int, DedupRecord] = {}
+        self._by_msg: Dict[Tuple[int, int], int] = {}
+        self._next_slot = 0
+        self._by_size: Dict[Tuple[Optional[str], int], Set[int]] = {}
+        self._by_mime_type: Dict[Optional[str], Set[int]] = {}
+        self._by_msg_type: Dict[Optional[str], Set[int]] = {}
+        self._postings: Dict[str, array] = {}
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def load(self, rows: Iterable[tuple]):
+        """Bulk load ``DedupRecord`` field tuples, e.g. from a select"""
+        with self._lock:
+            for row in rows:
+                self._add(DedupRecord(*row))
+
+    def add(self, record: DedupRecord):
+        """Insert or replace the row of ``(record.chat_id, record.message_id)``"""
+        with self._lock:
+            self._add(record)
+
+    def _add(self, record: DedupRecord):
+        key = (record.chat_id, record.message_id)
+        slot = self._by_msg.get(key)
+        if slot is None:
+            slot = self._by_msg[key] = self._next_slot
+            self._next_slot += 1
+
+        old = self._records.get(slot)
+        if old:
+            self._discard_buckets(old, slot)
+            if record.id is None:
+                record.id = old.id
+
+        self._records[slot] = record
+        self._by_size.setdefault((record.mime_type, record.media_size), set()).add(slot)
+        self._by_mime_type.setdefault(record.mime_type, set()).add(slot)
+        self._by_msg_type.setdefault(record.msg_type, set()).add(slot)
+
+        grams = _ngrams(record.filename) | _ngrams(record.title)
+        if old:
+            grams -= _ngrams(old.filename) | _ngrams(old.title)
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if posting is None:
+                posting = self._postings[gram] = array("Q")
+            posting.append(slot)
+
+    def _discard_buckets(self, record: DedupRecord, slot: int):
+        self._by_size.get((record.mime_type, record.media_size), set()).discard(slot)
+        self._by_mime_type.get(record.mime_type, set()).discard(slot)
+        self._by_msg_type.get(record.msg_type, set()).discard(slot)
+
+    def get(self, chat_id: int, message_id: int) -> Optional[DedupRecord]:
+        """Row of a message, if indexed"""
+        slot = self._by_msg.get((chat_id, message_id))
+        return self._records.get(slot) if slot is not None else None
+
+    def _name_candidates(self, segments: List[str]) -> Optional[Set[int]]:
+        """Slots that may match ``segments``, None if the pattern has no trigram"""
+        grams = set()
+        for segment in segments:
+            grams |= _ngrams(segment)
+        if not grams:
+            return None
+
+        postings = sorted((self._postings.get(gram, ()) for gram in grams), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(posting)
+        return candidates
+
+    # pylint: disable = R0913
+    def find_candidates(
+        self,
+        mime_type: Optional[str],
+        msg_type: Optional[str],
+        media_size: int,
+        size_range: Tuple[int, int],
+        segments: Optional[List[str]],
+        status: List[int],
+    ) -> List[DedupRecord]:
+        """Rows matching the exact size query or one of the name queries.
+
+        Parameters
+        ----------
+        mime_type, msg_type, media_size:
+            The message being checked
+
+        size_range: Tuple[int, int]
+            Inclusive size range for a name match of the same mime type
+
+        segments: Optional[List[str]]
+            Name pattern, the parts between ``*`` of the old GLOB, None to
+            only run the exact size match
+
+        status: List[int]
+            Only rows in these states
+        """
+        status_acc = set(status)
+        with self._lock:
+            result = {
+                slot
+                for slot in self._by_size.get((mime_type, media_size), ())
+                if self._records[slot].status in status_acc
+            }
+
+            segments = [i for i in segments or [] if i]
+            if segments:
+                candidates = self._name_candidates(segments)
+                if candidates is None:
+                    # pattern too short for a trigram, scan the type buckets
+                    candidates = self._by_mime_type.get(mime_type, set()) | (
+                        self._by_msg_type.get(msg_type, set())
+                    )
+
+                for slot in candidates:
+                    if slot in result:
+                        continue
+                    record = self._records[slot]
+                    if record.status not in status_acc:
+                        continue
+                    same_mime_type = (
+                        record.mime_type == mime_type
+                        and size_range[0] <= record.media_size <= size_range[1]
+                    )
+                    if not same_mime_type and record.msg_type != msg_type:
+                        continue
+                    if match_segments(record.filename, segments) or match_segments(
+                        record.title, segments
+                    ):
+                        result.add(slot)
+
+            return [self._records[slot] for slot in sorted(result)]
@@ -0,0 +1,159 @@
+"""Fair scheduler for the download workers"""
+
+import asyncio
+import heapq
+import itertools
+from collections import OrderedDict, deque
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+DOWNLOAD_ORDERS = ["fifo", "smallest", "remaining"]
+
+
+class _Lane:
+    """Queued items of one task, in arrival or size order"""
+
+    __slots__ = ("items", "sized", "seq")
+
+    def __init__(self, sized: bool):
+        self.items: Any = [] if sized else deque()
+        self.sized = sized
+        self.seq = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def push(self, item: Any, size: int):
+        if self.sized:
+            # seq keeps arrival order among equal sizes and never compares items
+            heapq.heappush(self.items, (size, next(self.seq), item))
+        else:
+            self.items.append(item)
+
+    def pop(self) -> Any:
+        if self.sized:
+            return heapq.heappop(self.items)[2]
+        return self.items.popleft()
+
+
+class DownloadScheduler:
+    """Drop-in replacement of the global download ``asyncio.Queue``.
+
+    Every key (a ``TaskNode``) gets its own lane and ``get`` serves the lanes
+    round-robin, so one large channel scan can not starve the other chats.
+    Lanes put with ``priority=True`` (bot and link downloads) are always
+    served first and do not count against ``maxsize``, an interactive
+    request never waits behind a full queue.
+
+    ``order`` chooses the order inside a lane: ``fifo`` keeps the message
+    order, ``smallest`` and ``remaining`` pop the item with the smallest
+    ``size`` given to ``put`` first (the caller passes the file size or the
+    bytes still missing).
+
+    ``purge`` drops the whole lane of a stopped task at once.
+    """
+
+    def __init__(self, maxsize: int = 0, order: str = "fifo"):
+        self.maxsize = maxsize
+        self.order = order if order in DOWNLOAD_ORDERS else "fifo"
+        self._lanes: Dict[Hashable, _Lane] = {}
+        # lanes with items, in round-robin order
+        self._ready: "OrderedDict[Hashable, None]" = OrderedDict()
+        self._priority_ready: "OrderedDict[Hashable, None]" = OrderedDict()
+        self._priority_keys: set = set()
+        self._size = 0
+        self._normal_size = 0
+        self._cond: Optional[asyncio.Condition] = None
+
+    def _get_cond(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    def qsize(self) -> int:
+        """Number of queued items"""
+        return self._size
+
+    def empty(self) -> bool:
+        """If nothing is queued"""
+        return self._size == 0
+
+    def lane_sizes(self) -> List[Tuple[Hashable, int]]:
+        """``(key, queued)`` of every lane with items"""
+        return [(key, len(lane)) for key, lane in self._lanes.items() if len(lane)]
+
+    def _push(self, key: Hashable, item: Any, size: int, priority: bool):
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _Lane(self.order != "fifo")
+            # the lane keeps its lane type until it is empty
+            if priority:
+                self._priority_keys.add(key)
+        lane.push(item, size)
+        ready = self._priority_ready if key in self._priority_keys else self._ready
+        ready.setdefault(key, None)
+        self._size += 1
+        if key not in self._priority_keys:
+            self._normal_size += 1
+
+    def _pop(self) -> Any:
+        ready = self._priority_ready if self._priority_ready else self._ready
+        key = next(iter(ready))
+        lane = self._lanes[key]
+        item = lane.pop()
+        self._size -= 1
+        if key not in self._priority_keys:
+            self._normal_size -= 1
+        if len(lane):
+            # served once, go to the back of the round
+            ready.move_to_end(key)
+        else:
+            del ready[key]
+            del self._lanes[key]
+            self._priority_keys.discard(key)
+        return item
+
+    async def put(
+        self, item: Any, key: Hashable = None, size: int = 0, priority: bool = False
+    ):
+        """Queue ``item`` in the lane of ``key``, waits while a normal lane is full"""
+        cond = self._get_cond()
+        async with cond:
+            if not priority and key not in self._priority_keys:
+                while self.maxsize > 0 and self._normal_size >= self.maxsize:
+                    await cond.wait()
+            self._push(key, item, size, priority)
+            cond.notify_all()
+
+    async def get(self) -> Any:
+        """Next item, round-robin over the lanes, priority lanes first"""
+        cond = self._get_cond()
+        async with cond:
+            while not self._size:
+                await cond.wait()
+            item = self._pop()
+            cond.notify_all()
+            return item
+
+    def purge(self, key: Hashable) -> int:
+        """Drop every queued item of ``key``, returns how many were dropped"""
+        lane = self._lanes.pop(key, None)
+        if lane is None:
+            return 0
+        count = len(lane)
+        self._ready.pop(key, None)
+        self._priority_ready.pop(key, None)
+        self._size -= count
+        if key not in self._priority_keys:
+            self._normal_size -= count
+        self._priority_keys.discard(key)
+        if self._cond is not None and count:
+            try:
+                # wake up producers waiting for room
+                asyncio.get_running_loop().create_task(self._notify())
+            except RuntimeError:
+                pass
+        return count
+
+    async def _notify(self):
+        async with self._cond:
+            self._cond.notify_all()
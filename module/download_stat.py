@@ -1,11 +1,14 @@
 """Download Stat"""
-import asyncio
-import time
 from enum import Enum
 
 from pyrogram import Client
 
+from module import metrics
 from module.app import TaskNode
+from module.pacing import AdaptivePacer
+from module.progress_store import ProgressStore
+from module.rate_limiter import get_rate_limiter
+from module.task_events import download_state_changed
 
 
 class DownloadState(Enum):
@@ -15,21 +18,40 @@ class DownloadState(Enum):
     StopDownload = 2
 
 
-_download_result: dict = {}
-_total_download_speed: int = 0
-_total_download_size: int = 0
-_last_download_time: float = time.time()
+_progress_store: ProgressStore = ProgressStore()
+_upload_progress_store: ProgressStore = ProgressStore()
 _download_state: DownloadState = DownloadState.Downloading
+_download_pacer: AdaptivePacer = AdaptivePacer(bucket=get_rate_limiter().bucket("file"))
 
 
-def get_download_result() -> dict:
-    """get global download result"""
-    return _download_result
+def get_progress_store() -> ProgressStore:
+    """get global download progress"""
+    return _progress_store
 
 
 def get_total_download_speed() -> int:
     """get total download speed"""
-    return _total_download_speed
+    return _progress_store.total_speed
+
+
+def get_upload_progress_store() -> ProgressStore:
+    """get global upload progress"""
+    return _upload_progress_store
+
+
+def get_total_upload_speed() -> int:
+    """get total upload speed"""
+    return _upload_progress_store.total_speed
+
+
+def get_download_pacer() -> AdaptivePacer:
+    """get the pacer shared by all media downloads"""
+    return _download_pacer
+
+
+def get_download_pacing() -> dict:
+    """get current download pacing state"""
+    return _download_pacer.get_state()
 
 
 def get_download_state() -> DownloadState:
@@ -42,6 +64,13 @@ def set_download_state(state: DownloadState):
     """set download state"""
     global _download_state
     _download_state = state
+    download_state_changed.notify()
+
+
+def _progress_chat_id(chat_id):
+    if str(chat_id).startswith('-100'):
+        return str(0 - int(chat_id) - 1000000000000)
+    return chat_id
 
 
 async def update_download_status(
@@ -54,76 +83,69 @@ async def update_download_status(
     client: Client,
 ):
     """update_download_status"""
-    cur_time = time.time()
-    # pylint: disable = W0603
-    global _total_download_speed
-    global _total_download_size
-    global _last_download_time
-
     if node.is_stop_transmission:
         client.stop_transmission()
 
-    chat_id = node.chat_id
+    if get_download_state() == DownloadState.StopDownload:
+        # 暂停时挂起 恢复下载或任务被停止时立即唤醒
+        await download_state_changed.wait_for(
+            lambda: get_download_state() != DownloadState.StopDownload
+            or node.is_stop_transmission
+        )
+        if node.is_stop_transmission:
+            client.stop_transmission()
 
-    if str(chat_id).startswith('-100'):
-        chat_id = str(0 - int(chat_id) - 1000000000000)
+    chat_id = _progress_chat_id(node.chat_id)
+    # 首次上报即完成的是已存在的文件 不计入下载耗时
+    is_known = _progress_store.get(chat_id, message_id) is not None
+    record = _progress_store.update(
+        chat_id,
+        message_id,
+        down_byte,
+        total_size,
+        file_name,
+        start_time,
+        node.task_id,
+    )
+    if is_known and record.state == "done":
+        metrics.DOWNLOAD_FILE_BYTES.observe(record.total_size)
+        metrics.DOWNLOAD_FILE_SECONDS.observe(record.end_time - record.start_time)
+
+
+def finish_download_status(node: TaskNode, message_id: int, state: str):
+    """下载结束时移出进行中的进度 成功但最后一次回调没报满(续传、分段、大小不符)的也在这里完成"""
+    chat_id = _progress_chat_id(node.chat_id)
+    record = _progress_store.get(chat_id, message_id)
+    _progress_store.finish(chat_id, message_id, state)
+    if record is not None and state == "done":
+        metrics.DOWNLOAD_FILE_BYTES.observe(record.total_size)
+        metrics.DOWNLOAD_FILE_SECONDS.observe(record.end_time - record.start_time)
+
+
+def update_upload_status(
+    upload_size: int,
+    total_size: int,
+    message_id: int,
+    file_name: str,
+    start_time: float,
+    node: TaskNode,
+):
+    """记录上传进度 用于上传速度和指标"""
+    _upload_progress_store.update(
+        _progress_chat_id(node.chat_id),
+        message_id,
+        upload_size,
+        total_size,
+        file_name,
+        start_time,
+        node.task_id,
+    )
 
 
-    while get_download_state() == DownloadState.StopDownload:
-        if node.is_stop_transmission:
-            client.stop_transmission()
-        await asyncio.sleep(1)
-
-    if not _download_result.get(chat_id):
-        _download_result[chat_id] = {}
-
-    if _download_result[chat_id].get(message_id):
-        last_download_byte = _download_result[chat_id][message_id]["down_byte"]
-        last_time = _download_result[chat_id][message_id]["end_time"]
-        download_speed = _download_result[chat_id][message_id]["download_speed"]
-        each_second_total_download = _download_result[chat_id][message_id][
-            "each_second_total_download"
-        ]
-        end_time = _download_result[chat_id][message_id]["end_time"]
-
-        _total_download_size += down_byte - last_download_byte
-        each_second_total_download += down_byte - last_download_byte
-
-        if cur_time - last_time >= 1.0:
-            download_speed = int(each_second_total_download / (cur_time - last_time))
-            end_time = cur_time
-            each_second_total_download = 0
-
-        download_speed = max(download_speed, 0)
-
-        _download_result[chat_id][message_id]["down_byte"] = down_byte
-        _download_result[chat_id][message_id]["end_time"] = end_time
-        _download_result[chat_id][message_id]["download_speed"] = download_speed
-        _download_result[chat_id][message_id][
-            "each_second_total_download"
-        ] = each_second_total_download
-    else:
-        each_second_total_download = down_byte
-        _download_result[chat_id][message_id] = {
-            "down_byte": down_byte,
-            "total_size": total_size,
-            "file_name": file_name,
-            "start_time": start_time,
-            "end_time": cur_time,
-            "download_speed": down_byte / (cur_time - start_time),
-            "each_second_total_download": each_second_total_download,
-            "task_id": node.task_id,
-        }
-        _total_download_size += down_byte
-
-    if cur_time - _last_download_time >= 1.0:
-        # update speed
-        _total_download_speed = int(
-            _total_download_size / (cur_time - _last_download_time)
-        )
-        _total_download_speed = max(_total_download_speed, 0)
-        _total_download_size = 0
-        _last_download_time = cur_time
+def finish_upload_status(node: TaskNode, message_id: int, state: str):
+    """上传未完成就结束时 移出进行中的进度"""
+    _upload_progress_store.finish(_progress_chat_id(node.chat_id), message_id, state)
+
 
 async def update_download_status_simple(
     down_byte: int,
@@ -134,59 +156,49 @@ async def update_download_status_simple(
     chat_id: str
 ):
     """update_download_status"""
-    cur_time = time.time()
-    # pylint: disable = W0603
-    global _total_download_speed
-    global _total_download_size
-    global _last_download_time
-
-    if not _download_result.get(chat_id):
-        _download_result[chat_id] = {}
-
-    if _download_result[chat_id].get(message_id):
-        last_download_byte = _download_result[chat_id][message_id]["down_byte"]
-        last_time = _download_result[chat_id][message_id]["end_time"]
-        download_speed = _download_result[chat_id][message_id]["download_speed"]
-        each_second_total_download = _download_result[chat_id][message_id][
-            "each_second_total_download"
-        ]
-        end_time = _download_result[chat_id][message_id]["end_time"]
-
-        _total_download_size += down_byte - last_download_byte
-        each_second_total_download += down_byte - last_download_byte
-
-        if cur_time - last_time >= 1.0:
-            download_speed = int(each_second_total_download / (cur_time - last_time))
-            end_time = cur_time
-            each_second_total_download = 0
-
-        download_speed = max(download_speed, 0)
-
-        _download_result[chat_id][message_id]["down_byte"] = down_byte
-        _download_result[chat_id][message_id]["end_time"] = end_time
-        _download_result[chat_id][message_id]["download_speed"] = download_speed
-        _download_result[chat_id][message_id][
-            "each_second_total_download"
-        ] = each_second_total_download
-    else:
-        each_second_total_download = down_byte
-        _download_result[chat_id][message_id] = {
-            "down_byte": down_byte,
-            "total_size": total_size,
-            "file_name": file_name,
-            "start_time": start_time,
-            "end_time": cur_time,
-            "download_speed": down_byte / (cur_time - start_time),
-            "each_second_total_download": each_second_total_download,
-            "task_id": 0,
-        }
-        _total_download_size += down_byte
-
-    if cur_time - _last_download_time >= 1.0:
-        # update speed
-        _total_download_speed = int(
-            _total_download_size / (cur_time - _last_download_time)
-        )
-        _total_download_speed = max(_total_download_speed, 0)
-        _total_download_size = 0
-        _last_download_time = cur_time
+    _progress_store.update(
+        chat_id, message_id, down_byte, total_size, file_name, start_time
+    )
+
+
+def _collect_chat_stats(store: ProgressStore, key: str) -> metrics.CallbackSamples:
+    for chat_id, stat in store.chat_stats().items():
+        yield {"chat": str(chat_id)}, stat[key]
+
+
+metrics.REGISTRY.callback(
+    "tdl_downloaded_bytes",
+    "Bytes downloaded per chat",
+    "counter",
+    lambda: _collect_chat_stats(_progress_store, "down_byte"),
+)
+metrics.REGISTRY.callback(
+    "tdl_download_speed_bytes",
+    "EWMA of the download bytes per second per chat",
+    "gauge",
+    lambda: _collect_chat_stats(_progress_store, "download_speed"),
+)
+metrics.REGISTRY.callback(
+    "tdl_downloads_active",
+    "Files being downloaded",
+    "gauge",
+    lambda: [({}, _progress_store.total.active)],
+)
+metrics.REGISTRY.callback(
+    "tdl_downloads_finished",
+    "Files downloaded completely",
+    "counter",
+    lambda: [({}, _progress_store.total.finished)],
+)
+metrics.REGISTRY.callback(
+    "tdl_uploaded_bytes",
+    "Bytes uploaded to telegram per source chat",
+    "counter",
+    lambda: _collect_chat_stats(_upload_progress_store, "down_byte"),
+)
+metrics.REGISTRY.callback(
+    "tdl_upload_speed_bytes",
+    "EWMA of the upload bytes per second per source chat",
+    "gauge",
+    lambda: _collect_chat_stats(_upload_progress_store, "download_speed"),
+)
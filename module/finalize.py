@@ -0,0 +1,116 @@
+"""Background finalize stage for finished downloads"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, List, Optional, Set
+
+from loguru import logger
+
+
+class FinalizeJob:
+    """One finished download waiting to be finalized.
+
+    ``run`` is blocking work (merge, size check, cleanup, DB write) and is
+    executed on a pool thread, ``on_done(success)`` is awaited on the event
+    loop afterwards.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        run: Callable[[], bool],
+        on_done: Callable[[bool], Awaitable],
+    ):
+        self.name = name
+        self.run = run
+        self.on_done = on_done
+
+
+class FinalizeStage:
+    """Run finalize jobs on a thread pool fed by a bounded queue.
+
+    Download workers only wait in ``submit`` while the queue is full, so a
+    multi gigabyte merge never blocks the event loop and a download worker is
+    free for the next message as soon as the last chunk arrived.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 0):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max_queue
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._callbacks: Set[asyncio.Task] = set()
+
+    def start(self, loop: asyncio.AbstractEventLoop, max_workers: int = 0):
+        """Start the pool threads and the queue consumers on ``loop``"""
+        if self._tasks:
+            return
+        if max_workers:
+            self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="finalize"
+        )
+        self._queue = asyncio.Queue(self.max_queue or self.max_workers * 4)
+        self._tasks = [
+            loop.create_task(self._consume()) for _ in range(self.max_workers)
+        ]
+
+    @property
+    def pending(self) -> int:
+        """Jobs queued and not yet picked up"""
+        return self._queue.qsize() if self._queue else 0
+
+    async def submit(self, job: FinalizeJob):
+        """Queue ``job``, waits only while the queue is full"""
+        if not self._queue:
+            # stage not started, finalize inline so nothing gets lost
+            await self._run(job)
+            return
+        await self._queue.put(job)
+
+    async def _run(self, job: FinalizeJob):
+        success = False
+        try:
+            success = await asyncio.get_running_loop().run_in_executor(
+                self._executor, job.run
+            )
+        except Exception as e:
+            logger.exception(f"Finalize {job.name} failed: {e}")
+
+        # uploads and reports in on_done must not hold up the next merge
+        task = asyncio.ensure_future(self._done(job, bool(success)))
+        self._callbacks.add(task)
+        task.add_done_callback(self._callbacks.discard)
+
+    @staticmethod
+    async def _done(job: FinalizeJob, success: bool):
+        try:
+            await job.on_done(success)
+        except Exception as e:
+            logger.exception(f"{e}")
+
+    async def _consume(self):
+        while True:
+            job = await self._queue.get()  # type: ignore
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()  # type: ignore
+
+    async def join(self):
+        """Wait until every queued job is finalized and reported"""
+        if self._queue:
+            await self._queue.join()
+        if self._callbacks:
+            await asyncio.gather(*self._callbacks, return_exceptions=True)
+
+    def shutdown(self):
+        """Stop the consumers and wait for merges already running"""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._queue = None
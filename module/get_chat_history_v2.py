@@ -1,13 +1,18 @@
 """Rewrite pyrogram.get_chat_history"""
 
+import asyncio
+from collections import deque
 from datetime import datetime
-from typing import AsyncGenerator, Optional, Union
+from typing import AsyncGenerator, Deque, List, Optional, Tuple, Union
 
 import pyrogram
+from loguru import logger
 
 # pylint: disable = W0611
 from pyrogram import raw, types, utils
 
+from module.rate_limiter import get_rate_limiter
+
 
 async def get_chunk_v2(
     *,
@@ -18,10 +23,13 @@ async def get_chunk_v2(
     max_id: int = 0,
     from_message_id: int = 0,
     from_date: datetime = utils.zero_datetime(),
-    reverse: bool = False
+    reverse: bool = False,
+    min_id: int = 0,
+    sleep_threshold: int = 60,
 ):
     """get chunk"""
     from_message_id = from_message_id or (1 if reverse else 0)
+    await get_rate_limiter().acquire("history")
 
     messages = await utils.parse_messages(
         client,
@@ -33,10 +41,10 @@ async def get_chunk_v2(
                 add_offset=offset * (-1 if reverse else 1) - (limit if reverse else 0),
                 limit=limit,
                 max_id=max_id,
-                min_id=0,
+                min_id=min_id,
                 hash=0,
             ),
-            sleep_threshold=60,
+            sleep_threshold=sleep_threshold,
         ),
         replies=0,
     )
@@ -47,6 +55,26 @@ async def get_chunk_v2(
     return messages
 
 
+async def get_latest_message_id(
+    client: pyrogram.Client, chat_id: Union[int, str]
+) -> int:
+    """Id of the newest message of ``chat_id``, 0 for an empty chat"""
+    messages = await get_chunk_v2(client=client, chat_id=chat_id, limit=1)
+    return messages[0].id if messages else 0
+
+
+async def is_channel(client: pyrogram.Client, chat_id: Union[int, str]) -> bool:
+    """If ``chat_id`` is a channel or supergroup
+
+    Only those number their messages on their own, private chats and basic
+    groups take ids from the account wide sequence.
+    """
+    if isinstance(chat_id, int) or chat_id.lstrip("-").isdigit():
+        return str(chat_id).startswith("-100")
+    peer = await client.resolve_peer(chat_id)
+    return isinstance(peer, raw.types.InputPeerChannel)
+
+
 # pylint: disable = C0301
 async def get_chat_history_v2(
     self: pyrogram.Client,
@@ -57,8 +85,33 @@ async def get_chat_history_v2(
     offset_id: int = 0,
     offset_date: datetime = utils.zero_datetime(),
     reverse: bool = False,
+    prefetch_depth: int = 0,
 ) -> Optional[AsyncGenerator["types.Message", None]]:
-    """Get messages from a chat history."""
+    """Get messages from a chat history.
+
+    With ``prefetch_depth`` > 0 (and no ``offset``/``offset_date``) up to that
+    many pages of a channel are fetched ahead of the consumer, see
+    ``HistoryPrefetcher``. Other chats are paged one after the other.
+    """
+    if (
+        prefetch_depth > 0
+        and not offset
+        and offset_date == utils.zero_datetime()
+        and await is_channel(self, chat_id)
+    ):
+        prefetcher = HistoryPrefetcher(
+            self,
+            chat_id,
+            limit=limit,
+            max_id=max_id,
+            offset_id=offset_id,
+            reverse=reverse,
+            depth=prefetch_depth,
+        )
+        async for message in prefetcher:
+            yield message
+        return
+
     current = 0
     total = limit or (1 << 31) - 1
     limit = min(100, total)
@@ -87,3 +140,112 @@ async def get_chat_history_v2(
 
             if current >= total:
                 return
+
+
+class HistoryPrefetcher:
+    """Read a chat history with several pages in flight.
+
+    A page normally starts after the last message of the previous one, so
+    the pages can only be read one after the other. Here the history is cut
+    into windows of ``page_size`` message ids instead, fetched with
+    ``min_id``/``max_id``, which are known up front. Up to ``depth`` windows
+    are requested or buffered ahead of the consumer and yielded in order, so
+    memory stays bounded by ``depth`` pages. Deleted messages only make a
+    window shorter. The ids of a channel are dense, so only channels are
+    read this way, in other chats most windows would come back empty.
+
+    A FloodWait is reported to the ``history`` rate limit, which pauses every
+    history request until the wait is over, and halves the number of windows
+    in flight, each answered window lets it grow again by one up to ``depth``.
+    """
+
+    def __init__(
+        self,
+        client: pyrogram.Client,
+        chat_id: Union[int, str],
+        limit: int = 0,
+        max_id: int = 0,
+        offset_id: int = 0,
+        reverse: bool = False,
+        depth: int = 4,
+        page_size: int = 100,
+    ):
+        self.client = client
+        self.chat_id = chat_id
+        self.total = limit or (1 << 31) - 1
+        self.max_id = max_id
+        self.offset_id = offset_id
+        self.reverse = reverse
+        self.depth = max(1, depth)
+        self.page_size = page_size
+        self.in_flight = self.depth
+        self.flood_waits = 0
+
+    async def _windows(self) -> List[Tuple[int, int]]:
+        """Inclusive ``(low, high)`` id windows in reading order"""
+        top_id = await get_latest_message_id(self.client, self.chat_id)
+        if self.max_id:
+            top_id = min(top_id, self.max_id)
+
+        if self.reverse:
+            low = max(self.offset_id, 1)
+            return [
+                (start, min(start + self.page_size - 1, top_id))
+                for start in range(low, top_id + 1, self.page_size)
+            ]
+
+        # newest first, offset_id itself is not included like GetHistory
+        high = min(top_id, self.offset_id - 1) if self.offset_id else top_id
+        return [
+            (max(end - self.page_size + 1, 1), end)
+            for end in range(high, 0, -self.page_size)
+        ]
+
+    async def _fetch(self, low: int, high: int) -> list:
+        bucket = get_rate_limiter().bucket("history")
+        while True:
+            try:
+                messages = await get_chunk_v2(
+                    client=self.client,
+                    chat_id=self.chat_id,
+                    limit=self.page_size,
+                    from_message_id=high + 1,
+                    max_id=high + 1,
+                    min_id=low - 1,
+                    sleep_threshold=0,
+                )
+            except pyrogram.errors.FloodWait as wait_err:
+                self.flood_waits += 1
+                bucket.on_flood_wait(wait_err.value)
+                self.in_flight = max(1, self.in_flight // 2)
+                logger.warning(
+                    f"[{self.chat_id}] history FloodWait {wait_err.value}s, "
+                    f"{self.in_flight} pages in flight"
+                )
+                continue
+
+            bucket.on_success()
+            self.in_flight = min(self.depth, self.in_flight + 1)
+            if self.reverse:
+                messages.reverse()
+            return messages
+
+    async def __aiter__(self) -> AsyncGenerator["types.Message", None]:
+        windows = deque(await self._windows())
+        pending: Deque[asyncio.Task] = deque()
+        current = 0
+        try:
+            while windows or pending:
+                while windows and len(pending) < self.in_flight:
+                    pending.append(asyncio.create_task(self._fetch(*windows.popleft())))
+
+                for message in await pending.popleft():
+                    yield message
+
+                    current += 1
+                    if current >= self.total:
+                        return
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
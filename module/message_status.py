@@ -0,0 +1,154 @@
+"""Compact download status of the messages of one chat"""
+
+from array import array
+from bisect import bisect_right
+from enum import Enum
+from typing import Collection, Iterator, List, Optional, Set, Tuple, Type
+
+# array value of a message without status, the enum values start at 1
+_NO_STATUS = 0
+
+
+class IntervalSet:
+    """Set of ints stored as sorted disjoint inclusive ranges"""
+
+    def __init__(self):
+        self._starts: List[int] = []
+        self._ends: List[int] = []
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, value: int) -> bool:
+        idx = bisect_right(self._starts, value) - 1
+        return idx >= 0 and value <= self._ends[idx]
+
+    def add(self, value: int):
+        """Add ``value``, merging it with the adjacent ranges"""
+        idx = bisect_right(self._starts, value) - 1
+        if idx >= 0 and value <= self._ends[idx]:
+            return
+        self._count += 1
+        joins_left = idx >= 0 and self._ends[idx] == value - 1
+        joins_right = idx + 1 < len(self._starts) and self._starts[idx + 1] == value + 1
+        if joins_left and joins_right:
+            self._ends[idx] = self._ends[idx + 1]
+            del self._starts[idx + 1]
+            del self._ends[idx + 1]
+        elif joins_left:
+            self._ends[idx] = value
+        elif joins_right:
+            self._starts[idx + 1] = value
+        else:
+            self._starts.insert(idx + 1, value)
+            self._ends.insert(idx + 1, value)
+
+    def discard(self, value: int):
+        """Remove ``value``, splitting its range"""
+        idx = bisect_right(self._starts, value) - 1
+        if idx < 0 or value > self._ends[idx]:
+            return
+        self._count -= 1
+        start, end = self._starts[idx], self._ends[idx]
+        if start == end:
+            del self._starts[idx]
+            del self._ends[idx]
+        elif value == start:
+            self._starts[idx] = value + 1
+        elif value == end:
+            self._ends[idx] = value - 1
+        else:
+            self._ends[idx] = value - 1
+            self._starts.insert(idx + 1, value + 1)
+            self._ends.insert(idx + 1, end)
+
+    def ranges(self) -> List[Tuple[int, int]]:
+        """The inclusive ranges in ascending order"""
+        return list(zip(self._starts, self._ends))
+
+
+class MessageStatusStore:
+    """Download status by message id, one byte per id.
+
+    ``status_type`` is the status enum, its values must fit a byte and not
+    be 0, the members in ``finished`` need no retry. Statuses are kept in
+    an ``array('B')`` indexed by ``message_id - base`` that grows at either
+    end as ids arrive. Next to it the ids still to download or retry, the
+    highest id and the finished ids (as ranges) are updated on every
+    change, so saving the config never walks the statuses of the whole
+    chat. Reads keep the interface of the ``message_id -> status`` dict it
+    replaces.
+    """
+
+    def __init__(self, status_type: Type[Enum], finished: Collection[Enum]):
+        self.status_type = status_type
+        self._finished_statuses = frozenset(finished)
+        self._base = 0
+        self._statuses = array("B")
+        self._count = 0
+        self._unfinished: Set[int] = set()
+        self.finished = IntervalSet()
+        self.max_id = 0
+
+    def _index(self, message_id: int) -> int:
+        if not self._statuses:
+            self._base = message_id
+            self._statuses.append(_NO_STATUS)
+            return 0
+        idx = message_id - self._base
+        if idx < 0:
+            # leave room below as well, scans of other segments go downwards
+            grow = max(-idx, len(self._statuses) // 2)
+            self._statuses = array("B", bytes(grow)) + self._statuses
+            self._base -= grow
+            idx += grow
+        elif idx >= len(self._statuses):
+            self._statuses.extend(bytes(idx - len(self._statuses) + 1))
+        return idx
+
+    def __setitem__(self, message_id: int, status: Enum):
+        idx = self._index(message_id)
+        if self._statuses[idx] == _NO_STATUS:
+            self._count += 1
+        self._statuses[idx] = status.value
+        self.max_id = max(self.max_id, message_id)
+        if status in self._finished_statuses:
+            self._unfinished.discard(message_id)
+            self.finished.add(message_id)
+        else:
+            self._unfinished.add(message_id)
+            self.finished.discard(message_id)
+
+    def get(self, message_id: int, default: Optional[Enum] = None) -> Optional[Enum]:
+        """Status of ``message_id``, ``default`` if it has none"""
+        idx = message_id - self._base
+        if 0 <= idx < len(self._statuses) and self._statuses[idx] != _NO_STATUS:
+            return self.status_type(self._statuses[idx])
+        return default
+
+    def __getitem__(self, message_id: int) -> Enum:
+        status = self.get(message_id)
+        if status is None:
+            raise KeyError(message_id)
+        return status
+
+    def __contains__(self, message_id: int) -> bool:
+        return self.get(message_id) is not None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def items(self) -> Iterator[Tuple[int, Enum]]:
+        """Every ``(message_id, status)`` in ascending id order"""
+        for idx, value in enumerate(self._statuses):
+            if value != _NO_STATUS:
+                yield self._base + idx, self.status_type(value)
+
+    def unfinished_ids(self) -> Set[int]:
+        """Ids with a status not in ``finished``"""
+        return set(self._unfinished)
+
+    def is_finished(self, message_id: int) -> bool:
+        """If the status of ``message_id`` is in ``finished``"""
+        return message_id in self.finished
@@ -0,0 +1,333 @@
+"""Metrics in the Prometheus text exposition format"""
+
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, TypeVar
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+    300,
+)
+SIZE_BUCKETS = tuple(1024 * 1024 * size for size in (1, 4, 16, 64, 256, 1024, 4096))
+
+MetricT = TypeVar("MetricT", bound="Metric")
+LabelValues = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]
+CallbackSamples = Iterable[Tuple[Dict[str, str], float]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_sample(name: str, labels: Dict[str, str], value: float) -> str:
+    if labels:
+        label_str = ",".join(
+            f'{key}="{_escape(str(val))}"' for key, val in labels.items()
+        )
+        return f"{name}{{{label_str}}} {_format_value(value)}\n"
+    return f"{name} {_format_value(value)}\n"
+
+
+class Metric:
+    """Family of samples with the same name, one per label combination"""
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: LabelValues) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> List[Sample]:
+        """Current samples"""
+        raise NotImplementedError
+
+    def expose(self) -> str:
+        """Family in the text format"""
+        text = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.type_name}\n"
+        for name, labels, value in self.samples():
+            text += _format_sample(name, labels, value)
+        return text
+
+
+class Counter(Metric):
+    """Value that only goes up"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        """Add ``amount``, which must not be negative"""
+        if amount < 0:
+            raise ValueError("counters can only be incremented")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        """Value of one label combination"""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            values = list(self._values.items())
+        return [
+            (self.name + "_total", self._labels(key), value) for key, value in values
+        ]
+
+
+class Gauge(Metric):
+    """Value that goes up and down, or is read from a callback at scrape time"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels):
+        """Set the value"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        """Add ``amount``"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        """Subtract ``amount``"""
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Optional[Callable[[], float]]):
+        """Read the value from ``function`` at every scrape, only without labels"""
+        self._function = function
+
+    def get(self, **labels) -> float:
+        """Value of one label combination"""
+        if self._function is not None:
+            return self._function()
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[Sample]:
+        if self._function is not None:
+            return [(self.name, {}, self._function())]
+        with self._lock:
+            values = list(self._values.items())
+        return [(self.name, self._labels(key), value) for key, value in values]
+
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # per label combination: bucket counts, sum
+        self._values: Dict[LabelValues, List] = {}
+
+    def observe(self, value: float, **labels):
+        """Record one value"""
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0]
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][idx] += 1
+                    break
+            entry[1] += value
+
+    def get_count(self, **labels) -> int:
+        """Number of values of one label combination"""
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return sum(entry[0]) if entry else 0
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            values = [
+                (key, list(entry[0]), entry[1]) for key, entry in self._values.items()
+            ]
+        samples: List[Sample] = []
+        for key, counts, total in values:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append(
+                    (
+                        self.name + "_bucket",
+                        {**labels, "le": _format_value(bound)},
+                        cumulative,
+                    )
+                )
+            samples.append((self.name + "_sum", labels, total))
+            samples.append((self.name + "_count", labels, cumulative))
+        return samples
+
+
+class CallbackMetric(Metric):
+    """Family read from existing stats at scrape time"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        type_name: str,
+        collect: Callable[[], CallbackSamples],
+    ):
+        super().__init__(name, documentation)
+        self.type_name = type_name
+        self._collect = collect
+
+    def samples(self) -> List[Sample]:
+        name = self.name + "_total" if self.type_name == "counter" else self.name
+        return [(name, labels, value) for labels, value in self._collect()]
+
+
+class Registry:
+    """Metrics exposed by one endpoint"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: MetricT) -> MetricT:
+        """Add ``metric``, a second one with the same name replaces the first"""
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> Counter:
+        """Create and register a ``Counter``"""
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> Gauge:
+        """Create and register a ``Gauge``"""
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        """Create and register a ``Histogram``"""
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(
+        self,
+        name: str,
+        documentation: str,
+        type_name: str,
+        collect: Callable[[], CallbackSamples],
+    ) -> CallbackMetric:
+        """Register a family whose samples ``collect`` yields at scrape time"""
+        return self.register(CallbackMetric(name, documentation, type_name, collect))
+
+    def expose(self) -> str:
+        """Every family in the text format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "".join(metric.expose() for metric in metrics)
+
+
+REGISTRY = Registry()
+
+# download
+DOWNLOAD_FILE_BYTES = REGISTRY.histogram(
+    "tdl_download_file_bytes", "Size of downloaded files", buckets=SIZE_BUCKETS
+)
+DOWNLOAD_FILE_SECONDS = REGISTRY.histogram(
+    "tdl_download_file_seconds", "Time to download one file"
+)
+QUEUE_DEPTH = REGISTRY.gauge(
+    "tdl_download_queue_depth", "Messages waiting for a download worker"
+)
+WORKERS = REGISTRY.gauge("tdl_download_workers", "Number of download workers")
+WORKERS_BUSY = REGISTRY.gauge(
+    "tdl_download_workers_busy", "Download workers handling a message"
+)
+WORKER_BUSY_SECONDS = REGISTRY.counter(
+    "tdl_download_worker_busy_seconds",
+    "Time download workers spent handling messages, busy ratio is its rate over the workers",
+)
+# upload
+UPLOAD_FILE_SECONDS = REGISTRY.histogram(
+    "tdl_upload_file_seconds", "Time to upload one file", ["target", "result"]
+)
+# storage
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "tdl_db_query_seconds",
+    "Time a database call ran on the database thread",
+    ["method"],
+)
+MERGE_SECONDS = REGISTRY.histogram(
+    "tdl_merge_seconds",
+    "Time to merge the chunks of one file",
+    ["method"],
+    buckets=DEFAULT_BUCKETS,
+)
+
+
+def get_metrics_text() -> str:
+    """Every metric of the default registry in the text format"""
+    return REGISTRY.expose()
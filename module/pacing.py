@@ -0,0 +1,122 @@
+"""Adaptive pacing for media transfers"""
+
+import asyncio
+import time
+from typing import Optional
+
+from module.rate_limiter import TokenBucket
+
+
+class AdaptivePacer:
+    """Delay transfers only while Telegram pushes back.
+
+    The pacer starts with no delay at all. A FloodWait puts every caller into a
+    cooldown of the requested length and arms a small per-chunk delay, further
+    FloodWaits double that delay, and every successful chunk halves it again
+    until it drops back to zero. Other errors only slow down the transfer
+    that failed, through its ``transfer()`` pacer.
+
+    With a ``bucket`` the transfers also take its tokens and a FloodWait is
+    reported to it, so the rest of that method class cools down as well.
+    """
+
+    # pylint: disable = R0902
+    def __init__(
+        self,
+        min_delay: float = 0.2,
+        max_delay: float = 30.0,
+        decay: float = 0.5,
+        bucket: Optional[TokenBucket] = None,
+    ):
+        self.bucket = bucket
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.decay = decay
+        self.delay: float = 0
+        self.cooldown_until: float = 0
+        self.flood_wait_count: int = 0
+        self.flood_wait_seconds: float = 0
+        self.error_count: int = 0
+
+    def grow(self, delay: float) -> float:
+        """``delay`` after a backoff"""
+        return min(self.max_delay, max(self.min_delay, delay * 2))
+
+    def relax(self, delay: float) -> float:
+        """``delay`` after a success"""
+        delay *= self.decay
+        return 0 if delay < self.min_delay else delay
+
+    def transfer(self) -> "TransferPacer":
+        """Pacer of one transfer sharing this pacer's cooldown"""
+        return TransferPacer(self)
+
+    async def wait(self, delay: float = 0):
+        """Sleep for the current cooldown or delay, or at least ``delay``"""
+        wait_time = max(self.delay, delay, self.cooldown_until - time.time())
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+        if self.bucket:
+            await self.bucket.acquire()
+
+    def on_success(self):
+        """A chunk went through, relax the delay"""
+        if self.bucket:
+            self.bucket.on_success()
+        if self.delay:
+            self.delay = self.relax(self.delay)
+
+    def on_flood_wait(self, seconds: float):
+        """Telegram asked us to wait ``seconds``"""
+        self.flood_wait_count += 1
+        self.flood_wait_seconds += seconds
+        self.cooldown_until = max(self.cooldown_until, time.time() + seconds)
+        self.delay = self.grow(self.delay)
+        if self.bucket:
+            self.bucket.on_flood_wait(seconds)
+
+    def on_error(self):
+        """A transfer failed for another reason, counted only"""
+        self.error_count += 1
+
+    def get_state(self) -> dict:
+        """Current pacing state for the download stats"""
+        return {
+            "delay": round(self.delay, 3),
+            "cooldown": round(max(0, self.cooldown_until - time.time()), 3),
+            "flood_wait_count": self.flood_wait_count,
+            "flood_wait_seconds": self.flood_wait_seconds,
+            "error_count": self.error_count,
+        }
+
+
+class TransferPacer:
+    """Pacing of one transfer on a shared ``AdaptivePacer``.
+
+    Errors of this transfer back off only its own delay, so one bad file
+    or a blip on one DC does not slow down the others. FloodWaits and
+    rate limit tokens still go through the shared pacer.
+    """
+
+    def __init__(self, pacer: AdaptivePacer):
+        self.pacer = pacer
+        self.delay: float = 0
+
+    async def wait(self):
+        """Sleep for the shared cooldown or delay, or this transfer's delay"""
+        await self.pacer.wait(self.delay)
+
+    def on_success(self):
+        """A chunk went through, relax both delays"""
+        self.pacer.on_success()
+        if self.delay:
+            self.delay = self.pacer.relax(self.delay)
+
+    def on_flood_wait(self, seconds: float):
+        """Telegram asked us to wait ``seconds``, every transfer cools down"""
+        self.pacer.on_flood_wait(seconds)
+
+    def on_error(self):
+        """This transfer failed for another reason"""
+        self.pacer.on_error()
+        self.delay = self.pacer.grow(self.delay)
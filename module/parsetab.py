@@ -0,0 +1,54 @@
+
+# parsetab.py
+# This file is automatically generated. Do not edit.
+# pylint: disable=W,C,R
+_tabversion = '3.10'
+
+_lr_method = 'LALR'
+
+_lr_signature = 'leftLORORleftLANDANDleftEQNEnonassoc><GELEleft+-left*/rightUMINUSAND BYTE EQ GE LAND LE LOR NAME NE NUMBER OR RESTRING STRING TIMEstatement : NAME "=" expressionstatement : expressionexpression : expression \'+\' expression\n        | expression \'-\' expression\n        | expression \'*\' expression\n        | expression \'/\' expressionexpression : expression \'>\' expression\n        | expression \'<\' expressionexpression : \'-\' expression %prec UMINUSexpression : expression GE expressionexpression : expression LE expressionexpression : expression EQ expressionexpression : expression NE expressionexpression : \'(\' expression \')\'expression : NUMBERexpression : TIMEexpression : BYTEexpression : NAMEexpression : expression LOR expressionexpression : expression LAND expressionexpression : expression OR expressionexpression : expression AND expressionexpression : STRINGexpression : RESTRING'
+    
+_lr_action_items = {'NAME':([0,4,5,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,],[2,27,27,27,27,27,27,27,27,27,27,27,27,27,27,27,27,27,]),'-':([0,2,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[4,-18,13,4,4,-15,-16,-17,-23,-24,4,4,4,4,4,4,4,4,4,4,4,4,4,4,4,-9,-18,13,13,-3,-4,-5,-6,13,13,13,13,13,13,13,13,13,13,-14,]),'(':([0,4,5,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,],[5,5,5,5,5,5,5,5,5,5,5,5,5,5,5,5,5,5,]),'NUMBER':([0,4,5,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,],[6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,]),'TIME':([0,4,5,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,],[7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,]),'BYTE':([0,4,5,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,],[8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,]),'STRING':([0,4,5,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,],[9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,]),'RESTRING':([0,4,5,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,],[10,10,10,10,10,10,10,10,10,10,10,10,10,10,10,10,10,10,]),'$end':([1,2,3,6,7,8,9,10,26,27,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[0,-18,-2,-15,-16,-17,-23,-24,-9,-18,-1,-3,-4,-5,-6,-7,-8,-10,-11,-12,-13,-19,-20,-21,-22,-14,]),'=':([2,],[11,]),'+':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,12,-15,-16,-17,-23,-24,-9,-18,12,12,-3,-4,-5,-6,12,12,12,12,12,12,12,12,12,12,-14,]),'*':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,14,-15,-16,-17,-23,-24,-9,-18,14,14,14,14,-5,-6,14,14,14,14,14,14,14,14,14,14,-14,]),'/':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,15,-15,-16,-17,-23,-24,-9,-18,15,15,15,15,-5,-6,15,15,15,15,15,15,15,15,15,15,-14,]),'>':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,16,-15,-16,-17,-23,-24,-9,-18,16,16,-3,-4,-5,-6,None,None,None,None,16,16,16,16,16,16,-14,]),'<':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,17,-15,-16,-17,-23,-24,-9,-18,17,17,-3,-4,-5,-6,None,None,None,None,17,17,17,17,17,17,-14,]),'GE':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,18,-15,-16,-17,-23,-24,-9,-18,18,18,-3,-4,-5,-6,None,None,None,None,18,18,18,18,18,18,-14,]),'LE':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,19,-15,-16,-17,-23,-24,-9,-18,19,19,-3,-4,-5,-6,None,None,None,None,19,19,19,19,19,19,-14,]),'EQ':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,20,-15,-16,-17,-23,-24,-9,-18,20,20,-3,-4,-5,-6,-7,-8,-10,-11,-12,-13,20,20,20,20,-14,]),'NE':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,21,-15,-16,-17,-23,-24,-9,-18,21,21,-3,-4,-5,-6,-7,-8,-10,-11,-12,-13,21,21,21,21,-14,]),'LOR':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,22,-15,-16,-17,-23,-24,-9,-18,22,22,-3,-4,-5,-6,-7,-8,-10,-11,-12,-13,-19,-20,-21,-22,-14,]),'LAND':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,23,-15,-16,-17,-23,-24,-9,-18,23,23,-3,-4,-5,-6,-7,-8,-10,-11,-12,-13,23,-20,23,-22,-14,]),'OR':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,24,-15,-16,-17,-23,-24,-9,-18,24,24,-3,-4,-5,-6,-7,-8,-10,-11,-12,-13,-19,-20,-21,-22,-14,]),'AND':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,25,-15,-16,-17,-23,-24,-9,-18,25,25,-3,-4,-5,-6,-7,-8,-10,-11,-12,-13,25,-20,25,-22,-14,]),')':([6,7,8,9,10,26,27,28,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-15,-16,-17,-23,-24,-9,-18,44,-3,-4,-5,-6,-7,-8,-10,-11,-12,-13,-19,-20,-21,-22,-14,]),}
+
+_lr_action = {}
+for _k, _v in _lr_action_items.items():
+   for _x,_y in zip(_v[0],_v[1]):
+      if not _x in _lr_action:  _lr_action[_x] = {}
+      _lr_action[_x][_k] = _y
+del _lr_action_items
+
+_lr_goto_items = {'statement':([0,],[1,]),'expression':([0,4,5,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,],[3,26,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,]),}
+
+_lr_goto = {}
+for _k, _v in _lr_goto_items.items():
+   for _x, _y in zip(_v[0], _v[1]):
+       if not _x in _lr_goto: _lr_goto[_x] = {}
+       _lr_goto[_x][_k] = _y
+del _lr_goto_items
+_lr_productions = [
+  ("S' -> statement","S'",1,None,None,None),
+  ('statement -> NAME = expression','statement',3,'p_statement_assign','filter.py',134),
+  ('statement -> expression','statement',1,'p_statement_expr','filter.py',139),
+  ('expression -> expression + expression','expression',3,'p_expression_binop','filter.py',144),
+  ('expression -> expression - expression','expression',3,'p_expression_binop','filter.py',145),
+  ('expression -> expression * expression','expression',3,'p_expression_binop','filter.py',146),
+  ('expression -> expression / expression','expression',3,'p_expression_binop','filter.py',147),
+  ('expression -> expression > expression','expression',3,'p_expression_comp','filter.py',166),
+  ('expression -> expression < expression','expression',3,'p_expression_comp','filter.py',167),
+  ('expression -> - expression','expression',2,'p_expression_uminus','filter.py',182),
+  ('expression -> expression GE expression','expression',3,'p_expression_ge','filter.py',186),
+  ('expression -> expression LE expression','expression',3,'p_expression_le','filter.py',200),
+  ('expression -> expression EQ expression','expression',3,'p_expression_eq','filter.py',214),
+  ('expression -> expression NE expression','expression',3,'p_expression_ne','filter.py',241),
+  ('expression -> ( expression )','expression',3,'p_expression_group','filter.py',267),
+  ('expression -> NUMBER','expression',1,'p_expression_number','filter.py',271),
+  ('expression -> TIME','expression',1,'p_expression_time','filter.py',275),
+  ('expression -> BYTE','expression',1,'p_expression_byte','filter.py',279),
+  ('expression -> NAME','expression',1,'p_expression_name','filter.py',283),
+  ('expression -> expression LOR expression','expression',3,'p_expression_lor','filter.py',293),
+  ('expression -> expression LAND expression','expression',3,'p_expression_land','filter.py',297),
+  ('expression -> expression OR expression','expression',3,'p_expression_or','filter.py',301),
+  ('expression -> expression AND expression','expression',3,'p_expression_and','filter.py',305),
+  ('expression -> STRING','expression',1,'p_expression_string','filter.py',309),
+  ('expression -> RESTRING','expression',1,'p_expression_restring','filter.py',313),
+]
@@ -0,0 +1,369 @@
+"""Bounded store of the download progress"""
+
+import itertools
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Hashable, Iterator, List, Optional, Tuple
+
+# a speed sample covers at least this many seconds
+_SAMPLE_SECONDS = 1.0
+
+
+class TransferProgress:
+    """Progress of one file"""
+
+    __slots__ = (
+        "chat_id",
+        "message_id",
+        "task_id",
+        "file_name",
+        "total_size",
+        "down_byte",
+        "start_time",
+        "end_time",
+        "speed",
+        "state",
+        "seq",
+        "version",
+        "_sample_byte",
+        "_sample_time",
+    )
+
+    def __init__(
+        self,
+        chat_id: Hashable,
+        message_id: int,
+        task_id: int,
+        file_name: str,
+        total_size: int,
+        start_time: float,
+        seq: int = 0,
+    ):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.task_id = task_id
+        self.file_name = file_name
+        self.total_size = total_size
+        self.down_byte = 0
+        self.start_time = start_time
+        self.end_time = start_time
+        self.speed = 0.0
+        self.state = "downloading"
+        self.seq = seq
+        self.version = 0
+        self._sample_byte = 0
+        self._sample_time = start_time
+
+    @property
+    def is_finished(self) -> bool:
+        """If every byte arrived"""
+        return self.down_byte >= self.total_size
+
+    @property
+    def progress(self) -> float:
+        """Percent done"""
+        if not self.total_size:
+            return 100.0
+        return round(self.down_byte / self.total_size * 100, 1)
+
+    def to_dict(self) -> dict:
+        """Record as plain dict"""
+        return {
+            "chat_id": self.chat_id,
+            "message_id": self.message_id,
+            "task_id": self.task_id,
+            "file_name": self.file_name,
+            "total_size": self.total_size,
+            "down_byte": self.down_byte,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "download_speed": int(self.speed),
+            "progress": self.progress,
+            "state": self.state,
+            "seq": self.seq,
+        }
+
+
+class ProgressAggregate:
+    """Counters of a chat or a task, kept up to date on every update"""
+
+    __slots__ = ("active", "finished", "failed", "down_byte", "speed")
+
+    def __init__(self):
+        self.active = 0
+        self.finished = 0
+        self.failed = 0
+        self.down_byte = 0
+        self.speed = 0.0
+
+    def to_dict(self) -> dict:
+        """Aggregate as plain dict"""
+        return {
+            "active": self.active,
+            "finished": self.finished,
+            "failed": self.failed,
+            "down_byte": self.down_byte,
+            "download_speed": int(max(self.speed, 0)),
+        }
+
+
+class ProgressStore:
+    """Progress of the active downloads and a ring of the recent ones.
+
+    Only transfers in flight live in the active table. A finished, failed
+    or stalled transfer moves into a ring of ``history_size`` entries, so
+    memory depends on the number of concurrent downloads, not on uptime.
+    Speeds are EWMAs over samples of at least one second, ``alpha`` is the
+    weight of the newest sample. Per chat and per task aggregates are
+    updated with every change, readers never walk all transfers. At most
+    ``max_tasks`` task aggregates are kept, the oldest idle ones go first.
+
+    Every change stamps the record with a new store ``version`` and moves
+    it to the end of a change log, so ``changes_since`` returns what
+    changed after a version in O(changes). Records keep the creation
+    ``seq`` that ``page`` uses as a stable cursor.
+    """
+
+    # pylint: disable = R0902
+    def __init__(
+        self,
+        history_size: int = 200,
+        alpha: float = 0.3,
+        stale_seconds: float = 600,
+        max_tasks: int = 1000,
+    ):
+        self.alpha = alpha
+        self.stale_seconds = stale_seconds
+        self.max_tasks = max_tasks
+        self._active: Dict[Tuple[Hashable, int], TransferProgress] = {}
+        self._history: Deque[TransferProgress] = deque(maxlen=history_size)
+        self._chats: Dict[Hashable, ProgressAggregate] = {}
+        self._tasks: "OrderedDict[int, ProgressAggregate]" = OrderedDict()
+        self.total = ProgressAggregate()
+        self._total_sample_byte = 0
+        self._total_sample_time: Optional[float] = None
+        self._last_evict: float = 0
+        self._seq = itertools.count(1)
+        self.version = 0
+        self._changes: "OrderedDict[Tuple[Hashable, int], TransferProgress]" = (
+            OrderedDict()
+        )
+        self._trimmed_version = 0
+
+    def _ewma(self, old: float, sample: float, first: bool) -> float:
+        if first:
+            return sample
+        return self.alpha * sample + (1 - self.alpha) * old
+
+    def _aggregates(self, record: TransferProgress) -> List[ProgressAggregate]:
+        chat = self._chats.get(record.chat_id)
+        if chat is None:
+            chat = self._chats[record.chat_id] = ProgressAggregate()
+        task = self._tasks.get(record.task_id)
+        if task is None:
+            task = self._tasks[record.task_id] = ProgressAggregate()
+            self._trim_tasks()
+        else:
+            self._tasks.move_to_end(record.task_id)
+        return [chat, task]
+
+    def _trim_tasks(self):
+        while len(self._tasks) > self.max_tasks:
+            for task_id, task in self._tasks.items():
+                if not task.active:
+                    del self._tasks[task_id]
+                    break
+            else:
+                return
+
+    def update(
+        self,
+        chat_id: Hashable,
+        message_id: int,
+        down_byte: int,
+        total_size: int,
+        file_name: str,
+        start_time: float,
+        task_id: int = 0,
+        now: Optional[float] = None,
+    ) -> TransferProgress:
+        """Record that ``down_byte`` bytes of a file arrived"""
+        if now is None:
+            now = time.time()
+        key = (chat_id, message_id)
+        record = self._active.get(key)
+        aggregates = None
+        if record is None:
+            record = self._active[key] = TransferProgress(
+                chat_id,
+                message_id,
+                task_id,
+                file_name,
+                total_size,
+                start_time,
+                next(self._seq),
+            )
+            aggregates = self._aggregates(record)
+            for aggregate in aggregates:
+                aggregate.active += 1
+            self.total.active += 1
+
+        delta = down_byte - record.down_byte
+        record.down_byte = down_byte
+        record.end_time = now
+
+        old_speed = record.speed
+        elapsed = now - record._sample_time
+        if elapsed >= _SAMPLE_SECONDS:
+            sample = max(down_byte - record._sample_byte, 0) / elapsed
+            record.speed = self._ewma(record.speed, sample, record._sample_byte == 0)
+            record._sample_byte = down_byte
+            record._sample_time = now
+
+        if delta or record.speed != old_speed:
+            for aggregate in aggregates or self._aggregates(record):
+                aggregate.down_byte += delta
+                aggregate.speed += record.speed - old_speed
+            self.total.down_byte += delta
+        self._sample_total(now)
+
+        if record.is_finished:
+            self._finish(key, "done")
+        else:
+            self._touch(key, record)
+        self._evict_stale(now)
+        return record
+
+    def _touch(self, key: Tuple[Hashable, int], record: TransferProgress):
+        self.version += 1
+        record.version = self.version
+        self._changes[key] = record
+        self._changes.move_to_end(key)
+        limit = len(self._active) + (self._history.maxlen or 0)
+        while len(self._changes) > limit:
+            _, oldest = self._changes.popitem(last=False)
+            self._trimmed_version = max(self._trimmed_version, oldest.version)
+
+    def _sample_total(self, now: float):
+        if self._total_sample_time is None:
+            self._total_sample_time = now
+        elapsed = now - self._total_sample_time
+        if elapsed >= _SAMPLE_SECONDS:
+            sample = max(self.total.down_byte - self._total_sample_byte, 0) / elapsed
+            self.total.speed = self._ewma(self.total.speed, sample, False)
+            self._total_sample_byte = self.total.down_byte
+            self._total_sample_time = now
+
+    def finish(self, chat_id: Hashable, message_id: int, state: str = "done"):
+        """Move a transfer into the recent history"""
+        self._finish((chat_id, message_id), state)
+
+    def _finish(self, key: Tuple[Hashable, int], state: str):
+        record = self._active.pop(key, None)
+        if record is None:
+            return
+        record.state = state
+        for aggregate in self._aggregates(record):
+            aggregate.active -= 1
+            aggregate.speed -= record.speed
+            if state == "done":
+                aggregate.finished += 1
+            else:
+                aggregate.failed += 1
+        self.total.active -= 1
+        if state == "done":
+            self.total.finished += 1
+        else:
+            self.total.failed += 1
+        record.speed = 0
+        self._history.append(record)
+        self._touch(key, record)
+
+    def _evict_stale(self, now: float):
+        if now - self._last_evict < self.stale_seconds / 10:
+            return
+        self._last_evict = now
+        stale = [
+            key
+            for key, record in self._active.items()
+            if now - record.end_time > self.stale_seconds
+        ]
+        for key in stale:
+            self._finish(key, "stalled")
+
+    def get(self, chat_id: Hashable, message_id: int) -> Optional[TransferProgress]:
+        """Record of a transfer in flight"""
+        return self._active.get((chat_id, message_id))
+
+    def active(
+        self, chat_id: Hashable = None, task_id: Optional[int] = None
+    ) -> Iterator[TransferProgress]:
+        """Transfers in flight, optionally of one chat or task"""
+        for record in list(self._active.values()):
+            if chat_id is not None and record.chat_id != chat_id:
+                continue
+            if task_id is not None and record.task_id != task_id:
+                continue
+            yield record
+
+    def recent(self) -> List[TransferProgress]:
+        """Recently finished transfers, newest last"""
+        return list(self._history)
+
+    def page(
+        self,
+        cursor: int = 0,
+        limit: int = 50,
+        chat_id: Hashable = None,
+        task_id: Optional[int] = None,
+        state: Optional[str] = None,
+    ) -> Tuple[List[TransferProgress], Optional[int]]:
+        """Active and recent transfers in creation order after ``cursor``
+
+        Returns the records and the cursor of the next page, None on the last.
+        """
+        records = list(self._active.values()) + list(self._history)
+        records = [
+            record
+            for record in records
+            if record.seq > cursor
+            and (chat_id is None or str(record.chat_id) == str(chat_id))
+            and (task_id is None or record.task_id == task_id)
+            and (state is None or record.state == state)
+        ]
+        records.sort(key=lambda record: record.seq)
+        if len(records) > limit:
+            return records[:limit], records[limit - 1].seq
+        return records, None
+
+    def changes_since(
+        self, version: int
+    ) -> Tuple[Optional[List[TransferProgress]], int]:
+        """Records changed after ``version``, oldest change first, and the current version
+
+        Returns None instead of the records if changes after ``version``
+        were already dropped, the caller has to start over from ``page``.
+        """
+        if version < self._trimmed_version:
+            return None, self.version
+        changes = []
+        for record in reversed(self._changes.values()):
+            if record.version <= version:
+                break
+            changes.append(record)
+        changes.reverse()
+        return changes, self.version
+
+    def chat_stats(self) -> Dict[Hashable, dict]:
+        """Aggregate of every chat"""
+        return {chat_id: value.to_dict() for chat_id, value in self._chats.items()}
+
+    def task_stats(self, task_id: int) -> Optional[dict]:
+        """Aggregate of one task"""
+        task = self._tasks.get(task_id)
+        return task.to_dict() if task else None
+
+    @property
+    def total_speed(self) -> int:
+        """EWMA of the bytes per second of all downloads"""
+        return int(max(self.total.speed, 0))
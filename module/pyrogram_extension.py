@@ -25,6 +25,7 @@ from pyrogram.file_id import (
 )
 from pyrogram.mime_types import mime_types
 
+from module import metrics
 from module.app import (
     Application,
     CloudDriveUploadStat,
@@ -34,8 +35,13 @@ from module.app import (
     UploadProgressStat,
     UploadStatus,
 )
-from module.download_stat import get_download_result
+from module.download_stat import (
+    finish_upload_status,
+    get_progress_store,
+    update_upload_status,
+)
 from module.language import Language, _t
+from module.rate_limiter import get_rate_limiter
 from module.send_media_group_v2 import cache_media, send_media_group_v2
 from utils.format import (
     create_progress_bar,
@@ -55,6 +61,13 @@ def reset_download_cache():
     _download_cache.store.clear()
 
 
+def set_download_cache_status(
+    chat_id: Union[int, str], message_id: int, status: DownloadStatus
+):
+    """Record the final status of a download finalized in the background"""
+    _download_cache[(chat_id, message_id)] = status
+
+
 def _guess_mime_type(filename: str) -> Optional[str]:
     """Guess mime type"""
     return _mimetypes.guess_type(filename)[0]
@@ -305,7 +318,8 @@ async def upload_telegram_chat_message(
             )
             break
         except pyrogram.errors.exceptions.flood_420.FloodWait as wait_err:
-            await asyncio.sleep(wait_err.value * 2)
+            # 所有转发一起冷却 下次wait时等待
+            get_rate_limiter().on_flood_wait("forward", wait_err.value)
             logger.warning(
                 "Upload Message[{}]: FlowWait {}", message.id, wait_err.value
             )
@@ -639,6 +653,7 @@ async def forward_multi_media(
 
     if not node.media_group_ids[message.media_group_id][message.id]:
         node.upload_status[message.id] = UploadStatus.Uploading
+        upload_start_time = time.time()
         try:
             ui_file_name = file_name
             if file_name:
@@ -673,7 +688,15 @@ async def forward_multi_media(
             if file_name and message.video and media_obj.thumb:
                 os.remove(str(media_obj.thumb))
 
-        if node.upload_status[message.id] == UploadStatus.FailedUpload:
+        failed = node.upload_status[message.id] == UploadStatus.FailedUpload
+        if file_name:
+            metrics.UPLOAD_FILE_SECONDS.observe(
+                time.time() - upload_start_time,
+                target="telegram",
+                result="failed" if failed else "success",
+            )
+        if failed:
+            finish_upload_status(node, message.id, "failed")
             return ForwardStatus.FailedForward
 
         node.media_group_ids[message.media_group_id][message.id] = _media
@@ -726,7 +749,9 @@ async def proc_cache_forward(
         message_thread_id = node.reply_to_message.message_thread_id
         business_connection_id = node.reply_to_message.business_connection_id
         upload_telegram_chat_id = node.reply_to_message.chat.id
-    if not await send_media_group_v2(
+    if not await get_rate_limiter().call(
+        "send",
+        send_media_group_v2,
         client,
         upload_telegram_chat_id,  # type: ignore
         multi_media,
@@ -874,31 +899,23 @@ async def _report_bot_status(
             )
 
         download_result_str = ""
-        download_result = get_download_result()
-        if node.chat_id in download_result:
-            messages = download_result[node.chat_id]
-            for idx, value in messages.items():
-                task_id = value["task_id"]
-                if task_id != node.task_id or value["down_byte"] == value["total_size"]:
-                    continue
-
-                temp_file_name = truncate_filename(
-                    os.path.basename(value["file_name"]), 10
-                )
-                progress = int(value["down_byte"] / value["total_size"] * 100)
-                download_result_str += (
-                    f" ├─ 🆔 {_t('Message ID')}: {idx}\n"
-                    f" │   ├─ 📁 : {temp_file_name}\n"
-                    f" │   ├─ 📏 : {format_byte(value['total_size'])}\n"
-                    f" │   ├─ ⏬ : {format_byte(value['download_speed'])}/s\n"
-                    f" │   └─ 📊 : [{create_progress_bar(progress)}]"
-                    f" ({progress}%)\n"
-                )
+        # 只遍历本任务进行中的下载
+        for value in get_progress_store().active(task_id=node.task_id):
+            temp_file_name = truncate_filename(os.path.basename(value.file_name), 10)
+            progress = int(value.progress)
+            download_result_str += (
+                f" ├─ 🆔 {_t('Message ID')}: {value.message_id}\n"
+                f" │   ├─ 📁 : {temp_file_name}\n"
+                f" │   ├─ 📏 : {format_byte(value.total_size)}\n"
+                f" │   ├─ ⏬ : {format_byte(value.speed)}/s\n"
+                f" │   └─ 📊 : [{create_progress_bar(progress)}]"
+                f" ({progress}%)\n"
+            )
 
-            if download_result_str:
-                download_result_str = (
-                    f"\n📥 {_t('Download Progresses')}:\n" + download_result_str
-                )
+        if download_result_str:
+            download_result_str = (
+                f"\n📥 {_t('Download Progresses')}:\n" + download_result_str
+            )
 
         upload_result_str = ""
         for idx, value in node.upload_stat_dict.items():
@@ -1153,6 +1170,8 @@ async def update_upload_stat(
 
     # TODO(tyh): web control upload stop
 
+    update_upload_status(upload_size, total_size, message_id, file_name, start_time, node)
+
     if node.upload_stat_dict.get(message_id):
         upload_stat = node.upload_stat_dict[message_id]
 
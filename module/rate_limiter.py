@@ -0,0 +1,253 @@
+"""Shared rate limits of the Telegram calls, by method class"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+import pyrogram
+
+from module import metrics
+
+RATE_CLASSES = ["history", "file", "send", "forward"]
+
+# calls counted for the observed rate
+_RATE_WINDOW = 60.0
+# fewer calls than this are too few to learn a rate from
+_MIN_LEARN_CALLS = 10
+
+
+class TokenBucket:
+    """Token bucket of one method class that learns from FloodWait.
+
+    ``rate`` tokens per second up to ``burst`` are handed out, ``0`` means no
+    limit. Every caller reserves its slot up front and sleeps exactly until
+    then, nobody polls. A FloodWait starts a cooldown that every caller of
+    the class waits out together, empties the bucket and halves the rate.
+    An unlimited class takes half of the rate observed before the FloodWait,
+    if it made enough calls to tell, otherwise it only cools down.
+    The rate at the FloodWait becomes the learned ceiling, successful calls
+    raise the rate again by 5% of it up to 90% of the ceiling.
+    """
+
+    # pylint: disable = R0902
+    def __init__(self, name: str, rate: float = 0, burst: int = 1):
+        self.name = name
+        self.rate = rate
+        self.max_rate = rate
+        self.ceiling: float = 0
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self.cooldown_until: float = 0
+        self._window_start = self._updated
+        self._window_calls = 0
+        self._prev_window_calls = -1
+        self.calls = 0
+        self.wait_seconds: float = 0
+        self.flood_wait_count = 0
+        self.flood_wait_seconds: float = 0
+
+    def configure(self, rate: float, burst: Optional[int] = None):
+        """Set the configured rate, forgets what was learned"""
+        self.rate = rate
+        self.max_rate = rate
+        self.ceiling = 0
+        if burst is not None:
+            self.burst = max(1, burst)
+            self.tokens = min(self.tokens, self.burst)
+
+    def _refill(self, now: float):
+        if now > self._updated:
+            if self.rate > 0:
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self._updated) * self.rate
+                )
+            self._updated = now
+
+    def _count(self, now: float):
+        if now - self._window_start >= _RATE_WINDOW:
+            self._window_start = now
+            self._prev_window_calls = self._window_calls
+            self._window_calls = 0
+        self._window_calls += 1
+        self.calls += 1
+
+    def reserve(self) -> float:
+        """Take a token, returns how long to wait before the call"""
+        now = time.monotonic()
+        self._count(now)
+        self._refill(now)
+        delay = max(0, self.cooldown_until - now)
+        if self.rate > 0:
+            self.tokens -= 1
+            if self.tokens < 0:
+                # the bucket refills from _updated on, which is after a cooldown
+                delay = max(delay, self._updated - now - self.tokens / self.rate)
+        return delay
+
+    async def acquire(self, is_cancelled: Optional[Callable[[], bool]] = None) -> bool:
+        """Wait for a token and for the cooldown of the class
+
+        With ``is_cancelled`` the wait is given up once it returns True,
+        then False is returned.
+        """
+        delay = self.reserve()
+        deadline = time.monotonic() + delay
+        while delay > 0:
+            sleep_time = min(delay, 1) if is_cancelled else delay
+            self.wait_seconds += sleep_time
+            await asyncio.sleep(sleep_time)
+            if is_cancelled and is_cancelled():
+                return False
+            # a FloodWait while sleeping extends the wait of everyone
+            now = time.monotonic()
+            delay = max(deadline, self.cooldown_until) - now
+        return True
+
+    def _observed(self) -> Tuple[int, float]:
+        elapsed = time.monotonic() - self._window_start
+        if self._prev_window_calls < 0:
+            return self._window_calls, max(elapsed, 1.0)
+        return self._prev_window_calls + self._window_calls, _RATE_WINDOW + elapsed
+
+    def observed_rate(self) -> float:
+        """Calls per second over the last one or two windows"""
+        calls, seconds = self._observed()
+        return calls / seconds
+
+    def on_flood_wait(self, seconds: float):
+        """Telegram asked to wait ``seconds`` before the next call of the class"""
+        now = time.monotonic()
+        self.flood_wait_count += 1
+        self.flood_wait_seconds += seconds
+        if self.rate <= 0 and self._observed()[0] >= _MIN_LEARN_CALLS:
+            self.rate = self.observed_rate()
+        if self.rate > 0:
+            self.ceiling = (
+                self.rate if not self.ceiling else min(self.ceiling, self.rate)
+            )
+            self.rate = max(self.rate / 2, 1 / 60)
+        self.cooldown_until = max(self.cooldown_until, now + seconds)
+        self.tokens = 0
+        self._updated = max(self._updated, self.cooldown_until)
+
+    def on_success(self):
+        """A call went through, recover the rate after a FloodWait"""
+        if not self.ceiling:
+            return
+        limit = self.ceiling * 0.9
+        if self.max_rate:
+            limit = min(limit, self.max_rate)
+        if self.rate < limit:
+            self.rate = min(limit, self.rate + self.ceiling * 0.05)
+
+    def get_state(self) -> dict:
+        """Current state for the metrics"""
+        return {
+            "rate": round(self.rate, 3),
+            "configured_rate": round(self.max_rate, 3),
+            "learned_ceiling": round(self.ceiling, 3),
+            "tokens": round(max(self.tokens, 0), 3),
+            "cooldown": round(max(0, self.cooldown_until - time.monotonic()), 3),
+            "calls": self.calls,
+            "wait_seconds": round(self.wait_seconds, 3),
+            "flood_wait_count": self.flood_wait_count,
+            "flood_wait_seconds": self.flood_wait_seconds,
+        }
+
+
+class RateLimiter:
+    """One ``TokenBucket`` per method class"""
+
+    def __init__(self):
+        self.buckets: Dict[str, TokenBucket] = {
+            name: TokenBucket(name) for name in RATE_CLASSES
+        }
+
+    def bucket(self, name: str) -> TokenBucket:
+        """Bucket of the class ``name``, created on first use"""
+        bucket = self.buckets.get(name)
+        if bucket is None:
+            bucket = self.buckets[name] = TokenBucket(name)
+        return bucket
+
+    async def acquire(
+        self, name: str, is_cancelled: Optional[Callable[[], bool]] = None
+    ) -> bool:
+        """See ``TokenBucket.acquire``"""
+        return await self.bucket(name).acquire(is_cancelled)
+
+    def on_flood_wait(self, name: str, seconds: float):
+        """See ``TokenBucket.on_flood_wait``"""
+        self.bucket(name).on_flood_wait(seconds)
+
+    async def call(
+        self,
+        name: str,
+        func: Callable[..., Awaitable],
+        *args,
+        max_attempts: int = 3,
+        **kwargs
+    ):
+        """Call ``func`` within the limits of ``name``, FloodWaits are retried"""
+        bucket = self.bucket(name)
+        for attempt in range(1, max_attempts + 1):
+            await bucket.acquire()
+            try:
+                result = await func(*args, **kwargs)
+            except pyrogram.errors.FloodWait as wait_err:
+                bucket.on_flood_wait(wait_err.value)
+                if attempt == max_attempts:
+                    raise
+                continue
+            bucket.on_success()
+            return result
+        return None
+
+    def get_state(self) -> Dict[str, dict]:
+        """State of every bucket"""
+        return {name: bucket.get_state() for name, bucket in self.buckets.items()}
+
+
+_rate_limiter = RateLimiter()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """The rate limiter shared by every Telegram call"""
+    return _rate_limiter
+
+
+def get_rate_limit_state() -> Dict[str, dict]:
+    """State of the shared rate limiter"""
+    return _rate_limiter.get_state()
+
+
+def _collect_bucket_stat(key: str) -> metrics.CallbackSamples:
+    for name, bucket in _rate_limiter.buckets.items():
+        yield {"method_class": name}, getattr(bucket, key)
+
+
+metrics.REGISTRY.callback(
+    "tdl_flood_wait",
+    "FloodWait errors per method class",
+    "counter",
+    lambda: _collect_bucket_stat("flood_wait_count"),
+)
+metrics.REGISTRY.callback(
+    "tdl_flood_wait_seconds",
+    "Seconds Telegram asked to wait per method class",
+    "counter",
+    lambda: _collect_bucket_stat("flood_wait_seconds"),
+)
+metrics.REGISTRY.callback(
+    "tdl_rate_limit_wait_seconds",
+    "Seconds callers waited for a token or a cooldown per method class",
+    "counter",
+    lambda: _collect_bucket_stat("wait_seconds"),
+)
+metrics.REGISTRY.callback(
+    "tdl_rate_limit_rate",
+    "Current calls per second of the method class, 0 is unlimited",
+    "gauge",
+    lambda: _collect_bucket_stat("rate"),
+)
@@ -0,0 +1,55 @@
+"""Checkpoint of a chat history scanned in parallel segments"""
+
+from typing import List, Tuple
+
+
+def split_segments(low: int, high: int, count: int) -> List[Tuple[int, int]]:
+    """Cut the inclusive id range ``[low, high]`` into ``count`` disjoint ranges"""
+    if high < low:
+        return []
+    count = max(1, min(count, high - low + 1))
+    size, rest = divmod(high - low + 1, count)
+    segments = []
+    start = low
+    for idx in range(count):
+        end = start + size - 1 + (1 if idx < rest else 0)
+        segments.append((start, end))
+        start = end + 1
+    return segments
+
+
+class ScanWatermark:
+    """Highest message id below which the whole history has been scanned.
+
+    The segments are scanned concurrently and in ascending order each, so
+    the contiguous scanned prefix is the range of every finished leading
+    segment plus the progress of the first unfinished one. Saving that value
+    as ``last_read_message_id`` never skips a message of a segment that was
+    interrupted.
+    """
+
+    def __init__(self, segments: List[Tuple[int, int]]):
+        self.segments = segments
+        self._progress = [low - 1 for low, _ in segments]
+        self._done = [False] * len(segments)
+        self._first_open = 0
+
+    def advance(self, idx: int, message_id: int):
+        """Every message of segment ``idx`` up to ``message_id`` is handled"""
+        self._progress[idx] = max(self._progress[idx], message_id)
+
+    def finish(self, idx: int):
+        """Segment ``idx`` is scanned completely"""
+        self._done[idx] = True
+        self._progress[idx] = self.segments[idx][1]
+
+    @property
+    def value(self) -> int:
+        """The contiguous watermark"""
+        idx = self._first_open
+        while idx < len(self.segments) and self._done[idx]:
+            idx += 1
+        self._first_open = idx
+        if idx == len(self.segments):
+            return self.segments[-1][1]
+        return self._progress[idx]
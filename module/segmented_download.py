@@ -0,0 +1,128 @@
+"""Segmented multi-connection download for large media"""
+
+import asyncio
+import math
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import pyrogram
+
+CHUNK_SIZE = 1024 * 1024
+
+# a segment smaller than this is not worth its own connection
+MIN_SEGMENT_CHUNKS = 4
+
+_global_segment_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def set_max_download_segments(max_download_segments: int):
+    """Set the number of segments allowed in flight across all files"""
+    # pylint: disable = W0603
+    global _global_segment_semaphore
+    _global_segment_semaphore = asyncio.Semaphore(max(1, max_download_segments))
+
+
+def get_missing_size(ranges: List[Tuple[int, int]], media_size: int) -> int:
+    """Bytes covered by the chunk ranges ``[(start, end), ...]``"""
+    size = 0
+    for start, end in ranges:
+        size += max(0, min(media_size, (end + 1) * CHUNK_SIZE) - start * CHUNK_SIZE)
+    return size
+
+
+def split_ranges(
+    ranges: List[Tuple[int, int]],
+    max_segments: int,
+    min_segment_chunks: int = MIN_SEGMENT_CHUNKS,
+) -> List[Tuple[int, int]]:
+    """Split missing chunk ranges into disjoint segments.
+
+    Parameters
+    ----------
+    ranges: List[Tuple[int, int]]
+        Inclusive chunk index ranges, see ``find_missing_files``
+
+    max_segments: int
+        How many segments of one file may be fetched at the same time
+
+    min_segment_chunks: int
+        Never cut a range into pieces shorter than this
+
+    Returns
+    -------
+    List[Tuple[int, int]]
+        Inclusive chunk index ranges, in file order
+    """
+    total = sum(end - start + 1 for start, end in ranges)
+    if not total:
+        return []
+
+    segment_chunks = max(min_segment_chunks, math.ceil(total / max(1, max_segments)))
+
+    segments = []
+    for start, end in ranges:
+        while start <= end:
+            segment_end = min(end, start + segment_chunks - 1)
+            segments.append((start, segment_end))
+            start = segment_end + 1
+    return segments
+
+
+async def _fetch_segment(
+    client: pyrogram.Client,
+    message: pyrogram.types.Message,
+    segment: Tuple[int, int],
+    on_chunk: Callable[[int, bytes], Awaitable],
+    file_semaphore: asyncio.Semaphore,
+):
+    """Stream one segment, handing every chunk to ``on_chunk``"""
+    start, end = segment
+    async with file_semaphore:
+        if _global_segment_semaphore:
+            await _global_segment_semaphore.acquire()
+        try:
+            chunk_idx = start
+            async for chunk in client.stream_media(
+                message, offset=start, limit=end - start + 1
+            ):
+                await on_chunk(chunk_idx, chunk)
+                chunk_idx += 1
+        finally:
+            if _global_segment_semaphore:
+                _global_segment_semaphore.release()
+
+
+async def download_segments(
+    client: pyrogram.Client,
+    message: pyrogram.types.Message,
+    ranges: List[Tuple[int, int]],
+    on_chunk: Callable[[int, bytes], Awaitable],
+    max_segments: int,
+):
+    """Fetch the missing chunk ranges of one file over several connections.
+
+    ``on_chunk(chunk_idx, chunk)`` is awaited for every received chunk, chunks
+    of different segments arrive interleaved. The first failing segment cancels
+    the others and its exception is raised, chunks already handed out are kept
+    so the caller can resume from what is still missing.
+    """
+    segments = split_ranges(ranges, max_segments)
+    if not segments:
+        return
+
+    file_semaphore = asyncio.Semaphore(max(1, max_segments))
+    tasks = [
+        asyncio.ensure_future(
+            _fetch_segment(client, message, segment, on_chunk, file_semaphore)
+        )
+        for segment in segments
+    ]
+
+    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    for task in done:
+        if not task.cancelled() and task.exception():
+            raise task.exception()  # type: ignore
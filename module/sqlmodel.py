@@ -1,9 +1,13 @@
+import contextlib
 import math
 import os
 from enum import Enum
 from peewee import *
 from datetime import datetime
 from loguru import logger
+from module import db_migration
+from module.db_writer import DBWriter
+from module.dedup_index import DedupIndex, DedupRecord
 from utils.format_addon import string_similar, string_sequence, process_string
 import re
 
@@ -16,6 +20,62 @@ source_db = os.path.join(os.path.abspath("."), "downloaded.db")
 db = SqliteDatabase(source_db)
 db.execute_sql('PRAGMA journal_mode=WAL;')
 
+# 去重候选索引 启用后get_similar_files不再做全表GLOB扫描
+_dedup_index: DedupIndex = None
+
+# 后台批量写库 启用后insert_into_db只登记 由写库线程合并提交
+_db_writer: DBWriter = None
+
+# (chat_id, message_id) 唯一索引建好后才能用 ON CONFLICT 批量写入
+_upsert_ready = False
+# 每条语句的行数 避免超出SQLite的变量个数上限
+_UPSERT_ROWS = 50
+
+
+def _to_row(dictit: dict) -> dict:
+    return {
+        'chat_id': dictit['chat_id'],
+        'message_id': dictit['message_id'],
+        'filename': dictit['filename'],
+        'caption': dictit['caption'],
+        'title': dictit['title'],
+        'mime_type': dictit['mime_type'],
+        'media_size': dictit['media_size'],
+        'media_duration': dictit['media_duration'],
+        'media_addtime': dictit['media_addtime'],
+        'chat_username': dictit['chat_username'] or '',
+        'chat_title': dictit['chat_title'],
+        'addtime': datetime.now().strftime("%Y-%m-%d %H:%M"),
+        'msg_type': dictit['msg_type'],
+        'msg_link': dictit['msg_link'],
+        'status': dictit['status'],
+    }
+
+
+def _write_rows(rows: list):
+    """一个事务写入一批记录 已存在的更新 不存在的插入"""
+    if _upsert_ready:
+        preserve = [field for field in Downloaded._meta.sorted_fields
+                    if field.name not in ('id', 'chat_id', 'message_id')]
+        with db.atomic():
+            for i in range(0, len(rows), _UPSERT_ROWS):
+                Downloaded.insert_many(rows[i:i + _UPSERT_ROWS]).on_conflict(
+                    conflict_target=[Downloaded.chat_id, Downloaded.message_id], preserve=preserve).execute()
+        return
+
+    with db.atomic():
+        for row in rows:
+            updated = Downloaded.update(**row).where(Downloaded.chat_id == row['chat_id'],
+                                                     Downloaded.message_id == row['message_id']).execute()
+            if not updated:
+                Downloaded.insert(**row).execute()
+
+
+def _flush_writes():
+    """直接读写数据库前先把未提交的记录写入"""
+    if _db_writer is not None:
+        _db_writer.flush(timeout=30)
+
 class UnknownField(object):
     def __init__(self, *_, **__): pass
 
@@ -119,9 +179,61 @@ class Downloaded(BaseModel):
     class Meta:
         table_name = 'Downloaded'
 
+    def save(self, *args, **kwargs):
+        rows = super().save(*args, **kwargs)
+        if _dedup_index is not None and self.id is not None:
+            _dedup_index.add(self.to_dedup_record())
+        return rows
+
+    def to_dedup_record(self) -> DedupRecord:
+        return DedupRecord(self.id, self.chat_id, self.message_id, self.filename, self.title, self.mime_type,
+                           self.msg_type, self.media_size, self.media_duration, self.status)
+
+    def migrate_db(self) -> int:
+        """建表并执行未应用的结构迁移 返回迁移后的版本"""
+        global _upsert_ready
+        if db.autoconnect == False:
+            db.connect()
+        db.create_tables([Downloaded], safe=True)
+        version = db_migration.migrate(Downloaded._meta.database)
+        _upsert_ready = version >= 1
+        return version
+
+    def optimize_db(self):
+        """让SQLite按需更新统计信息"""
+        db_migration.optimize(Downloaded._meta.database)
+
+    def start_writer(self, batch_size: int = 200, flush_interval: float = 1.0):
+        """启用后台批量写库"""
+        global _db_writer
+        if _db_writer is None:
+            _db_writer = DBWriter(_write_rows, batch_size, flush_interval)
+            _db_writer.start()
+
+    def stop_writer(self):
+        """把未提交的记录全部写入并停止写库线程"""
+        global _db_writer
+        if _db_writer is not None:
+            _db_writer.stop()
+            _db_writer = None
+
+    def load_dedup_index(self):
+        """把全部记录载入内存去重索引 之后的写入会增量更新"""
+        global _dedup_index
+        if db.autoconnect == False:
+            db.connect()
+        index = DedupIndex()
+        index.load(Downloaded.select(Downloaded.id, Downloaded.chat_id, Downloaded.message_id, Downloaded.filename,
+                                     Downloaded.title, Downloaded.mime_type, Downloaded.msg_type,
+                                     Downloaded.media_size, Downloaded.media_duration,
+                                     Downloaded.status).tuples().iterator())
+        _dedup_index = index
+        return len(index)
+
     def getMsg(self, chat_id: str, message_id: int, status = 1):
         if db.autoconnect == False:
             db.connect()
+        _flush_writes()
         try:
             downloaded = Downloaded.get(Downloaded.chat_id == chat_id,
                                         Downloaded.message_id == message_id, Downloaded.status == status)
@@ -164,6 +276,10 @@ class Downloaded(BaseModel):
     def getStatus(self, chat_id: int, message_id: int, chat_username = None ):
         if db.autoconnect == False:
             db.connect()
+        if chat_id and _db_writer is not None:
+            pending = _db_writer.get_pending((chat_id, message_id))
+            if pending:
+                return pending['status']
         if chat_id:
             try:
                 downloaded = Downloaded.get(chat_id=chat_id, message_id=message_id)
@@ -179,7 +295,52 @@ class Downloaded(BaseModel):
                         return 0
         return 0 #0为不存在 1未已完成 2为下载中 3 暂时未使用 4为等效已下载
 
+    def get_status_batch(self, chat_id: int, message_ids: list, batch_size: int = 500) -> dict:
+        """一次IN查询取回一页消息的状态 返回{message_id: status} 不存在的不在结果中"""
+        if db.autoconnect == False:
+            db.connect()
+        status = {}
+        message_ids = list(message_ids)
+        for i in range(0, len(message_ids), batch_size):
+            rows = Downloaded.select(Downloaded.message_id, Downloaded.status).where(
+                Downloaded.chat_id == chat_id, Downloaded.message_id.in_(message_ids[i:i + batch_size])).order_by(
+                Downloaded.id.desc()).tuples()
+            for message_id, msg_status in rows:
+                status[message_id] = msg_status  # 有重复记录时与getStatus一样取最早的一条
+        if _db_writer is not None:
+            for message_id in message_ids:
+                pending = _db_writer.get_pending((chat_id, message_id))
+                if pending:
+                    status[message_id] = pending['status']
+        return status
+
+    def atomic(self):
+        """把多次写入合并成一个事务 后台写库时写入本就是批量提交的"""
+        if _db_writer is not None and _db_writer.is_running:
+            return contextlib.nullcontext()
+        return db.atomic()
+
     def insert_into_db(self, media_dict: dict):
+        if media_dict.get('chat_id') is None or media_dict.get('message_id') is None:
+            # 元数据读取失败时是空的 不能入库
+            logger.warning(f"skip saving message without chat_id or message_id: {media_dict}")
+            return
+        if _db_writer is not None and _db_writer.is_running:
+            try:
+                # 只登记 同一条消息的多次状态变化合并成一次写入
+                row = _to_row(media_dict)
+                _db_writer.submit((row['chat_id'], row['message_id']), row)
+                if _dedup_index is not None:
+                    _dedup_index.add(DedupRecord(None, row['chat_id'], row['message_id'], row['filename'],
+                                                 row['title'], row['mime_type'], row['msg_type'], row['media_size'],
+                                                 row['media_duration'], row['status']))
+            except Exception as e:
+                # pylint: disable = C0301
+                logger.error(
+                    f"[{e}].",
+                    exc_info=True,
+                )
+            return
         try:
             db_status = self.getStatus(chat_id=media_dict.get('chat_id'), message_id=media_dict.get('message_id'))
             if db_status == 0:  # 不存在记录则插入
@@ -320,6 +481,8 @@ class Downloaded(BaseModel):
         similar_file_list = []
         if db.autoconnect == False:
             db.connect()
+        if _dedup_index is None:  # 没有索引时直接查库 需要先写入未提交的记录
+            _flush_writes()
         try:
             if status is None or len(status) == 0:
                 status_acc= [1] #只找完成下载的
@@ -344,7 +507,12 @@ class Downloaded(BaseModel):
 
             file_core_name = re.sub(r"[-_~～]", ' ', msgdict.get('title', ''))
 
-            if file_core_name and len(file_core_name) >= 4:
+            if _dedup_index is not None:
+                segments = file_core_name.split(' ') if len(file_core_name) >= 4 else None
+                downloaded = _dedup_index.find_candidates(msgdict.get('mime_type'), msgdict.get('msg_type'),
+                                                          msgdict.get('media_size'), (media_size_1, media_size_2),
+                                                          segments, status_acc)
+            elif file_core_name and len(file_core_name) >= 4:
                 result2 = Downloaded.select().where(Downloaded.mime_type == msgdict.get('mime_type'),
                                                     (Downloaded.filename % f'*{file_core_name.replace(" ", "*")}*' | Downloaded.title % f'*{file_core_name.replace(" ", "*")}*'),
                                                     Downloaded.media_size.between(
@@ -396,6 +564,7 @@ class Downloaded(BaseModel):
         chat_username_qry = chat_username
         if db.autoconnect == False:
             db.connect()
+        _flush_writes()
         try:
             select_str = Downloaded.select(fn.Max(Downloaded.message_id)).where(
                 Downloaded.chat_username == chat_username, Downloaded.status == 1)
@@ -415,28 +584,40 @@ class Downloaded(BaseModel):
                 exc_info=True,
             )
 
+    def get_retry_ids_page(self, chat_id: int, chat_username: str, after_id: int = None,
+                           page_size: int = 1000) -> list:
+        """一个聊天下载中的消息id 按message_id升序的一页
+
+        以上一页最后的id after_id 为游标(键集分页) 每页都走 (STATUS, CHAT_ID, CHAT_USERNAME, MESSAGE_ID) 索引
+        调用方逐页读取 不会把整个聊天的id一次读进内存
+        """
+        if db.autoconnect == False:
+            db.connect()
+        if after_id is None:
+            _flush_writes()
+        query = Downloaded.select(Downloaded.message_id).where(
+            Downloaded.status == 2, Downloaded.chat_id == chat_id,
+            Downloaded.chat_username == chat_username, Downloaded.message_id.is_null(False))
+        if after_id is not None:
+            query = query.where(Downloaded.message_id > after_id)
+        return [row[0] for row in query.order_by(Downloaded.message_id).limit(page_size).tuples()]
+
     def load_retry_msg_from_db(self):
+        """有下载中消息的聊天 消息id由下载时用 get_retry_ids_page 逐页读取"""
         if db.autoconnect == False:
             db.connect()
+        _flush_writes()
         try:
-            retry_ids = Downloaded.select(Downloaded.chat_id,Downloaded.chat_username,
-                                          fn.GROUP_CONCAT(Downloaded.message_id).alias('retry_ids')).where(
-                Downloaded.status == 2).group_by(
-                Downloaded.chat_id, Downloaded.chat_username)
+            retry_chats = Downloaded.select(Downloaded.chat_id, Downloaded.chat_username).where(
+                Downloaded.status == 2).distinct().tuples()
 
             dicts = []
-            if retry_ids:
-                for retry in retry_ids:
-                    retryIds_str = str(retry.retry_ids).split(',')
-                    retryIds = []
-                    for retryId in retryIds_str:
-                        retryIds.append(int(retryId))
-                    dictit = {
-                        'chat_id': retry.chat_id,
-                        'chat_username' : retry.chat_username,
-                        'ids_to_retry': set(retryIds)
-                    }
-                    dicts.append(dictit)
+            for chat_id, chat_username in list(retry_chats):
+                dictit = {
+                    'chat_id': chat_id,
+                    'chat_username': chat_username,
+                }
+                dicts.append(dictit)
             # db.close()
             return dicts
         except DoesNotExist:
@@ -454,6 +635,7 @@ class Downloaded(BaseModel):
             return False
         if db.autoconnect == False:
             db.connect()
+        _flush_writes()
         for msg_id in retry_msg_ids:
             try:
                 downloaded = Downloaded.get(Downloaded.chat_username==retry_chat_username, Downloaded.message_id==int(msg_id))
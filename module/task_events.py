@@ -0,0 +1,60 @@
+"""Wake-ups for coroutines waiting on download and task state"""
+
+import asyncio
+from typing import Callable, Optional, Set
+
+
+class StateSignal:
+    """Condition variable for state kept in plain attributes.
+
+    Whoever changes the state calls ``notify``, waiters re-check their
+    predicate then, so nobody sleeps in a polling loop. ``notify`` may be
+    called from another thread (the web server), the wake-up is handed to
+    the loop of the waiters.
+    """
+
+    def __init__(self):
+        self._waiters: Set[asyncio.Future] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _wake(self):
+        waiters, self._waiters = self._waiters, set()
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def notify(self):
+        """The state changed, let every waiter check its predicate"""
+        loop = self._loop
+        if loop is None or not self._waiters:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._wake()
+        elif not loop.is_closed():
+            loop.call_soon_threadsafe(self._wake)
+
+    async def wait_for(self, predicate: Callable[[], bool]):
+        """Wait until ``predicate()`` is true"""
+        while not predicate():
+            self._loop = asyncio.get_running_loop()
+            waiter = self._loop.create_future()
+            self._waiters.add(waiter)
+            try:
+                await waiter
+            finally:
+                self._waiters.discard(waiter)
+
+    @property
+    def waiters(self) -> int:
+        """Number of waiting coroutines"""
+        return len(self._waiters)
+
+
+# pause/resume of the downloads and stopped tasks
+download_state_changed = StateSignal()
+# task progress: finished downloads, stopped or added tasks, finished scans
+task_progress_changed = StateSignal()
@@ -1,27 +1,40 @@
 """web ui for media download"""
 
-import logging
+import asyncio
+import json
 import os
-import threading
+from functools import wraps
 
 from flask import Flask, jsonify, render_template, request
-from flask_login import LoginManager, UserMixin, login_required, login_user
+from flask_login import (
+    LoginManager,
+    UserMixin,
+    current_user,
+    login_required,
+    login_user,
+)
 
 import utils
 from module.app import Application
+from module.async_db import get_db_stats
+from module.chat_scan_scheduler import get_chat_scan_progress
 from module.download_stat import (
     DownloadState,
-    get_download_result,
+    get_download_pacing,
     get_download_state,
+    get_progress_store,
     get_total_download_speed,
+    get_total_upload_speed,
     set_download_state,
 )
+from module.metrics import CONTENT_TYPE, get_metrics_text
+from module.progress_store import TransferProgress
+from module.rate_limiter import get_rate_limit_state
+from module.web_server import AsyncWebServer, Handler, Request, Response
 from utils.crypto import AesBase64
+from utils.file_merge import get_merge_stats
 from utils.format import format_byte
 
-log = logging.getLogger("werkzeug")
-log.setLevel(logging.ERROR)
-
 _flask_app = Flask(__name__)
 
 _flask_app.secret_key = "tdl"
@@ -29,6 +42,7 @@ _login_manager = LoginManager()
 _login_manager.login_view = "login"
 _login_manager.init_app(_flask_app)
 web_login_users: dict = {}
+_web_server = AsyncWebServer(_flask_app)
 deAesCrypt = AesBase64("1234123412ABCDEF", "ABCDEF1234123412")
 
 
@@ -60,23 +74,18 @@ def get_flask_app() -> Flask:
     return _flask_app
 
 
-def run_web_server(app: Application):
-    """
-    Runs a web server using the Flask framework.
-    """
-
-    get_flask_app().run(
-        app.web_host, app.web_port, debug=app.debug_web, use_reloader=False
-    )
+def get_web_server() -> AsyncWebServer:
+    """get web server instance"""
+    return _web_server
 
 
 # pylint: disable = W0603
 def init_web(app: Application):
     """
-    Set the value of the users variable.
+    Set the value of the users variable and start serving on ``app.loop``.
 
     Args:
-        users: The list of users to set.
+        app: The application whose web settings are used.
 
     Returns:
         None.
@@ -86,12 +95,36 @@ def init_web(app: Application):
         web_login_users = {"root": app.web_login_secret}
     else:
         _flask_app.config["LOGIN_DISABLED"] = True
-    if app.debug_web:
-        threading.Thread(target=run_web_server, args=(app,)).start()
-    else:
-        threading.Thread(
-            target=get_flask_app().run, daemon=True, args=(app.web_host, app.web_port)
-        ).start()
+    _flask_app.debug = app.debug_web
+    app.loop.run_until_complete(_web_server.start(app.web_host, app.web_port))
+
+
+async def stop_web():
+    """Stop the web server"""
+    await _web_server.stop()
+
+
+def _is_authorized(req: Request, allow_token: bool = False) -> bool:
+    """If the login session of ``req`` (or its bearer token) is valid"""
+    if _flask_app.config.get("LOGIN_DISABLED"):
+        return True
+    secret = web_login_users.get("root")
+    if allow_token and secret and req.headers.get("authorization") == f"Bearer {secret}":
+        return True
+    with _flask_app.request_context(req.environ(_web_server.host, _web_server.port)):
+        return current_user.is_authenticated
+
+
+def _login_required(handler: Handler) -> Handler:
+    """Async counterpart of ``login_required``, answers 401 instead of redirecting"""
+
+    @wraps(handler)
+    async def _handler(req: Request) -> Response:
+        if not _is_authorized(req):
+            return Response.json({"error": "unauthorized"}, 401)
+        return await handler(req)
+
+    return _handler
 
 
 @_flask_app.route("/login", methods=["GET", "POST"])
@@ -143,80 +176,218 @@ def index():
     )
 
 
-@_flask_app.route("/get_download_status")
-@login_required
-def get_download_speed():
+@_flask_app.route("/get_app_version")
+def get_app_version():
+    """Get telegram_media_downloader version"""
+    return utils.__version__
+
+
+@_web_server.route("/get_download_status")
+@_login_required
+async def get_download_speed(_: Request) -> Response:
     """Get download speed"""
-    return (
-        '{ "download_speed" : "'
-        + format_byte(get_total_download_speed())
-        + '/s" , "upload_speed" : "0.00 B/s" } '
+    return Response.json(
+        {
+            "download_speed": format_byte(get_total_download_speed()) + "/s",
+            "upload_speed": format_byte(get_total_upload_speed()) + "/s",
+            "pacing": get_download_pacing(),
+            "merge": get_merge_stats(),
+            "db": get_db_stats(),
+            "scan": get_chat_scan_progress(),
+            "rate_limit": get_rate_limit_state(),
+        }
     )
 
 
-@_flask_app.route("/set_download_state", methods=["POST"])
-@login_required
-def web_set_download_state():
+@_web_server.route("/metrics")
+async def get_metrics(req: Request) -> Response:
+    """Metrics in the Prometheus text format
+
+    With a web login secret a scraper authenticates with
+    ``Authorization: Bearer <web_login_secret>`` instead of a session.
+    """
+    if not _is_authorized(req, allow_token=True):
+        return Response("unauthorized\n", 401)
+    return Response(get_metrics_text(), content_type=CONTENT_TYPE)
+
+
+@_web_server.route("/set_download_state", methods=("POST",))
+@_login_required
+async def web_set_download_state(req: Request) -> Response:
     """Set download state"""
-    state = request.args.get("state")
+    state = req.args.get("state")
 
     if state == "continue" and get_download_state() is DownloadState.StopDownload:
         set_download_state(DownloadState.Downloading)
-        return "pause"
+        return Response("pause")
 
     if state == "pause" and get_download_state() is DownloadState.Downloading:
         set_download_state(DownloadState.StopDownload)
-        return "continue"
+        return Response("continue")
 
-    return state
+    return Response(state or "")
 
 
-@_flask_app.route("/get_app_version")
-def get_app_version():
-    """Get telegram_media_downloader version"""
-    return utils.__version__
+def _download_list_item(value: TransferProgress) -> dict:
+    return {
+        "chat": str(value.chat_id),
+        "id": str(value.message_id),
+        "filename": os.path.basename(value.file_name),
+        "total_size": format_byte(value.total_size),
+        "download_progress": str(value.progress),
+        "download_speed": format_byte(value.speed) + "/s",
+        "save_path": value.file_name.replace("\\", "/"),
+    }
 
 
-@_flask_app.route("/get_download_list")
-@login_required
-def get_download_list():
+@_web_server.route("/get_download_list")
+@_login_required
+async def get_download_list(req: Request) -> Response:
     """get download list"""
-    if request.args.get("already_down") is None:
-        return "[]"
+    if req.args.get("already_down") is None:
+        return Response.json([])
+
+    already_down = req.args.get("already_down") == "true"
+
+    progress_store = get_progress_store()
+    records = [value for value in progress_store.recent() if value.state == "done"]
+    if not already_down:
+        records = list(progress_store.active()) + records
 
-    already_down = request.args.get("already_down") == "true"
+    return Response.json([_download_list_item(value) for value in records])
 
-    download_result = get_download_result()
-    result = "["
-    for chat_id, messages in download_result.items():
-        for idx, value in messages.items():
-            is_already_down = value["down_byte"] == value["total_size"]
 
-            if already_down and not is_already_down:
+_API_MAX_LIMIT = 500
+_STREAM_KEEPALIVE = 15
+
+
+def _progress_filters(req: Request) -> dict:
+    """chat, task_id and state filters of the request"""
+    task_id = req.args.get("task_id")
+    return {
+        "chat_id": req.args.get("chat") or None,
+        "task_id": int(task_id) if task_id else None,
+        "state": req.args.get("state") or None,
+    }
+
+
+def _match(record: TransferProgress, chat_id, task_id, state) -> bool:
+    return (
+        (chat_id is None or str(record.chat_id) == chat_id)
+        and (task_id is None or record.task_id == task_id)
+        and (state is None or record.state == state)
+    )
+
+
+def _progress_item(record: TransferProgress) -> dict:
+    item = record.to_dict()
+    item["chat_id"] = str(record.chat_id)
+    item["file_name"] = os.path.basename(record.file_name)
+    item["save_path"] = record.file_name.replace("\\", "/")
+    return item
+
+
+@_web_server.route("/api/v1/downloads")
+@_login_required
+async def api_downloads(req: Request) -> Response:
+    """Active and recently finished downloads, one page after ``cursor``
+
+    Query: ``chat``, ``task_id``, ``state`` filter, ``limit`` (at most
+    500) and ``cursor`` (``next_cursor`` of the previous page). ``version``
+    can be passed as ``since`` to ``/api/v1/downloads/stream``.
+    """
+    try:
+        filters = _progress_filters(req)
+        cursor = int(req.args.get("cursor") or 0)
+        limit = min(max(int(req.args.get("limit") or 100), 1), _API_MAX_LIMIT)
+    except ValueError:
+        return Response.json({"error": "cursor, limit and task_id must be integers"}, 400)
+
+    progress_store = get_progress_store()
+    version = progress_store.version
+    records, next_cursor = progress_store.page(cursor, limit, **filters)
+    return Response.json(
+        {
+            "items": [_progress_item(record) for record in records],
+            "next_cursor": next_cursor,
+            "version": version,
+            "download_speed": get_total_download_speed(),
+            "upload_speed": get_total_upload_speed(),
+        }
+    )
+
+
+def _sse(event: str, data: dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+@_web_server.route("/api/v1/downloads/stream")
+@_login_required
+async def api_downloads_stream(req: Request) -> Response:
+    """Server-sent events with the downloads that changed
+
+    A ``snapshot`` event carries every matching download, unless ``since``
+    names the ``version`` of a page already loaded. Then every ``tick``
+    seconds (default 1) a ``delta`` event carries the downloads that
+    changed since the previous event, finished ones included with their
+    final state. ``snapshot`` is sent again if the client fell too far
+    behind for a delta.
+    """
+    try:
+        filters = _progress_filters(req)
+        since = req.args.get("since")
+        version = int(since) if since else None
+        tick = min(max(float(req.args.get("tick") or 1), 0.2), 60)
+    except ValueError:
+        return Response.json({"error": "since, tick and task_id must be numbers"}, 400)
+
+    progress_store = get_progress_store()
+
+    def _snapshot():
+        records, _ = progress_store.page(0, _API_MAX_LIMIT * 10, **filters)
+        return progress_store.version, _sse(
+            "snapshot",
+            {
+                "version": progress_store.version,
+                "items": [_progress_item(record) for record in records],
+            },
+        )
+
+    async def _events():
+        nonlocal version
+        if version is None:
+            version, event = _snapshot()
+            yield event
+        idle = 0.0
+        while True:
+            await asyncio.sleep(tick)
+            changes, cur_version = progress_store.changes_since(version)
+            if changes is None:
+                version, event = _snapshot()
+                yield event
+                idle = 0
                 continue
 
-            if result != "[":
-                result += ","
-            download_speed = format_byte(value["download_speed"]) + "/s"
-            result += (
-                '{ "chat":"'
-                + f"{chat_id}"
-                + '", "id":"'
-                + f"{idx}"
-                + '", "filename":"'
-                + os.path.basename(value["file_name"])
-                + '", "total_size":"'
-                + f'{format_byte(value["total_size"])}'
-                + '" ,"download_progress":"'
-            )
-            result += (
-                f'{round(value["down_byte"] / value["total_size"] * 100, 1)}'
-                + '" ,"download_speed":"'
-                + download_speed
-                + '" ,"save_path":"'
-                + value["file_name"].replace("\\", "/")
-                + '"}'
-            )
-
-    result += "]"
-    return result
+            version = cur_version
+            items = [_progress_item(record) for record in changes if _match(record, **filters)]
+            if items:
+                yield _sse(
+                    "delta",
+                    {
+                        "version": version,
+                        "items": items,
+                        "download_speed": get_total_download_speed(),
+                    },
+                )
+                idle = 0
+            else:
+                idle += tick
+                if idle >= _STREAM_KEEPALIVE:
+                    yield b": keepalive\n\n"
+                    idle = 0
+
+    return Response(
+        _events(),
+        content_type="text/event-stream",
+        headers=[("Cache-Control", "no-cache"), ("X-Accel-Buffering", "no")],
+    )
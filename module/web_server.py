@@ -0,0 +1,295 @@
+"""HTTP/1.1 server on the asyncio loop of the downloader"""
+
+import asyncio
+import io
+import json
+import sys
+from http import HTTPStatus
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from loguru import logger
+
+# request line and headers
+_MAX_HEADER_SIZE = 64 * 1024
+_MAX_BODY_SIZE = 1024 * 1024
+_KEEP_ALIVE_TIMEOUT = 60
+
+
+class Request:
+    """Parsed request"""
+
+    __slots__ = ("method", "path", "query_string", "args", "headers", "body", "remote")
+
+    def __init__(
+        self,
+        method: str,
+        target: str,
+        headers: Dict[str, str],
+        body: bytes = b"",
+        remote: Tuple[str, int] = ("", 0),
+    ):
+        url = urlsplit(target)
+        self.method = method
+        self.path = unquote(url.path) or "/"
+        self.query_string = url.query
+        self.args = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.headers = headers
+        self.body = body
+        self.remote = remote
+
+    def environ(self, server_name: str = "localhost", server_port: int = 80) -> dict:
+        """WSGI environ of the request"""
+        environ = {
+            "REQUEST_METHOD": self.method,
+            "SCRIPT_NAME": "",
+            "PATH_INFO": self.path,
+            "QUERY_STRING": self.query_string,
+            "SERVER_NAME": server_name,
+            "SERVER_PORT": str(server_port),
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "REMOTE_ADDR": self.remote[0] if self.remote else "",
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(self.body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": False,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for name, value in self.headers.items():
+            key = name.upper().replace("-", "_")
+            if key in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+                environ[key] = value
+            else:
+                environ["HTTP_" + key] = value
+        return environ
+
+
+class Response:
+    """Response, ``body`` is bytes or an async iterator of chunks to stream"""
+
+    __slots__ = ("status", "headers", "body")
+
+    def __init__(
+        self,
+        body: Union[bytes, str, AsyncIterator[bytes]] = b"",
+        status: int = 200,
+        content_type: str = "text/plain; charset=utf-8",
+        headers: Optional[List[Tuple[str, str]]] = None,
+    ):
+        self.status = status
+        self.headers = [("Content-Type", content_type)] + (headers or [])
+        self.body = body.encode() if isinstance(body, str) else body
+
+    @classmethod
+    def json(cls, data, status: int = 200) -> "Response":
+        """JSON response"""
+        return cls(json.dumps(data), status, "application/json")
+
+    @property
+    def is_stream(self) -> bool:
+        """If the body is streamed"""
+        return not isinstance(self.body, bytes)
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+def _status_line(status: Union[int, str]) -> bytes:
+    if isinstance(status, str):
+        return f"HTTP/1.1 {status}\r\n".encode()
+    try:
+        phrase = HTTPStatus(status).phrase
+    except ValueError:
+        phrase = ""
+    return f"HTTP/1.1 {status} {phrase}\r\n".encode()
+
+
+def _header_block(headers: List[Tuple[str, str]]) -> bytes:
+    return "".join(f"{name}: {value}\r\n" for name, value in headers).encode() + b"\r\n"
+
+
+class AsyncWebServer:
+    """Serves async handlers and a WSGI app from the event loop.
+
+    Every request is handled on the loop of the downloader, so handlers
+    read the progress store, the scheduler and the download state without
+    another thread racing them, and can await coroutines of that loop.
+    Routes registered with ``route`` run as coroutines, any other path is
+    passed to ``wsgi_app`` (pages, login and static files), which runs
+    inline and must not block. Connections are kept alive, a streamed
+    response (server-sent events) owns its connection until the client
+    leaves.
+    """
+
+    def __init__(self, wsgi_app: Optional[Callable] = None):
+        self.wsgi_app = wsgi_app
+        self.routes: Dict[Tuple[str, str], Handler] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: set = set()
+        self.host = ""
+        self.port = 0
+
+    def route(self, path: str, methods: Tuple[str, ...] = ("GET",)):
+        """Register the decorated coroutine for ``path``"""
+
+        def _decorator(handler: Handler) -> Handler:
+            for method in methods:
+                self.routes[(method, path)] = handler
+            return handler
+
+        return _decorator
+
+    async def start(self, host: str, port: int):
+        """Listen on ``host:port``"""
+        self._server = await asyncio.start_server(
+            self._handle_connection, host, port, limit=_MAX_HEADER_SIZE
+        )
+        self.host = host
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """Stop listening and drop the open connections"""
+        if self._server is None:
+            return
+        self._server.close()
+        for task in list(self._connections):
+            task.cancel()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _read_request(
+        self, reader: asyncio.StreamReader, remote
+    ) -> Optional[Request]:
+        try:
+            head = await asyncio.wait_for(
+                reader.readuntil(b"\r\n\r\n"), _KEEP_ALIVE_TIMEOUT
+            )
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            return None
+        lines = head.decode("latin-1").split("\r\n")
+        method, target, _ = lines[0].split(" ", 2)
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length") or 0)
+        if length > _MAX_BODY_SIZE:
+            raise ValueError("request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return Request(method, target, headers, body, remote)
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        remote = writer.get_extra_info("peername")
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader, remote)
+                except (
+                    ValueError,
+                    asyncio.LimitOverrunError,
+                    asyncio.IncompleteReadError,
+                ):
+                    writer.write(
+                        _status_line(400) + _header_block([("Connection", "close")])
+                    )
+                    break
+                if request is None:
+                    break
+                response = await self.dispatch(request)
+                keep_alive = request.headers.get("connection", "").lower() != "close"
+                if not await self._write_response(
+                    writer, request, response, keep_alive
+                ):
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def dispatch(self, request: Request) -> Response:
+        """Response of the handler of ``request``"""
+        handler = self.routes.get((request.method, request.path))
+        try:
+            if handler is not None:
+                return await handler(request)
+            if self.wsgi_app is not None:
+                return self._call_wsgi(request)
+            return Response("not found\n", 404)
+        except Exception as e:
+            logger.exception(f"web request {request.method} {request.path} failed: {e}")
+            return Response("internal server error\n", 500)
+
+    def _call_wsgi(self, request: Request) -> Response:
+        result: dict = {}
+
+        def _start_response(status: str, headers: list, exc_info=None):
+            result["status"] = status
+            result["headers"] = headers
+
+        assert self.wsgi_app is not None
+        environ = request.environ(self.host or "localhost", self.port)
+        chunks = self.wsgi_app(environ, _start_response)
+        try:
+            body = b"".join(chunks)
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+        response = Response(body)
+        response.status = result["status"]
+        response.headers = [
+            (name, value)
+            for name, value in result["headers"]
+            if name.lower() not in ("content-length", "connection", "transfer-encoding")
+        ]
+        return response
+
+    async def _write_response(
+        self,
+        writer: asyncio.StreamWriter,
+        request: Request,
+        response: Response,
+        keep_alive: bool,
+    ) -> bool:
+        """Send ``response``, returns if the connection can be reused"""
+        body = response.body
+        if isinstance(body, bytes):
+            headers = response.headers + [
+                ("Content-Length", str(len(body))),
+                ("Connection", "keep-alive" if keep_alive else "close"),
+            ]
+            writer.write(_status_line(response.status) + _header_block(headers))
+            if request.method != "HEAD":
+                writer.write(body)
+            await writer.drain()
+            return keep_alive
+
+        writer.write(
+            _status_line(response.status)
+            + _header_block(response.headers + [("Connection", "close")])
+        )
+        try:
+            async for chunk in body:
+                writer.write(chunk)
+                await writer.drain()
+        finally:
+            aclose = getattr(body, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        return False
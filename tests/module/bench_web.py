@@ -0,0 +1,186 @@
+"""Load benchmark of the web server running on the download loop.
+
+Simulated download workers update the progress store on the loop that
+also serves the web UI, while dashboard clients in another process poll
+``/get_download_status`` and ``/api/v1/downloads`` once per second and
+hold ``/api/v1/downloads/stream`` connections. The workers' progress rate
+and the lateness of their wake-ups are measured without and with the
+clients, so the cost of the web layer to the downloads is visible.
+
+    python tests/module/bench_web.py --clients 200 --streams 50 --seconds 10
+"""
+import argparse
+import asyncio
+import multiprocessing
+import sys
+import time
+
+sys.path.append(".")  # run from the repository root
+sys.path.append("..")
+from module.download_stat import get_progress_store
+from module.web import get_flask_app, get_web_server
+
+_WORKER_INTERVAL = 0.005
+_FILE_SIZE = 1024 * 1024 * 1024
+_CHUNK_SIZE = 1024 * 1024
+
+
+def _percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def _read_response(reader: asyncio.StreamReader) -> bytes:
+    head = await reader.readuntil(b"\r\n\r\n")
+    length = 0
+    for line in head.split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":")[1])
+    return await reader.readexactly(length)
+
+
+async def _poller(port: int, seconds: float, latencies: list, errors: list):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    deadline = time.monotonic() + seconds
+    try:
+        while time.monotonic() < deadline:
+            for path in ("/get_download_status", "/api/v1/downloads?limit=100"):
+                start = time.perf_counter()
+                writer.write(f"GET {path} HTTP/1.1\r\nHost: bench\r\n\r\n".encode())
+                await _read_response(reader)
+                latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(1)
+    except (ConnectionError, asyncio.IncompleteReadError) as e:
+        errors.append(str(e))
+    finally:
+        writer.close()
+
+
+async def _streamer(port: int, seconds: float, events: list, errors: list):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /api/v1/downloads/stream HTTP/1.1\r\nHost: bench\r\n\r\n")
+    deadline = time.monotonic() + seconds
+    try:
+        await reader.readuntil(b"\r\n\r\n")
+        while time.monotonic() < deadline:
+            line = await asyncio.wait_for(reader.readline(), max(deadline - time.monotonic(), 0.1))
+            if line.startswith(b"event:"):
+                events.append(line)
+    except asyncio.TimeoutError:
+        pass
+    except (ConnectionError, asyncio.IncompleteReadError) as e:
+        errors.append(str(e))
+    finally:
+        writer.close()
+
+
+def _run_clients(port: int, clients: int, streams: int, seconds: float, result_queue):
+    async def _main():
+        latencies: list = []
+        events: list = []
+        errors: list = []
+        await asyncio.gather(
+            *[_poller(port, seconds, latencies, errors) for _ in range(clients)],
+            *[_streamer(port, seconds, events, errors) for _ in range(streams)],
+        )
+        return latencies, len(events), errors
+
+    result_queue.put(asyncio.run(_main()))
+
+
+async def _download_worker(idx: int, stop: asyncio.Event, lags: list, counter: list):
+    store = get_progress_store()
+    message_id = 0
+    down_byte = _FILE_SIZE
+    start_time = time.time()
+    while not stop.is_set():
+        if down_byte >= _FILE_SIZE:
+            message_id += 1
+            down_byte = 0
+            start_time = time.time()
+        expected = time.perf_counter() + _WORKER_INTERVAL
+        await asyncio.sleep(_WORKER_INTERVAL)
+        lags.append(time.perf_counter() - expected)
+        down_byte += _CHUNK_SIZE
+        store.update("bench", idx * 1000000 + message_id, down_byte, _FILE_SIZE, "bench.mp4", start_time, 1)
+        counter[0] += 1
+
+
+async def _measure(workers: int, seconds: float) -> dict:
+    stop = asyncio.Event()
+    lags: list = []
+    counter = [0]
+    tasks = [asyncio.create_task(_download_worker(idx, stop, lags, counter)) for idx in range(workers)]
+    await asyncio.sleep(seconds)
+    stop.set()
+    await asyncio.gather(*tasks)
+    return {
+        "updates_per_second": counter[0] / seconds,
+        "lag_p50_ms": _percentile(lags, 50) * 1000,
+        "lag_p99_ms": _percentile(lags, 99) * 1000,
+    }
+
+
+async def _bench(args) -> dict:
+    get_flask_app().config["LOGIN_DISABLED"] = True
+    server = get_web_server()
+    await server.start("127.0.0.1", 0)
+    try:
+        baseline = await _measure(args.workers, args.seconds)
+
+        result_queue = multiprocessing.get_context("spawn").Queue()
+        process = multiprocessing.get_context("spawn").Process(
+            target=_run_clients,
+            args=(server.port, args.clients, args.streams, args.seconds, result_queue),
+        )
+        process.start()
+        # let the clients connect before measuring
+        await asyncio.sleep(1)
+        loaded = await _measure(args.workers, args.seconds - 1)
+        latencies, events, errors = await asyncio.get_running_loop().run_in_executor(
+            None, result_queue.get
+        )
+        process.join()
+    finally:
+        await server.stop()
+
+    return {
+        "baseline": baseline,
+        "loaded": loaded,
+        "requests": len(latencies),
+        "requests_per_second": len(latencies) / args.seconds,
+        "latency_p50_ms": _percentile(latencies, 50) * 1000,
+        "latency_p99_ms": _percentile(latencies, 99) * 1000,
+        "stream_events": events,
+        "errors": len(errors),
+    }
+
+
+def main():
+    """Run the benchmark and print the results"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--clients", type=int, default=200, help="polling dashboard clients")
+    parser.add_argument("--streams", type=int, default=50, help="server-sent event clients")
+    parser.add_argument("--workers", type=int, default=8, help="simulated download workers")
+    parser.add_argument("--seconds", type=float, default=10, help="duration of each phase")
+    args = parser.parse_args()
+
+    result = asyncio.run(_bench(args))
+    baseline, loaded = result["baseline"], result["loaded"]
+    print(f"{'':24}{'no clients':>14}{'with clients':>14}")
+    for key in ("updates_per_second", "lag_p50_ms", "lag_p99_ms"):
+        print(f"{key:24}{baseline[key]:14.2f}{loaded[key]:14.2f}")
+    slowdown = 1 - loaded["updates_per_second"] / baseline["updates_per_second"]
+    print(f"worker slowdown          {slowdown * 100:.1f}%")
+    print(
+        f"{args.clients} pollers, {args.streams} streams: "
+        f"{result['requests_per_second']:.0f} req/s, "
+        f"latency p50 {result['latency_p50_ms']:.2f} ms p99 {result['latency_p99_ms']:.2f} ms, "
+        f"{result['stream_events']} stream events, {result['errors']} errors"
+    )
+
+
+if __name__ == "__main__":
+    main()
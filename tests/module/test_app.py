@@ -20,6 +20,8 @@ class AppTestCase(unittest.TestCase):
             os.remove(config_test)
         if os.path.exists(data_test):
             os.remove(data_test)
+        if os.path.exists(f"{config_test}.journal"):
+            os.remove(f"{config_test}.journal")
 
     def test_app(self):
         app = Application("", "")
@@ -60,6 +62,29 @@ class AppTestCase(unittest.TestCase):
             app.app_data["chat"][0]["ids_to_retry"],
         )
 
+    def test_load_checkpoint_journal(self):
+        from utils.checkpoint_journal import CheckpointJournal
+
+        app = Application("config_test.yaml", "data_test.yaml")
+        journal = CheckpointJournal(
+            os.path.join(os.path.abspath("."), "config_test.yaml.journal"), fsync=False
+        )
+        journal.compact({123: {"last_read_message_id": 9, "ids_to_retry": [3, 4]}})
+
+        app.chat_download_config[123] = ChatDownloadConfig()
+        app.chat_download_config[123].last_read_message_id = 5
+        app.chat_download_config[123].ids_to_retry = [1, 2, 3]
+        app.chat_download_config[123].ids_to_retry_dict = {1: True, 2: True, 3: True}
+        app.config["chat"] = [{"chat_id": 123, "last_read_message_id": 5}]
+
+        app.load_checkpoint_journal()
+
+        # retry ids finished since the config was saved are not retried again
+        self.assertEqual(app.chat_download_config[123].ids_to_retry, [3, 4])
+        self.assertEqual(app.chat_download_config[123].ids_to_retry_dict, {3: True, 4: True})
+        self.assertEqual(app.chat_download_config[123].last_read_message_id, 9)
+        self.assertEqual(app.config["chat"][0]["last_read_message_id"], 9)
+
     @mock.patch("__main__.__builtins__.open", new_callable=mock.mock_open)
     @mock.patch("module.app.yaml", autospec=True)
     def test_update_config(self, mock_yaml, mock_open):
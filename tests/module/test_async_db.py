@@ -0,0 +1,73 @@
+"""Unittest module for async db."""
+import asyncio
+import sys
+import threading
+import time
+import unittest
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+from module.async_db import AsyncDB, get_db_stats
+
+
+class _SlowDB:
+    name = "slow"
+
+    def __init__(self):
+        self.threads = set()
+
+    def query(self, value, delay=0.05):
+        self.threads.add(threading.get_ident())
+        time.sleep(delay)
+        return value * 2
+
+    def broken_query(self):
+        raise ValueError("no such table")
+
+
+class AsyncDBTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db = _SlowDB()
+        self.async_db = AsyncDB(self.db)
+
+    def tearDown(self):
+        self.async_db.shutdown()
+
+    def test_calls_run_off_loop(self):
+        async def _test():
+            ticks = 0
+
+            async def _ticker():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0.005)
+
+            ticker = asyncio.create_task(_ticker())
+            results = await asyncio.gather(
+                *[self.async_db.query(i) for i in range(3)],
+                self.async_db.query(value=5, delay=0),
+            )
+            ticker.cancel()
+            return results, ticks
+
+        results, ticks = asyncio.run(_test())
+        self.assertEqual(results, [0, 2, 4, 10])
+        # the loop kept running while the queries slept
+        self.assertGreater(ticks, 5)
+        self.assertEqual(len(self.db.threads), 1)
+        self.assertNotIn(threading.get_ident(), self.db.threads)
+        self.assertEqual(self.async_db.name, "slow")
+
+        stat = get_db_stats()["query"]
+        self.assertGreaterEqual(stat["calls"], 4)
+        self.assertGreaterEqual(stat["max_ms"], 50)
+
+    def test_errors_are_raised(self):
+        with self.assertRaises(ValueError):
+            asyncio.run(self.async_db.broken_query())
+        self.assertGreaterEqual(get_db_stats()["broken_query"]["errors"], 1)
+
+    def test_run(self):
+        result = asyncio.run(self.async_db.run(lambda a, b: a + b, 1, b=2, name="add"))
+        self.assertEqual(result, 3)
+        self.assertIn("add", get_db_stats())
@@ -0,0 +1,62 @@
+"""Unittest module for chat scan scheduler."""
+import asyncio
+import sys
+import unittest
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+from module.app import ChatDownloadConfig
+from module.chat_scan_scheduler import ChatScanScheduler
+
+
+def _items(count):
+    items = []
+    for i in range(count):
+        config = ChatDownloadConfig()
+        config.last_read_message_id = i * 10
+        items.append((i, config))
+    return items
+
+
+class ChatScanSchedulerTestCase(unittest.TestCase):
+    def test_slow_chat_does_not_block(self):
+        order = []
+        active = 0
+        max_active = 0
+
+        async def _scan(key, _):
+            nonlocal active, max_active
+            active += 1
+            max_active = max(max_active, active)
+            await asyncio.sleep(0.2 if key == 0 else 0.01)
+            active -= 1
+            order.append(key)
+            if key == 3:
+                raise ValueError("chat not found")
+
+        scheduler = ChatScanScheduler(_scan, concurrency=2)
+        asyncio.run(scheduler.run(_items(6)))
+
+        self.assertEqual(max_active, 2)
+        # the other scanner went through the rest while chat 0 was slow
+        self.assertEqual(order, [1, 2, 3, 4, 5, 0])
+        progress = scheduler.progress()
+        self.assertEqual(progress["total"], 6)
+        self.assertEqual(progress["finished"], 6)
+        self.assertEqual(progress["chats"][3]["state"], "failed")
+        self.assertEqual(progress["chats"][3]["error"], "chat not found")
+
+    def test_backlog_order(self):
+        order = []
+
+        async def _scan(key, _):
+            order.append(key)
+
+        async def _estimate(key, config):
+            if key == 1:
+                raise ConnectionError("timeout")
+            return 1000 - config.last_read_message_id if key != 2 else 5000
+
+        scheduler = ChatScanScheduler(_scan, concurrency=1, estimate=_estimate)
+        asyncio.run(scheduler.run(_items(4)))
+        self.assertEqual(order, [2, 0, 3, 1])
+        self.assertEqual(scheduler.progress()["chats"][2]["backlog"], 5000)
@@ -0,0 +1,103 @@
+"""Unittest module for db migration."""
+import os
+import sys
+import tempfile
+import unittest
+
+from peewee import SqliteDatabase
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+from module.db_migration import get_schema_version, migrate, optimize
+from module.sqlmodel import Downloaded
+
+
+class DBMigrationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_db = SqliteDatabase(":memory:")
+        self.bind = self.test_db.bind_ctx([Downloaded])
+        self.bind.__enter__()
+        self.test_db.create_tables([Downloaded])
+
+    def tearDown(self):
+        self.bind.__exit__(None, None, None)
+        self.test_db.close()
+
+    def _add(self, chat_id, message_id, status):
+        Downloaded.insert(
+            chat_id=chat_id, message_id=message_id, chat_username="", status=status
+        ).execute()
+
+    def test_migrate(self):
+        self._add(1, 10, 2)
+        self._add(1, 10, 1)
+        self._add(1, 11, 1)
+        self._add(1, 12, 3)
+        self._add(1, 12, 2)
+        self._add(None, None, 3)
+        self._add(None, None, 3)
+        self.assertEqual(get_schema_version(self.test_db), 0)
+
+        self.assertEqual(migrate(self.test_db), 2)
+        self.assertEqual(get_schema_version(self.test_db), 2)
+        # the finished row of a message is kept, else the newest one
+        rows = list(
+            Downloaded.select(Downloaded.message_id, Downloaded.status)
+            .where(Downloaded.chat_id == 1)
+            .order_by(Downloaded.message_id)
+            .tuples()
+        )
+        self.assertEqual(rows, [(10, 1), (11, 1), (12, 2)])
+        self.assertEqual(Downloaded.select().count(), 5)
+
+        indexes = {i.name: i for i in self.test_db.get_indexes("Downloaded")}
+        self.assertTrue(indexes["downloaded_chat_id_message_id"].unique)
+        self.assertIn("downloaded_chat_username_status_message_id", indexes)
+
+        # nothing left to do, a duplicate is now rejected
+        self.assertEqual(migrate(self.test_db), 2)
+        with self.assertRaises(Exception):
+            self._add(1, 11, 2)
+        optimize(self.test_db)
+
+    def test_backup_before_removing_duplicates(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "downloaded.db")
+            file_db = SqliteDatabase(path)
+            with file_db.bind_ctx([Downloaded]):
+                file_db.create_tables([Downloaded])
+                self._add(1, 10, 2)
+                migrate(file_db)
+                self.assertFalse(os.path.exists(f"{path}.v1.bak"))
+
+                file_db.execute_sql("DROP INDEX downloaded_chat_id_message_id")
+                file_db.execute_sql("PRAGMA user_version = 0")
+                self._add(1, 10, 1)
+                migrate(file_db)
+            file_db.close()
+
+            backup = SqliteDatabase(f"{path}.v1.bak")
+            with backup.bind_ctx([Downloaded]):
+                self.assertEqual(Downloaded.select().count(), 2)
+            backup.close()
+
+    def test_migrate_steps(self):
+        applied = []
+        steps = [
+            (1, "one", lambda _: applied.append(1)),
+            (2, "two", lambda _: applied.append(2)),
+        ]
+        self.assertEqual(migrate(self.test_db, steps[:1]), 1)
+        self.assertEqual(migrate(self.test_db, steps), 2)
+        self.assertEqual(applied, [1, 2])
+
+    def test_failed_step_rolls_back(self):
+        def _broken(database):
+            database.execute_sql("CREATE INDEX broken ON Downloaded (STATUS)")
+            raise RuntimeError("broken")
+
+        with self.assertRaises(RuntimeError):
+            migrate(self.test_db, [(1, "broken", _broken)])
+        self.assertEqual(get_schema_version(self.test_db), 0)
+        self.assertNotIn(
+            "broken", [i.name for i in self.test_db.get_indexes("Downloaded")]
+        )
@@ -0,0 +1,67 @@
+"""Unittest module for db writer."""
+import sys
+import threading
+import unittest
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+from module.db_writer import DBWriter
+
+
+class DBWriterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def _write_rows(self, rows):
+        with self.lock:
+            self.batches.append(rows)
+
+    def test_coalesce_and_flush(self):
+        writer = DBWriter(self._write_rows, batch_size=100, flush_interval=60)
+        writer.start()
+        writer.submit(1, {"id": 1, "status": 2})
+        writer.submit(2, {"id": 2, "status": 2})
+        writer.submit(1, {"id": 1, "status": 1})
+        self.assertEqual(writer.get_pending(1)["status"], 1)
+        self.assertEqual(self.batches, [])
+
+        self.assertTrue(writer.flush(timeout=5))
+        self.assertEqual(
+            self.batches, [[{"id": 1, "status": 1}, {"id": 2, "status": 2}]]
+        )
+        self.assertIsNone(writer.get_pending(1))
+        writer.stop()
+
+    def test_flush_by_size(self):
+        writer = DBWriter(self._write_rows, batch_size=3, flush_interval=60)
+        writer.start()
+        for i in range(3):
+            writer.submit(i, {"id": i})
+        writer.flush(timeout=5)
+        writer.stop()
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual(writer.written_rows, 3)
+
+    def test_stop_writes_rest(self):
+        writer = DBWriter(self._write_rows, batch_size=100, flush_interval=60)
+        writer.start()
+        writer.submit(1, {"id": 1})
+        writer.stop()
+        self.assertEqual(self.batches, [[{"id": 1}]])
+        self.assertFalse(writer.is_running)
+
+    def test_failed_batch_is_kept(self):
+        calls = []
+
+        def _write_rows(rows):
+            calls.append(rows)
+            if len(calls) == 1:
+                raise IOError("database is locked")
+
+        writer = DBWriter(_write_rows, batch_size=100, flush_interval=60)
+        writer.submit(1, {"id": 1, "status": 2})
+        writer.flush()
+        # a newer write of the same key wins over the failed one
+        writer.submit(1, {"id": 1, "status": 1})
+        writer.flush()
+        self.assertEqual(calls, [[{"id": 1, "status": 2}], [{"id": 1, "status": 1}]])
@@ -0,0 +1,67 @@
+"""Unittest module for dedup index."""
+import sys
+import unittest
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+from module.dedup_index import DedupIndex, DedupRecord, match_segments
+
+
+def _record(record_id, filename, title, size, status=1, mime_type="video/mp4"):
+    return DedupRecord(
+        record_id, -100, record_id, filename, title, mime_type, "video", size, 60, status
+    )
+
+
+class DedupIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.index = DedupIndex()
+        self.index.load(
+            [
+                (1, -100, 1, "[1]Hello World.mp4", "Hello World", "video/mp4", "video", 1000, 60, 1),
+                (2, -100, 2, "[2]Hello Kitty.mp4", "Hello Kitty", "video/mp4", "video", 5000, 60, 1),
+                (3, -100, 3, "[3]Other.mp4", "Other", "video/mp4", "video", 1000, 60, 2),
+                (4, -100, 4, "[4]hello world.mkv", "hello world", "video/x-matroska", "video", 9000, 60, 1),
+                (5, -100, 5, "[5]Hello World.pdf", "Hello World", "application/pdf", "document", 1000, 0, 1),
+            ]
+        )
+
+    def _ids(self, *args):
+        return [i.id for i in self.index.find_candidates(*args)]
+
+    def test_match_segments(self):
+        self.assertTrue(match_segments("Hello big World", ["Hello", "World"]))
+        self.assertFalse(match_segments("World Hello", ["Hello", "World"]))
+        self.assertFalse(match_segments("hello world", ["Hello"]))
+
+    def test_exact_size(self):
+        self.assertEqual(self._ids("video/mp4", "video", 1000, (0, 0), None, [1]), [1])
+        self.assertEqual(self._ids("video/mp4", "video", 1000, (0, 0), None, [1, 2]), [1, 3])
+
+    def test_name_match(self):
+        # same mime type inside the size range, or same message type at any size
+        self.assertEqual(
+            self._ids("video/mp4", "video", 1200, (900, 1500), ["Hello", "World"], [1]),
+            [1],
+        )
+        self.assertEqual(
+            self._ids("video/mp4", "video", 1200, (900, 1500), ["Hello"], [1]), [1, 2]
+        )
+        # GLOB is case sensitive, 4 only differs in case
+        self.assertEqual(
+            self._ids("application/pdf", "document", 1, (0, 2), ["Hello", "World"], [1]),
+            [5],
+        )
+        # segments shorter than a trigram scan the type buckets
+        self.assertEqual(
+            self._ids("video/mp4", "video", 1, (0, 2), ["o", "d"], [1]), [1, 4]
+        )
+
+    def test_update(self):
+        self.index.add(_record(3, "[3]Hello World 2.mp4", "Hello World 2", 1000, 1))
+        self.index.add(_record(1, "[1]Renamed.mp4", "Renamed", 1000, 5))
+        self.assertEqual(
+            self._ids("video/mp4", "video", 1200, (900, 1500), ["Hello", "World"], [1]),
+            [3],
+        )
+        self.assertEqual(self.index.get(-100, 3).title, "Hello World 2")
+        self.assertEqual(len(self.index), 5)
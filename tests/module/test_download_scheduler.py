@@ -0,0 +1,82 @@
+"""Unittest module for download scheduler."""
+import asyncio
+import sys
+import unittest
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+from module.download_scheduler import DownloadScheduler
+
+
+async def _drain(scheduler: DownloadScheduler) -> list:
+    items = []
+    while not scheduler.empty():
+        items.append(await scheduler.get())
+    return items
+
+
+class DownloadSchedulerTestCase(unittest.TestCase):
+    def test_round_robin(self):
+        async def _test():
+            scheduler = DownloadScheduler()
+            for i in range(4):
+                await scheduler.put(("big", i), key="big")
+            await scheduler.put(("small", 0), key="small")
+            await scheduler.put(("small", 1), key="small")
+            return await _drain(scheduler)
+
+        self.assertEqual(
+            asyncio.run(_test()),
+            [
+                ("big", 0),
+                ("small", 0),
+                ("big", 1),
+                ("small", 1),
+                ("big", 2),
+                ("big", 3),
+            ],
+        )
+
+    def test_priority_lane(self):
+        async def _test():
+            scheduler = DownloadScheduler(maxsize=2)
+            await scheduler.put("a", key="chat")
+            await scheduler.put("b", key="chat")
+            # the queue is full, a priority put does not wait
+            await asyncio.wait_for(
+                scheduler.put("bot", key="bot", priority=True), timeout=1
+            )
+            blocked = asyncio.create_task(scheduler.put("c", key="chat"))
+            await asyncio.sleep(0.01)
+            self.assertFalse(blocked.done())
+
+            first = await scheduler.get()
+            second = await scheduler.get()
+            await asyncio.wait_for(blocked, timeout=1)
+            return [first, second] + await _drain(scheduler)
+
+        self.assertEqual(asyncio.run(_test()), ["bot", "a", "b", "c"])
+
+    def test_size_order(self):
+        async def _test():
+            scheduler = DownloadScheduler(order="smallest")
+            for name, size in [("c", 30), ("a", 10), ("b", 10), ("d", 20)]:
+                await scheduler.put(name, key="chat", size=size)
+            return await _drain(scheduler)
+
+        self.assertEqual(asyncio.run(_test()), ["a", "b", "d", "c"])
+
+    def test_purge(self):
+        async def _test():
+            scheduler = DownloadScheduler(maxsize=3)
+            for i in range(3):
+                await scheduler.put(i, key="stopped")
+            blocked = asyncio.create_task(scheduler.put("next", key="other"))
+            await asyncio.sleep(0.01)
+            self.assertEqual(scheduler.purge("stopped"), 3)
+            self.assertEqual(scheduler.purge("stopped"), 0)
+            # the producer waiting for room is woken up
+            await asyncio.wait_for(blocked, timeout=1)
+            self.assertEqual(scheduler.qsize(), 1)
+            return await _drain(scheduler)
+
+        self.assertEqual(asyncio.run(_test()), ["next"])
@@ -0,0 +1,85 @@
+"""Unittest module for finalize stage."""
+import asyncio
+import sys
+import threading
+import time
+import unittest
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+from module.finalize import FinalizeJob, FinalizeStage
+
+
+class FinalizeStageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.stage = FinalizeStage(max_workers=2)
+
+    def tearDown(self):
+        self.stage.shutdown()
+        self.loop.close()
+
+    def test_jobs_run_off_loop(self):
+        loop_thread = threading.get_ident()
+        results = {}
+
+        def _run(name):
+            results[name] = threading.get_ident()
+            time.sleep(0.05)
+            return name != "bad"
+
+        async def _test():
+            self.stage.start(asyncio.get_running_loop())
+            done = {}
+
+            def _job(name):
+                async def _on_done(success):
+                    done[name] = success
+
+                return FinalizeJob(name, lambda: _run(name), _on_done)
+
+            ticks = 0
+            for name in ["a", "b", "bad"]:
+                await self.stage.submit(_job(name))
+
+            # the loop keeps running while the merges block their threads
+            while len(done) < 3:
+                ticks += 1
+                await asyncio.sleep(0.001)
+            await self.stage.join()
+            return done, ticks
+
+        done, ticks = self.loop.run_until_complete(_test())
+        self.assertEqual(done, {"a": True, "b": True, "bad": False})
+        self.assertGreater(ticks, 10)
+        self.assertNotIn(loop_thread, results.values())
+
+    def test_job_exception(self):
+        done = []
+
+        def _run():
+            raise OSError("disk full")
+
+        async def _on_done(success):
+            done.append(success)
+
+        async def _test():
+            self.stage.start(asyncio.get_running_loop())
+            await self.stage.submit(FinalizeJob("x", _run, _on_done))
+            await self.stage.join()
+
+        self.loop.run_until_complete(_test())
+        self.assertEqual(done, [False])
+
+    def test_submit_without_start(self):
+        done = []
+
+        async def _on_done(success):
+            done.append(success)
+
+        async def _test():
+            await self.stage.submit(FinalizeJob("x", lambda: True, _on_done))
+            await self.stage.join()
+            await asyncio.sleep(0)
+
+        self.loop.run_until_complete(_test())
+        self.assertEqual(done, [True])
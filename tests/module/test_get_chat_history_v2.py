@@ -0,0 +1,95 @@
+"""Unittest module for history prefetch."""
+import asyncio
+import sys
+import unittest
+from unittest import mock
+
+import pyrogram
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+from module.get_chat_history_v2 import HistoryPrefetcher, get_chat_history_v2
+from module.rate_limiter import get_rate_limiter
+
+
+class _Message:
+    def __init__(self, id):
+        self.id = id
+
+
+class _History:
+    """get_chunk_v2 over the message ids ``ids``"""
+
+    def __init__(self, ids, flood_at=None):
+        self.ids = sorted(ids)
+        self.flood_at = flood_at
+        self.active = 0
+        self.max_active = 0
+        self.calls = []
+
+    async def __call__(self, *, client, chat_id, limit=0, from_message_id=0,
+                       max_id=0, min_id=0, **kwargs):
+        self.calls.append((min_id, max_id))
+        if (min_id, max_id) == self.flood_at:
+            self.flood_at = None
+            raise pyrogram.errors.FloodWait(value=0)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        upper = min(from_message_id or (1 << 31), max_id or (1 << 31))
+        ids = [i for i in reversed(self.ids) if min_id < i < upper]
+        return [_Message(i) for i in ids[:limit]]
+
+
+async def _collect(history, **kwargs):
+    with mock.patch("module.get_chat_history_v2.get_chunk_v2", new=history):
+        return [
+            message.id
+            async for message in get_chat_history_v2(None, kwargs.pop("chat_id", -1001), **kwargs)
+        ]
+
+
+class HistoryPrefetcherTestCase(unittest.TestCase):
+    def tearDown(self):
+        get_rate_limiter().bucket("history").configure(0)
+    def test_reverse(self):
+        ids = [i for i in range(1, 1000) if i % 7]
+        history = _History(ids)
+        result = asyncio.run(
+            _collect(history, offset_id=50, reverse=True, prefetch_depth=4)
+        )
+        self.assertEqual(result, [i for i in ids if i >= 50])
+        self.assertEqual(history.max_active, 4)
+
+    def test_limit_and_max_id(self):
+        ids = list(range(1, 1000))
+        result = asyncio.run(
+            _collect(_History(ids), limit=150, max_id=900, prefetch_depth=3)
+        )
+        self.assertEqual(result, list(range(900, 750, -1)))
+
+        result = asyncio.run(
+            _collect(_History(ids), offset_id=10, max_id=260, reverse=True, prefetch_depth=2)
+        )
+        self.assertEqual(result, list(range(10, 261)))
+
+    def test_private_chat_pages_sequentially(self):
+        history = _History(range(1, 1000))
+        result = asyncio.run(_collect(history, chat_id=1, limit=150, prefetch_depth=4))
+        self.assertEqual(result, list(range(999, 849, -1)))
+        # offset paging, no min_id windows
+        self.assertEqual([min_id for min_id, _ in history.calls], [0, 0])
+
+    def test_flood_wait(self):
+        history = _History(range(1, 500), flood_at=(200, 301))
+        with mock.patch("module.get_chat_history_v2.get_chunk_v2", new=history):
+            prefetcher = HistoryPrefetcher(None, 1, reverse=True, depth=4)
+
+            async def _run():
+                return [message.id async for message in prefetcher]
+
+            result = asyncio.run(_run())
+        self.assertEqual(result, list(range(1, 500)))
+        self.assertEqual(prefetcher.flood_waits, 1)
+        self.assertEqual(history.calls.count((200, 301)), 2)
+        self.assertGreaterEqual(get_rate_limiter().bucket("history").flood_wait_count, 1)
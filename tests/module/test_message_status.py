@@ -0,0 +1,75 @@
+"""Unittest module for message status store."""
+import sys
+import unittest
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+from module.app import DownloadStatus
+from module.message_status import IntervalSet, MessageStatusStore
+
+
+def _store() -> MessageStatusStore:
+    return MessageStatusStore(
+        DownloadStatus, (DownloadStatus.SuccessDownload, DownloadStatus.SkipDownload)
+    )
+
+
+class IntervalSetTestCase(unittest.TestCase):
+    def test_add_discard(self):
+        values = IntervalSet()
+        for value in (5, 1, 3, 2, 4, 9, 9):
+            values.add(value)
+        self.assertEqual(values.ranges(), [(1, 5), (9, 9)])
+        self.assertEqual(len(values), 6)
+        self.assertIn(3, values)
+        self.assertNotIn(7, values)
+
+        values.discard(3)
+        values.discard(1)
+        values.discard(9)
+        values.discard(100)
+        self.assertEqual(values.ranges(), [(2, 2), (4, 5)])
+        self.assertEqual(len(values), 3)
+
+
+class MessageStatusStoreTestCase(unittest.TestCase):
+    def test_dict_interface(self):
+        store = _store()
+        store[100] = DownloadStatus.Downloading
+        store[98] = DownloadStatus.SkipDownload
+        store[103] = DownloadStatus.SuccessDownload
+
+        self.assertEqual(store.get(100), DownloadStatus.Downloading)
+        self.assertEqual(store[98], DownloadStatus.SkipDownload)
+        self.assertIsNone(store.get(99))
+        self.assertEqual(store.get(5000, DownloadStatus.Downloading), DownloadStatus.Downloading)
+        self.assertNotIn(101, store)
+        with self.assertRaises(KeyError):
+            _ = store[1]
+        self.assertEqual(len(store), 3)
+        self.assertEqual(
+            list(store.items()),
+            [
+                (98, DownloadStatus.SkipDownload),
+                (100, DownloadStatus.Downloading),
+                (103, DownloadStatus.SuccessDownload),
+            ],
+        )
+
+    def test_incremental_state(self):
+        store = _store()
+        for message_id in range(1000, 2000):
+            store[message_id] = DownloadStatus.Downloading
+        # a segment below the first one
+        for message_id in range(10, 20):
+            store[message_id] = DownloadStatus.SkipDownload
+        for message_id in range(1000, 1990):
+            store[message_id] = DownloadStatus.SuccessDownload
+        store[1995] = DownloadStatus.FailedDownload
+        store[1500] = DownloadStatus.FailedDownload
+
+        self.assertEqual(store.max_id, 1999)
+        self.assertEqual(store.unfinished_ids(), set(range(1990, 2000)) | {1500})
+        self.assertEqual(store.finished.ranges(), [(10, 19), (1000, 1499), (1501, 1989)])
+        self.assertTrue(store.is_finished(12))
+        self.assertFalse(store.is_finished(1500))
+        self.assertEqual(len(store), 1010)
@@ -0,0 +1,86 @@
+"""Unittest module for metrics."""
+import sys
+import unittest
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+from module.metrics import Registry
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_counter_and_gauge(self):
+        registry = Registry()
+        counter = registry.counter("tdl_test_bytes", "Test bytes", ["chat"])
+        counter.inc(10, chat="a")
+        counter.inc(5, chat="a")
+        counter.inc(1, chat='b"c')
+        with self.assertRaises(ValueError):
+            counter.inc(-1, chat="a")
+        with self.assertRaises(ValueError):
+            counter.inc(1)
+
+        gauge = registry.gauge("tdl_test_depth", "Test depth")
+        gauge.set_function(lambda: 7)
+
+        text = registry.expose()
+        self.assertIn("# TYPE tdl_test_bytes counter\n", text)
+        self.assertIn('tdl_test_bytes_total{chat="a"} 15\n', text)
+        self.assertIn('tdl_test_bytes_total{chat="b\\"c"} 1\n', text)
+        self.assertIn("# TYPE tdl_test_depth gauge\ntdl_test_depth 7\n", text)
+
+    def test_histogram(self):
+        registry = Registry()
+        histogram = registry.histogram(
+            "tdl_test_seconds", "Test seconds", ["method"], buckets=(1, 5)
+        )
+        for value in (0.5, 2, 3, 10):
+            histogram.observe(value, method="get")
+
+        text = registry.expose()
+        self.assertIn('tdl_test_seconds_bucket{method="get",le="1"} 1\n', text)
+        self.assertIn('tdl_test_seconds_bucket{method="get",le="5"} 3\n', text)
+        self.assertIn('tdl_test_seconds_bucket{method="get",le="+Inf"} 4\n', text)
+        self.assertIn('tdl_test_seconds_sum{method="get"} 15.5\n', text)
+        self.assertIn('tdl_test_seconds_count{method="get"} 4\n', text)
+        self.assertEqual(histogram.get_count(method="get"), 4)
+
+    def test_callback(self):
+        registry = Registry()
+        stats = {"history": 2}
+        registry.callback(
+            "tdl_test_flood_wait",
+            "Test flood waits",
+            "counter",
+            lambda: [({"method_class": key}, value) for key, value in stats.items()],
+        )
+        stats["file"] = 1
+        text = registry.expose()
+        self.assertIn('tdl_test_flood_wait_total{method_class="history"} 2\n', text)
+        self.assertIn('tdl_test_flood_wait_total{method_class="file"} 1\n', text)
+
+    def test_metrics_endpoint(self):
+        import asyncio
+
+        from module.web import get_flask_app, get_web_server
+        from module.web_server import Request
+
+        def _get(headers=None):
+            return asyncio.run(
+                get_web_server().dispatch(Request("GET", "/metrics", headers or {}))
+            )
+
+        flask_app = get_flask_app()
+        flask_app.config["LOGIN_DISABLED"] = False
+        self.assertEqual(_get().status, 401)
+        self.assertEqual(_get({"authorization": "Bearer None"}).status, 401)
+
+        flask_app.config["LOGIN_DISABLED"] = True
+        try:
+            response = _get()
+        finally:
+            flask_app.config["LOGIN_DISABLED"] = False
+        self.assertEqual(response.status, 200)
+        self.assertTrue(response.headers[0][1].startswith("text/plain; version=0.0.4"))
+        text = response.body.decode()
+        self.assertIn("# TYPE tdl_db_query_seconds histogram\n", text)
+        self.assertIn("# TYPE tdl_flood_wait counter\n", text)
+        self.assertIn('tdl_flood_wait_total{method_class="file"} 0\n', text)
@@ -0,0 +1,61 @@
+"""Unittest module for adaptive pacing."""
+import asyncio
+import sys
+import time
+import unittest
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+from module.pacing import AdaptivePacer
+
+
+class AdaptivePacerTestCase(unittest.TestCase):
+    def test_no_delay_by_default(self):
+        pacer = AdaptivePacer()
+        start = time.time()
+        asyncio.run(pacer.wait())
+        self.assertLess(time.time() - start, 0.05)
+        self.assertEqual(pacer.get_state()["delay"], 0)
+
+    def test_flood_wait_backoff_and_recover(self):
+        pacer = AdaptivePacer(min_delay=0.2, max_delay=1)
+        pacer.on_flood_wait(5)
+        state = pacer.get_state()
+        self.assertEqual(state["flood_wait_count"], 1)
+        self.assertEqual(state["flood_wait_seconds"], 5)
+        self.assertGreater(state["cooldown"], 4)
+        self.assertEqual(state["delay"], 0.2)
+
+        pacer.on_flood_wait(1)
+        pacer.on_flood_wait(1)
+        pacer.on_flood_wait(1)
+        self.assertEqual(pacer.delay, 1)
+
+        for _ in range(5):
+            pacer.on_success()
+        self.assertEqual(pacer.delay, 0)
+
+    def test_error_backs_off_only_its_transfer(self):
+        pacer = AdaptivePacer(min_delay=0.2, max_delay=1)
+        failing = pacer.transfer()
+        other = pacer.transfer()
+
+        failing.on_error()
+        failing.on_error()
+        self.assertEqual(failing.delay, 0.4)
+        self.assertEqual(other.delay, 0)
+        self.assertEqual(pacer.delay, 0)
+        self.assertEqual(pacer.error_count, 2)
+
+        start = time.time()
+        asyncio.run(other.wait())
+        self.assertLess(time.time() - start, 0.05)
+
+        # a FloodWait still cools down every transfer
+        failing.on_flood_wait(5)
+        self.assertGreater(pacer.get_state()["cooldown"], 4)
+        self.assertEqual(pacer.delay, 0.2)
+
+        failing.on_success()
+        self.assertEqual(failing.delay, 0.2)
+        failing.on_success()
+        self.assertEqual(failing.delay, 0)
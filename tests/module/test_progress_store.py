@@ -0,0 +1,116 @@
+"""Unittest module for progress store."""
+import sys
+import unittest
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+from module.progress_store import ProgressStore
+
+
+class ProgressStoreTestCase(unittest.TestCase):
+    def test_finished_moves_to_history(self):
+        store = ProgressStore(history_size=3)
+        for message_id in range(10):
+            store.update(1, message_id, 50, 100, f"{message_id}.mp4", 0, 7, now=1)
+            store.update(1, message_id, 100, 100, f"{message_id}.mp4", 0, 7, now=2)
+
+        self.assertEqual(list(store.active()), [])
+        self.assertEqual([value.message_id for value in store.recent()], [7, 8, 9])
+        self.assertEqual(store.recent()[0].state, "done")
+        self.assertEqual(store.task_stats(7)["finished"], 10)
+        self.assertEqual(store.chat_stats()[1]["down_byte"], 1000)
+        self.assertEqual(store.total.active, 0)
+
+    def test_aggregates_and_speed(self):
+        store = ProgressStore(alpha=0.5)
+        store.update(1, 1, 0, 1000, "a", 0, 1, now=0)
+        store.update(2, 1, 0, 1000, "b", 0, 2, now=0)
+        store.update(1, 1, 100, 1000, "a", 0, 1, now=1)
+        store.update(2, 1, 300, 1000, "b", 0, 2, now=1)
+        self.assertEqual(store.task_stats(1)["download_speed"], 100)
+        self.assertEqual(store.chat_stats()[2]["download_speed"], 300)
+
+        # ewma of 100 and 300 B/s
+        store.update(1, 1, 400, 1000, "a", 0, 1, now=2)
+        self.assertEqual(store.task_stats(1)["download_speed"], 200)
+        self.assertEqual(
+            [value.message_id for value in store.active(task_id=2)], [1]
+        )
+
+        store.finish(2, 1, "FailedDownload")
+        self.assertEqual(store.chat_stats()[2]["active"], 0)
+        self.assertEqual(store.chat_stats()[2]["failed"], 1)
+        self.assertEqual(store.chat_stats()[2]["download_speed"], 0)
+        self.assertEqual(store.total.active, 1)
+
+    def test_stale_eviction(self):
+        store = ProgressStore(stale_seconds=10)
+        store.update(1, 1, 10, 100, "a", 0, now=100)
+        store.update(1, 2, 10, 100, "b", 0, now=100)
+        store.update(1, 2, 20, 100, "b", 0, now=115)
+        self.assertEqual([value.message_id for value in store.active()], [2])
+        self.assertEqual(store.recent()[0].state, "stalled")
+
+    def test_task_aggregates_bounded(self):
+        store = ProgressStore(max_tasks=5)
+        for task_id in range(20):
+            store.update(1, task_id, 10, 10, "a", 0, task_id, now=1)
+        self.assertIsNone(store.task_stats(0))
+        self.assertEqual(store.task_stats(19)["finished"], 1)
+        self.assertEqual(len(store._tasks), 5)
+
+    def test_page(self):
+        store = ProgressStore()
+        for message_id in range(1, 6):
+            store.update(1, message_id, 0, 100, "a", 0, 1, now=1)
+        store.update(2, 1, 0, 100, "b", 0, 2, now=1)
+        store.update(1, 2, 100, 100, "a", 0, 1, now=2)
+
+        records, cursor = store.page(limit=2, chat_id=1)
+        self.assertEqual([value.message_id for value in records], [1, 2])
+        records, cursor = store.page(cursor, limit=2, chat_id=1)
+        self.assertEqual([value.message_id for value in records], [3, 4])
+        records, cursor = store.page(cursor, limit=2, chat_id=1)
+        self.assertEqual([value.message_id for value in records], [5])
+        self.assertIsNone(cursor)
+
+        records, _ = store.page(state="done")
+        self.assertEqual([(value.chat_id, value.message_id) for value in records], [(1, 2)])
+        records, _ = store.page(task_id=2)
+        self.assertEqual([value.chat_id for value in records], [2])
+
+    def test_changes_since(self):
+        store = ProgressStore(history_size=2)
+        store.update(1, 1, 0, 100, "a", 0, now=1)
+        store.update(1, 2, 0, 100, "b", 0, now=1)
+        version = store.version
+
+        changes, version = store.changes_since(version)
+        self.assertEqual(changes, [])
+
+        store.update(1, 1, 50, 100, "a", 0, now=2)
+        store.update(1, 2, 100, 100, "b", 0, now=2)
+        store.update(1, 1, 60, 100, "a", 0, now=3)
+        changes, version = store.changes_since(version)
+        self.assertEqual(
+            [(value.message_id, value.state) for value in changes],
+            [(2, "done"), (1, "downloading")],
+        )
+
+        old_version = version
+        for message_id in range(3, 10):
+            store.update(1, message_id, 100, 100, "c", 0, now=4)
+        changes, _ = store.changes_since(old_version)
+        self.assertIsNone(changes)
+
+    def test_finish_success_without_full_progress(self):
+        from module.app import TaskNode
+        from module.download_stat import finish_download_status, get_progress_store
+
+        node = TaskNode(chat_id=123456)
+        store = get_progress_store()
+        # resumed download, the last callback stopped short of total_size
+        store.update(123456, 1, 60, 100, "a.mp4", 0, node.task_id)
+        finished = store.total.finished
+        finish_download_status(node, 1, "done")
+        self.assertIsNone(store.get(123456, 1))
+        self.assertEqual(store.total.finished, finished + 1)
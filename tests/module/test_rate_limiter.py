@@ -0,0 +1,100 @@
+"""Unittest module for rate limiter."""
+import asyncio
+import sys
+import time
+import unittest
+
+import pyrogram
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+from module.app import LimitCall, TaskNode
+from module.rate_limiter import RateLimiter, TokenBucket, get_rate_limiter
+
+
+class TokenBucketTestCase(unittest.TestCase):
+    def test_unlimited(self):
+        bucket = TokenBucket("history")
+        for _ in range(100):
+            self.assertEqual(bucket.reserve(), 0)
+
+    def test_rate(self):
+        bucket = TokenBucket("send", rate=10, burst=2)
+        delays = [bucket.reserve() for _ in range(5)]
+        self.assertEqual(delays[:2], [0, 0])
+        # every further call gets its own slot, 0.1s apart
+        self.assertAlmostEqual(delays[2], 0.1, delta=0.01)
+        self.assertAlmostEqual(delays[4], 0.3, delta=0.01)
+
+    def test_flood_wait_cooldown_and_recovery(self):
+        bucket = TokenBucket("send", rate=10, burst=10)
+        bucket.on_flood_wait(5)
+        self.assertEqual(bucket.rate, 5)
+        self.assertEqual(bucket.ceiling, 10)
+        self.assertGreater(bucket.reserve(), 5)
+        self.assertGreater(bucket.get_state()["cooldown"], 4)
+
+        for _ in range(100):
+            bucket.on_success()
+        self.assertAlmostEqual(bucket.rate, 9)
+
+    def test_learn_unlimited_rate(self):
+        bucket = TokenBucket("history")
+        for _ in range(40):
+            bucket.reserve()
+        bucket.on_flood_wait(0)
+        self.assertGreater(bucket.rate, 0)
+        self.assertLessEqual(bucket.rate, 20)
+
+    def test_cooldown_shared_by_waiters(self):
+        async def _test():
+            bucket = TokenBucket("file")
+            bucket.on_flood_wait(0.1)
+            start = time.monotonic()
+            await asyncio.gather(*[bucket.acquire() for _ in range(5)])
+            return time.monotonic() - start
+
+        self.assertGreaterEqual(asyncio.run(_test()), 0.09)
+
+
+class RateLimiterTestCase(unittest.TestCase):
+    def setUp(self):
+        # LimitCall configures the shared forward bucket, give it a fresh one
+        self.buckets = get_rate_limiter().buckets
+        self.forward_bucket = self.buckets.pop("forward", None)
+
+    def tearDown(self):
+        if self.forward_bucket is None:
+            self.buckets.pop("forward", None)
+        else:
+            self.buckets["forward"] = self.forward_bucket
+
+    def test_call_retries_flood_wait(self):
+        calls = []
+
+        async def _func(value):
+            calls.append(value)
+            if len(calls) == 1:
+                raise pyrogram.errors.FloodWait(value=0)
+            return value
+
+        limiter = RateLimiter()
+        self.assertEqual(asyncio.run(limiter.call("history", _func, 3)), 3)
+        self.assertEqual(calls, [3, 3])
+        self.assertEqual(limiter.get_state()["history"]["flood_wait_count"], 1)
+
+    def test_limit_call(self):
+        limit_call = LimitCall(max_limit_call_times=120)
+        self.assertEqual(limit_call.bucket.rate, 2)
+        node = TaskNode(chat_id=1)
+
+        async def _test():
+            for _ in range(3):
+                await limit_call.wait(node)
+            # a stopped node does not wait for the cooldown
+            limit_call.bucket.on_flood_wait(30)
+            node.stop_transmission()
+            await asyncio.wait_for(limit_call.wait(node), timeout=2)
+
+        asyncio.run(_test())
+        self.assertEqual(limit_call.limit_call_times, 3)
+        self.assertIsNot(limit_call.bucket, self.forward_bucket)
@@ -0,0 +1,37 @@
+"""Unittest module for scan watermark."""
+import sys
+import unittest
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+from module.scan_watermark import ScanWatermark, split_segments
+
+
+class ScanWatermarkTestCase(unittest.TestCase):
+    def test_split_segments(self):
+        self.assertEqual(split_segments(1, 10, 3), [(1, 4), (5, 7), (8, 10)])
+        self.assertEqual(split_segments(5, 6, 4), [(5, 5), (6, 6)])
+        self.assertEqual(split_segments(10, 9, 2), [])
+        segments = split_segments(100, 100099, 7)
+        self.assertEqual(segments[0][0], 100)
+        self.assertEqual(segments[-1][1], 100099)
+        for (_, end), (start, _) in zip(segments, segments[1:]):
+            self.assertEqual(end + 1, start)
+
+    def test_watermark(self):
+        watermark = ScanWatermark([(1, 100), (101, 200), (201, 300)])
+        self.assertEqual(watermark.value, 0)
+
+        # later segments running ahead do not move the watermark
+        watermark.advance(1, 150)
+        watermark.finish(2)
+        self.assertEqual(watermark.value, 0)
+
+        watermark.advance(0, 40)
+        self.assertEqual(watermark.value, 40)
+        watermark.advance(0, 30)
+        self.assertEqual(watermark.value, 40)
+
+        watermark.finish(0)
+        self.assertEqual(watermark.value, 150)
+        watermark.finish(1)
+        self.assertEqual(watermark.value, 300)
@@ -0,0 +1,81 @@
+"""Unittest module for segmented download."""
+import asyncio
+import sys
+import unittest
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+from module.segmented_download import (
+    CHUNK_SIZE,
+    download_segments,
+    get_missing_size,
+    split_ranges,
+)
+
+
+class MockClient:
+    def __init__(self, chunk_count: int, fail_offset: int = -1):
+        self.chunk_count = chunk_count
+        self.fail_offset = fail_offset
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def stream_media(self, _message, offset: int = 0, limit: int = 0):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            for idx in range(offset, min(self.chunk_count, offset + limit)):
+                await asyncio.sleep(0)
+                if idx == self.fail_offset:
+                    raise ValueError("stream error")
+                yield bytes([idx % 256])
+        finally:
+            self.in_flight -= 1
+
+
+class SegmentedDownloadTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_split_ranges(self):
+        self.assertEqual(split_ranges([], 4), [])
+        self.assertEqual(
+            split_ranges([(0, 15)], 4), [(0, 3), (4, 7), (8, 11), (12, 15)]
+        )
+        # small ranges are not cut below the minimum segment size
+        self.assertEqual(split_ranges([(0, 5), (10, 11)], 4), [(0, 3), (4, 5), (10, 11)])
+        self.assertEqual(split_ranges([(0, 99)], 1), [(0, 99)])
+
+    def test_get_missing_size(self):
+        media_size = 3 * CHUNK_SIZE + 10
+        self.assertEqual(get_missing_size([(0, 3)], media_size), media_size)
+        self.assertEqual(get_missing_size([(3, 3)], media_size), 10)
+        self.assertEqual(get_missing_size([(1, 1), (3, 3)], media_size), CHUNK_SIZE + 10)
+
+    def test_download_segments(self):
+        client = MockClient(40)
+        received = {}
+
+        async def on_chunk(chunk_idx, chunk):
+            received[chunk_idx] = chunk
+
+        self.loop.run_until_complete(
+            download_segments(client, None, [(0, 9), (20, 39)], on_chunk, 3)
+        )
+        self.assertEqual(sorted(received), list(range(10)) + list(range(20, 40)))
+        self.assertEqual(received[25], bytes([25]))
+        self.assertEqual(client.max_in_flight, 3)
+
+    def test_download_segments_error(self):
+        client = MockClient(40, fail_offset=5)
+
+        async def on_chunk(_chunk_idx, _chunk):
+            pass
+
+        with self.assertRaises(ValueError):
+            self.loop.run_until_complete(
+                download_segments(client, None, [(0, 39)], on_chunk, 4)
+            )
+        self.assertEqual(client.in_flight, 0)
@@ -0,0 +1,142 @@
+"""Unittest module for sqlmodel."""
+import os
+import sys
+import tempfile
+import unittest
+
+from peewee import SqliteDatabase
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+import module.sqlmodel
+from module.sqlmodel import Downloaded
+
+
+def _add(chat_id, message_id, status):
+    Downloaded(
+        chat_id=chat_id, message_id=message_id, chat_username="", status=status
+    ).save()
+
+
+class DownloadedTestCase(unittest.TestCase):
+    def setUp(self):
+        # a file, the write-behind thread opens its own connection
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_db = SqliteDatabase(os.path.join(self.temp_dir.name, "test.db"))
+        self.bind = self.test_db.bind_ctx([Downloaded])
+        self.bind.__enter__()
+        self.test_db.create_tables([Downloaded])
+        self.downloaded = Downloaded()
+
+    def tearDown(self):
+        self.downloaded.stop_writer()
+        module.sqlmodel._upsert_ready = False
+        self.bind.__exit__(None, None, None)
+        self.test_db.close()
+        self.temp_dir.cleanup()
+
+    def test_get_status_batch(self):
+        _add(1, 10, 1)
+        _add(1, 11, 2)
+        _add(2, 10, 3)
+        # a duplicate row, the first one wins like in getStatus
+        _add(1, 11, 4)
+
+        self.assertEqual(
+            self.downloaded.get_status_batch(1, [10, 11, 12]), {10: 1, 11: 2}
+        )
+        self.assertEqual(
+            self.downloaded.get_status_batch(1, range(0, 20), batch_size=3),
+            {10: 1, 11: 2},
+        )
+        self.assertEqual(self.downloaded.get_status_batch(3, [10]), {})
+        self.assertEqual(self.downloaded.getStatus(1, 11), 2)
+
+    def test_load_retry_msg(self):
+        for message_id in range(10, 0, -1):
+            _add(1, message_id, 2)
+        _add(1, 11, 1)
+        _add(2, 5, 2)
+
+        self.assertEqual(self.downloaded.get_retry_ids_page(1, "", page_size=3), [1, 2, 3])
+        self.assertEqual(self.downloaded.get_retry_ids_page(1, "", 3, page_size=3), [4, 5, 6])
+        self.assertEqual(self.downloaded.get_retry_ids_page(1, "", 9, page_size=3), [10])
+        self.assertEqual(self.downloaded.get_retry_ids_page(1, "", 10), [])
+        self.assertEqual(self.downloaded.get_retry_ids_page(3, ""), [])
+        self.assertEqual(
+            sorted(self.downloaded.load_retry_msg_from_db(), key=lambda chat: chat["chat_id"]),
+            [{"chat_id": 1, "chat_username": ""}, {"chat_id": 2, "chat_username": ""}],
+        )
+
+    def test_write_behind(self):
+        msg_dict = {
+            "chat_id": 1,
+            "message_id": 20,
+            "filename": "a.mp4",
+            "caption": "",
+            "title": "a",
+            "mime_type": "video/mp4",
+            "media_size": 10,
+            "media_duration": 1,
+            "media_addtime": "",
+            "chat_username": None,
+            "chat_title": "",
+            "msg_type": "video",
+            "msg_link": "",
+            "status": 2,
+        }
+        _add(1, 21, 2)
+        self.downloaded.start_writer(batch_size=100, flush_interval=60)
+        self.downloaded.insert_into_db(msg_dict)
+        self.downloaded.insert_into_db(dict(msg_dict, status=1))
+        self.downloaded.insert_into_db(dict(msg_dict, message_id=21, status=1))
+
+        # pending writes are visible before they are committed
+        self.assertEqual(self.downloaded.getStatus(1, 20), 1)
+        self.assertEqual(self.downloaded.get_status_batch(1, [20, 21]), {20: 1, 21: 1})
+        self.assertEqual(Downloaded.select().count(), 1)
+
+        self.downloaded.stop_writer()
+        rows = {
+            row.message_id: row.status
+            for row in Downloaded.select().where(Downloaded.chat_id == 1)
+        }
+        self.assertEqual(rows, {20: 1, 21: 1})
+
+    def test_write_behind_bad_meta(self):
+        self.downloaded.start_writer(batch_size=100, flush_interval=60)
+        # empty and partial metas are skipped, not raised into the page transaction
+        self.downloaded.insert_into_db({})
+        self.downloaded.insert_into_db({"chat_id": 1, "message_id": 40, "status": 1})
+        self.downloaded.stop_writer()
+        self.assertEqual(Downloaded.select().count(), 0)
+
+    def test_write_behind_upsert(self):
+        _add(1, 30, 2)
+        self.assertEqual(self.downloaded.migrate_db(), 2)
+        self.downloaded.start_writer(batch_size=100, flush_interval=60)
+        for message_id in range(30, 33):
+            self.downloaded.insert_into_db(
+                {
+                    "chat_id": 1,
+                    "message_id": message_id,
+                    "filename": "",
+                    "caption": "",
+                    "title": "",
+                    "mime_type": "",
+                    "media_size": 0,
+                    "media_duration": 0,
+                    "media_addtime": "",
+                    "chat_username": None,
+                    "chat_title": "",
+                    "msg_type": "",
+                    "msg_link": "",
+                    "status": 1,
+                }
+            )
+        self.downloaded.stop_writer()
+        rows = {
+            row.message_id: row.status
+            for row in Downloaded.select().where(Downloaded.chat_id == 1)
+        }
+        self.assertEqual(rows, {30: 1, 31: 1, 32: 1})
+        self.assertEqual(Downloaded.select().count(), 3)
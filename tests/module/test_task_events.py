@@ -0,0 +1,73 @@
+"""Unittest module for task events."""
+import asyncio
+import sys
+import threading
+import unittest
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+from module.app import DownloadStatus, TaskNode
+from module.download_stat import DownloadState, get_download_state, set_download_state
+from module.task_events import StateSignal, download_state_changed
+
+
+class StateSignalTestCase(unittest.TestCase):
+    def test_wait_for(self):
+        signal = StateSignal()
+        state = {"value": 0}
+
+        async def _test():
+            waiter = asyncio.create_task(signal.wait_for(lambda: state["value"] == 2))
+            await asyncio.sleep(0)
+            self.assertEqual(signal.waiters, 1)
+
+            state["value"] = 1
+            signal.notify()
+            await asyncio.sleep(0.01)
+            self.assertFalse(waiter.done())
+
+            state["value"] = 2
+            signal.notify()
+            await asyncio.wait_for(waiter, timeout=1)
+            self.assertEqual(signal.waiters, 0)
+
+        asyncio.run(_test())
+
+    def test_notify_from_thread(self):
+        async def _test():
+            waiter = asyncio.create_task(
+                download_state_changed.wait_for(
+                    lambda: get_download_state() == DownloadState.Downloading
+                )
+            )
+            await asyncio.sleep(0)
+            # the web server resumes from its own thread
+            thread = threading.Thread(
+                target=set_download_state, args=(DownloadState.Downloading,)
+            )
+            thread.start()
+            thread.join()
+            await asyncio.wait_for(waiter, timeout=1)
+
+        set_download_state(DownloadState.StopDownload)
+        asyncio.run(_test())
+
+    def test_wait_finish(self):
+        node = TaskNode(chat_id=1)
+        node.is_running = True
+        node.total_task = 2
+
+        async def _test():
+            waiter = asyncio.create_task(node.wait_finish())
+            node.stat(DownloadStatus.SuccessDownload)
+            await asyncio.sleep(0.01)
+            self.assertFalse(waiter.done())
+            node.stat(DownloadStatus.SkipDownload)
+            await asyncio.wait_for(waiter, timeout=1)
+
+            stopped = TaskNode(chat_id=2)
+            waiter = asyncio.create_task(stopped.wait_finish())
+            await asyncio.sleep(0)
+            stopped.stop_transmission()
+            await asyncio.wait_for(waiter, timeout=1)
+
+        asyncio.run(_test())
@@ -0,0 +1,88 @@
+"""Unittest module for the web api."""
+import asyncio
+import json
+import sys
+import unittest
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+from module.download_stat import get_progress_store
+from module.web import get_flask_app, get_web_server
+from module.web_server import Request
+
+
+def _get(path: str, headers: dict = None):
+    return asyncio.run(get_web_server().dispatch(Request("GET", path, headers or {})))
+
+
+async def _read_event(body) -> dict:
+    async for chunk in body:
+        text = chunk.decode()
+        if text.startswith("event:"):
+            event, data = text.strip().split("\n")
+            return {"event": event[len("event: ") :], "data": json.loads(data[len("data: ") :])}
+    return {}
+
+
+class WebApiTestCase(unittest.TestCase):
+    def setUp(self):
+        self.flask_app = get_flask_app()
+        self.flask_app.config["LOGIN_DISABLED"] = True
+        self.store = get_progress_store()
+
+    def tearDown(self):
+        self.flask_app.config["LOGIN_DISABLED"] = False
+
+    def test_downloads_page(self):
+        for message_id in range(1, 4):
+            self.store.update("web_page", message_id, 10, 100, 'dir/a"b.mp4', 0, 9)
+
+        data = json.loads(_get("/api/v1/downloads?chat=web_page&limit=2").body)
+        self.assertEqual([item["message_id"] for item in data["items"]], [1, 2])
+        self.assertEqual(data["items"][0]["file_name"], 'a"b.mp4')
+        self.assertEqual(data["items"][0]["progress"], 10.0)
+
+        data = json.loads(
+            _get(f"/api/v1/downloads?chat=web_page&limit=2&cursor={data['next_cursor']}").body
+        )
+        self.assertEqual([item["message_id"] for item in data["items"]], [3])
+        self.assertIsNone(data["next_cursor"])
+
+        self.assertEqual(_get("/api/v1/downloads?cursor=x").status, 400)
+
+    def test_download_list_escapes(self):
+        self.store.update("web_list", 1, 100, 100, 'c:\\dir\\a"b.mp4', 0)
+        data = json.loads(_get("/get_download_list?already_down=true").body)
+        names = [item["filename"] for item in data if item["chat"] == "web_list"]
+        self.assertEqual(names, ['c:\\dir\\a"b.mp4'])
+
+    def test_login_required(self):
+        self.flask_app.config["LOGIN_DISABLED"] = False
+        self.assertEqual(_get("/api/v1/downloads").status, 401)
+        self.assertEqual(_get("/get_download_status").status, 401)
+        # pages are still served by flask, which redirects to the login page
+        self.assertTrue(_get("/").status.startswith("302"))
+
+    def test_stream(self):
+        async def _stream():
+            self.store.update("web_stream", 1, 10, 100, "a.mp4", 0)
+            response = await get_web_server().dispatch(
+                Request("GET", "/api/v1/downloads/stream?chat=web_stream&tick=0.2", {})
+            )
+            self.assertEqual(response.headers[0], ("Content-Type", "text/event-stream"))
+            try:
+                event = await _read_event(response.body)
+                self.assertEqual(event["event"], "snapshot")
+                self.assertEqual([item["message_id"] for item in event["data"]["items"]], [1])
+
+                self.store.update("web_other", 1, 10, 100, "b.mp4", 0)
+                self.store.update("web_stream", 1, 100, 100, "a.mp4", 0)
+                event = await _read_event(response.body)
+                self.assertEqual(event["event"], "delta")
+                self.assertEqual(
+                    [(item["message_id"], item["state"]) for item in event["data"]["items"]],
+                    [(1, "done")],
+                )
+            finally:
+                await response.body.aclose()
+
+        asyncio.run(_stream())
@@ -0,0 +1,71 @@
+"""Unittest module for the asyncio web server."""
+import asyncio
+import sys
+import unittest
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+from module.web_server import AsyncWebServer, Response
+
+
+def _wsgi_app(environ, start_response):
+    body = environ["wsgi.input"].read(int(environ.get("CONTENT_LENGTH") or 0))
+    start_response("201 Created", [("Content-Type", "text/plain"), ("Content-Length", "1")])
+    return [environ["PATH_INFO"].encode() + b":" + body]
+
+
+async def _read_response(reader: asyncio.StreamReader):
+    head = (await reader.readuntil(b"\r\n\r\n")).decode()
+    lines = head.split("\r\n")
+    headers = dict(line.split(": ", 1) for line in lines[1:] if line)
+    body = await reader.readexactly(int(headers.get("Content-Length", 0)))
+    return lines[0], headers, body
+
+
+class AsyncWebServerTestCase(unittest.TestCase):
+    def test_serve(self):
+        server = AsyncWebServer(_wsgi_app)
+
+        @server.route("/hello")
+        async def _hello(req):
+            return Response(f"hello {req.args.get('name')}")
+
+        @server.route("/events")
+        async def _events(_):
+            async def _body():
+                for idx in range(3):
+                    await asyncio.sleep(0)
+                    yield f"data: {idx}\n\n".encode()
+
+            return Response(_body(), content_type="text/event-stream")
+
+        async def _run():
+            await server.start("127.0.0.1", 0)
+            try:
+                reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+                # two requests on one kept alive connection
+                writer.write(b"GET /hello?name=a%20b HTTP/1.1\r\nHost: x\r\n\r\n")
+                status, _, body = await _read_response(reader)
+                self.assertEqual(status, "HTTP/1.1 200 OK")
+                self.assertEqual(body, b"hello a b")
+
+                writer.write(b"POST /form HTTP/1.1\r\nContent-Length: 3\r\n\r\nabc")
+                status, headers, body = await _read_response(reader)
+                self.assertEqual(status, "HTTP/1.1 201 Created")
+                self.assertEqual(headers["Content-Length"], "9")
+                self.assertEqual(body, b"/form:abc")
+
+                writer.write(b"GET /events HTTP/1.1\r\n\r\n")
+                head = await reader.readuntil(b"\r\n\r\n")
+                self.assertIn(b"Connection: close", head)
+                self.assertEqual(await reader.read(), b"data: 0\n\ndata: 1\n\ndata: 2\n\n")
+                writer.close()
+
+                reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+                writer.write(b"BROKEN\r\n\r\n")
+                status, _, _ = await _read_response(reader)
+                self.assertEqual(status, "HTTP/1.1 400 Bad Request")
+                writer.close()
+            finally:
+                await server.stop()
+
+        asyncio.run(_run())
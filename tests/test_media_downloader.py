@@ -15,6 +15,8 @@ from media_downloader import (
     _can_download,
     _check_config,
     _get_media_meta,
+    _get_page_db_statuses,
+    _scan_chat_history,
     _is_exist,
     app,
     download_all_chat,
@@ -1094,3 +1096,60 @@ class MediaDownloaderTestCase(unittest.TestCase):
     @classmethod
     def tearDownClass(cls):
         cls.loop.close()
+
+
+class PageDbStatusTestCase(unittest.TestCase):
+    def test_forwarded_message_uses_meta_ids(self):
+        calls = []
+
+        async def get_status_batch(chat_id, message_ids):
+            calls.append((chat_id, sorted(message_ids)))
+            return {7: 1, 20: 2} if chat_id == 555 else {3: 1}
+
+        forwarded = MockMessage(id=1, media=True, chat_id=-1000000000123)
+        plain = MockMessage(id=3, media=True, chat_id=-1000000000123)
+        broken = MockMessage(id=20, media=True, chat_id=-1000000000123)
+        msg_dicts = [
+            # 转发消息按来源聊天入库
+            (forwarded, {"chat_id": 555, "message_id": 7}),
+            (plain, {"chat_id": 123, "message_id": 3}),
+            # 元数据读取失败 退回消息本身的id
+            (broken, {}),
+        ]
+        with mock.patch("media_downloader.async_db.get_status_batch", new=get_status_batch):
+            statuses = asyncio.run(_get_page_db_statuses(msg_dicts))
+
+        self.assertEqual(statuses, {1: 1, 3: 1})
+        self.assertEqual(sorted(calls), [(123, [3, 20]), (555, [7])])
+
+
+class ScanCheckpointTestCase(unittest.TestCase):
+    def test_watermark_waits_for_page_flush(self):
+        from module.scan_watermark import ScanWatermark
+
+        node = TaskNode(chat_id=123)
+        node.scan_watermark = ScanWatermark([(11, 11)])
+        seen_watermarks = []
+        queued = []
+
+        async def history(*args, **kwargs):
+            for message_id in range(11, 16):
+                yield MockMessage(id=message_id, media=True, chat_id=-1000000000123)
+                # skipped messages are recorded at once, buffered ones are not
+                seen_watermarks.append(node.scan_watermark.value)
+
+        async def add_download_tasks(page, node):
+            queued.extend(message.id for message in page)
+
+        with mock.patch("media_downloader.get_chat_history_v2", new=history), mock.patch(
+            "media_downloader.add_download_tasks", new=add_download_tasks
+        ), mock.patch(
+            "media_downloader.need_skip_message",
+            new=lambda message, *args: message.id % 2 == 0,
+        ):
+            asyncio.run(_scan_chat_history(None, 123, None, node, 10, 0))
+
+        self.assertEqual(seen_watermarks, [10] * 5)
+        self.assertEqual(node.download_status.max_id, 14)
+        self.assertEqual(queued, [11, 13, 15])
+        self.assertEqual(node.scan_watermark.value, 15)
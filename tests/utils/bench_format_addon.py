@@ -0,0 +1,125 @@
+"""Micro benchmark for process_string.
+
+Run from the repository root::
+
+    python tests/utils/bench_format_addon.py
+
+Compares the previous per call pipeline (search and sub for every waste
+pattern, a new OpenCC per call) with ``StringNormalizer``, uncached and
+cached, and checks that all of them produce the same output.
+"""
+import os
+import random
+import string
+import sys
+import timeit
+
+import regex as re
+import zhon.hanzi
+from opencc import OpenCC
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+from utils.format_addon import WASTE_WORDS_PATTERNS, StringNormalizer
+
+
+def legacy_process_string(string_a: str):
+    """process_string as it was before StringNormalizer"""
+    if not string_a or string_a == "":
+        return ""
+    a = string_a
+    if string_a.lower().endswith("mp3"):
+        a = re.sub("mp3", "", a, flags=re.IGNORECASE)
+    elif string_a.lower().endswith("mp4"):
+        a = re.sub("mp4", "", a, flags=re.IGNORECASE)
+    elif string_a.lower().endswith("txt"):
+        a = re.sub("txt", "", a, flags=re.IGNORECASE)
+
+    for waste_pattern in WASTE_WORDS_PATTERNS:
+        if re.search(waste_pattern, a, flags=re.IGNORECASE):
+            a = re.sub(waste_pattern, "", a, flags=re.IGNORECASE)
+
+    pattern = (
+        r"[^\u4e00-\u9fff\u3040-\u30ff\u31f0-\u31ff\u3400-\u4dbf\uac00-\ud7af"
+        r"\u3000-\u303f\ufe10-\ufe1f\ufe30-\ufe4f\uff00-\uffef\w\s\p{P}]"
+    )
+    a = re.sub(pattern, " ", a)
+
+    match = re.compile(r"(^\d+[\s_]*)([^\d].+)").match(a)
+    if match:
+        a = match.groups()[-1]
+
+    match = re.compile(r"(.+\d+?)_(\d.+)").match(a)
+    if match:
+        a = f"{match.groups()[0]}-{match.groups()[1]}"
+
+    match = re.compile(r"(.*?)([(（【]\d+[)）】])$").match(a)
+    if match:
+        a = match.groups()[0]
+
+    match = re.compile(r"([a-zA-Z0-9\u4e00-\u9fa5].+)(\([0-9]+\)+)+").match(a)
+    last_part = ""
+    if match:
+        a, last_part = match.groups()
+        last_part = re.sub(r"[()（）【】]", "", last_part)
+    a = a + " " + last_part
+
+    a = re.sub("[{}]".format(string.punctuation), " ", a)
+    a = re.sub("[{}]".format(zhon.hanzi.punctuation), " ", a)
+
+    r_str = r"[\/\\\:\*\?\"\<\>#\.\|\n/\:*?\"<>\|_ ，、。？！@#￥%……&*（）+：；《》+【】\]\[]"
+    a = (
+        re.sub(r_str, " ", a)
+        .replace("  ", " ")
+        .replace("--", "-")
+        .replace("——", "-")
+        .replace("～", "-")
+        .strip()
+    )
+    while "  " in a:
+        a = a.replace("  ", " ")
+    return OpenCC("t2s").convert(a)
+
+
+def make_corpus(count: int, seed: int = 1):
+    """Names shaped like channel file names, some with waste words"""
+    rnd = random.Random(seed)
+    words = ["第一集", "Hello", "世界", "測試", "音频", "完結篇", "Part", "故事", "夜晚"]
+    waste = ["音声", "【ASMR 合集】", "（未删节）", "作者:某人", "2023_01_02", "直播", "全本"]
+    corpus = []
+    for i in range(count):
+        name = " ".join(rnd.sample(words, 3))
+        if rnd.random() < 0.3:
+            name = f"{rnd.choice(waste)}{name}"
+        if rnd.random() < 0.3:
+            name = f"[{i}]{name}({rnd.randint(1, 9)})"
+        corpus.append(name + rnd.choice(["", ".mp4", "_mp3", " 01"]))
+    return corpus
+
+
+def main():
+    corpus = make_corpus(500)
+    normalizer = StringNormalizer(waste_word_file=None)
+    uncached = normalizer._process  # pylint: disable = W0212
+
+    mismatch = [i for i in corpus if legacy_process_string(i) != uncached(i)]
+    print(f"mismatches: {len(mismatch)}/{len(corpus)}")
+
+    def _run(func):
+        return lambda: [func(i) for i in corpus]
+
+    results = {}
+    for name, func in [
+        ("legacy", legacy_process_string),
+        ("compiled", uncached),
+        ("cached", normalizer.normalize),
+    ]:
+        seconds = min(timeit.repeat(_run(func), number=1, repeat=5))
+        results[name] = seconds / len(corpus) * 1e6
+        print(f"{name:>9}: {results[name]:8.1f} us/call")
+
+    print(f"speedup compiled x{results['legacy'] / results['compiled']:.1f}, "
+          f"cached x{results['legacy'] / results['cached']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Unittest module for checkpoint journal."""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+from utils.checkpoint_journal import CheckpointJournal, atomic_write
+
+
+class CheckpointJournalTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "config.yaml.journal")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _lines(self):
+        with open(self.path, encoding="utf-8") as f:
+            return f.readlines()
+
+    def test_append_only_changes(self):
+        journal = CheckpointJournal(self.path, fsync=False)
+        self.assertTrue(journal.append(1, last_read_message_id=10, ids_to_retry=[3]))
+        self.assertFalse(journal.append(1, last_read_message_id=10, ids_to_retry=[3]))
+        self.assertTrue(journal.append(1, last_read_message_id=20, ids_to_retry=[3]))
+        self.assertTrue(journal.append("name", last_read_message_id=5))
+        journal.close()
+
+        lines = self._lines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[1], '{"chat_id": 1, "last_read_message_id": 20}\n')
+        self.assertEqual(journal.size, os.path.getsize(self.path))
+
+    def test_load_skips_torn_line(self):
+        journal = CheckpointJournal(self.path, fsync=False)
+        journal.append(1, last_read_message_id=10, ids_to_retry=[3, 4])
+        journal.append(1, last_read_message_id=20)
+        journal.close()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write('{"chat_id": 1, "last_read_mes')
+
+        journal = CheckpointJournal(self.path, fsync=False)
+        self.assertEqual(
+            journal.load(), {1: {"last_read_message_id": 20, "ids_to_retry": [3, 4]}}
+        )
+        # what was loaded is not written again
+        self.assertFalse(journal.append(1, last_read_message_id=20))
+
+    def test_compact(self):
+        journal = CheckpointJournal(self.path, max_size=100, fsync=False)
+        for i in range(10):
+            journal.append(1, last_read_message_id=i)
+        self.assertTrue(journal.needs_compact)
+
+        journal.compact({1: {"last_read_message_id": 9, "ids_to_retry": []}})
+        self.assertFalse(journal.needs_compact)
+        self.assertEqual(len(self._lines()), 1)
+        self.assertFalse(os.path.exists(f"{self.path}.tmp"))
+
+        journal.append(1, last_read_message_id=10)
+        journal.close()
+        self.assertEqual(
+            CheckpointJournal(self.path).load(),
+            {1: {"last_read_message_id": 10, "ids_to_retry": []}},
+        )
+
+    def test_atomic_write(self):
+        path = os.path.join(self.temp_dir.name, "config.yaml")
+        atomic_write(path, lambda f: f.write("a: 1\n"))
+
+        def _fail(f):
+            f.write("a: ")
+            raise OSError("disk full")
+
+        with self.assertRaises(OSError):
+            atomic_write(path, _fail)
+        with open(path, encoding="utf-8") as f:
+            self.assertEqual(f.read(), "a: 1\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+"""Unittest module for chunk manifest."""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+from utils.chunk_manifest import ChunkManifest
+
+
+class ChunkManifestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "1.manifest")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_mark_done_and_resume(self):
+        manifest = ChunkManifest(self.path, 10 * 4 + 2, chunk_size=4)
+        self.assertEqual(manifest.chunk_count, 11)
+        self.assertEqual(manifest.missing_ranges(), [(0, 10)])
+
+        self.assertTrue(manifest.mark_done(3, b"abcd"))
+        self.assertTrue(manifest.mark_done(10, b"ef"))
+        # wrong size for the chunk is rejected
+        self.assertFalse(manifest.mark_done(4, b"abc"))
+        self.assertEqual(manifest.missing_ranges(), [(0, 2), (4, 9)])
+        manifest.close()
+
+        manifest = ChunkManifest(self.path, 10 * 4 + 2, chunk_size=4)
+        self.assertEqual(manifest.missing_ranges(), [(0, 2), (4, 9)])
+        for idx in [0, 1, 2, 4, 5, 6, 7, 8, 9]:
+            manifest.mark_done(idx, b"abcd")
+        self.assertTrue(manifest.is_complete())
+        manifest.remove()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_other_file_starts_over(self):
+        manifest = ChunkManifest(self.path, 8, chunk_size=4)
+        manifest.mark_done(0, b"abcd")
+        manifest.close()
+
+        manifest = ChunkManifest(self.path, 12, chunk_size=4)
+        self.assertEqual(manifest.missing_ranges(), [(0, 2)])
+        manifest.close()
+
+    def test_torn_line_ignored(self):
+        manifest = ChunkManifest(self.path, 8, chunk_size=4)
+        manifest.mark_done(0, b"abcd")
+        manifest.close()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("1 4")
+
+        manifest = ChunkManifest(self.path, 8, chunk_size=4)
+        self.assertEqual(manifest.missing_ranges(), [(1, 1)])
+        manifest.close()
+
+    def test_seed_from_dir(self):
+        chunk_dir = os.path.join(self.temp_dir.name, "1")
+        os.makedirs(chunk_dir)
+        for idx, data in [(0, b"abcd"), (1, b"ab"), (2, b"ij")]:
+            with open(os.path.join(chunk_dir, f"{idx:08d}"), "wb") as f:
+                f.write(data)
+
+        manifest = ChunkManifest(self.path, 10, chunk_size=4, chunk_dir=chunk_dir)
+        # chunk 1 is short, so it is still missing
+        self.assertEqual(manifest.missing_ranges(), [(1, 1)])
+        self.assertTrue(os.path.exists(self.path))
+        manifest.close()
+
+    def test_verify_checksum(self):
+        chunk_dir = os.path.join(self.temp_dir.name, "1")
+        os.makedirs(chunk_dir)
+        manifest = ChunkManifest(self.path, 8, chunk_size=4)
+        for idx, data in [(0, b"abcd"), (1, b"efgh")]:
+            with open(os.path.join(chunk_dir, f"{idx:08d}"), "wb") as f:
+                f.write(data)
+            manifest.mark_done(idx, data, with_checksum=True)
+
+        with open(os.path.join(chunk_dir, "00000001"), "wb") as f:
+            f.write(b"xxxx")
+        self.assertEqual(manifest.verify(chunk_dir), [1])
+        self.assertEqual(manifest.missing_ranges(), [(1, 1)])
+        self.assertFalse(manifest.is_complete())
+        manifest.close()
+
+        manifest = ChunkManifest(self.path, 8, chunk_size=4)
+        self.assertEqual(manifest.missing_ranges(), [(1, 1)])
+        manifest.close()
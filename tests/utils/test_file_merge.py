@@ -0,0 +1,84 @@
+"""Unittest module for file merge."""
+import errno
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+from utils import file_merge
+from utils.file_merge import get_merge_stats, merge_chunk_files
+from utils.format_addon import merge_files_auto, merge_files_write
+
+
+class FileMergeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.chunk_dir = os.path.join(self.temp_dir.name, "chunks")
+        os.makedirs(self.chunk_dir)
+        self.expected = b""
+        for idx in range(5):
+            data = bytes([idx]) * (4096 * 3 if idx < 4 else 1000)
+            with open(os.path.join(self.chunk_dir, f"{idx:08d}"), "wb") as f:
+                f.write(data)
+            self.expected += data
+        self.chunk_files = [
+            os.path.join(self.chunk_dir, i) for i in sorted(os.listdir(self.chunk_dir))
+        ]
+        self.output_file = os.path.join(self.temp_dir.name, "out", "merged.bin")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _read_output(self) -> bytes:
+        with open(self.output_file, "rb") as f:
+            return f.read()
+
+    def test_strategies(self):
+        for strategy in ["auto"] + file_merge.MERGE_STRATEGIES:
+            with self.subTest(strategy=strategy):
+                used = merge_chunk_files(self.chunk_files, self.output_file, strategy)
+                self.assertIn(used, file_merge.MERGE_STRATEGIES)
+                self.assertEqual(self._read_output(), self.expected)
+
+    def test_fallback(self):
+        def _unsupported(*_args):
+            raise OSError(errno.EXDEV, "cross device")
+
+        before = get_merge_stats()["copy"]
+        with mock.patch.dict(
+            file_merge._COPY_FUNCS,
+            {
+                "reflink": _unsupported,
+                "copy_file_range": _unsupported,
+                "sendfile": _unsupported,
+            },
+        ):
+            used = merge_chunk_files(self.chunk_files, self.output_file, "auto")
+
+        self.assertEqual(used, "copy")
+        self.assertEqual(self._read_output(), self.expected)
+        after = get_merge_stats()["copy"]
+        self.assertEqual(after["bytes"] - before["bytes"], len(self.expected))
+        self.assertEqual(after["files"] - before["files"], 1)
+        self.assertEqual(after["fallbacks"] - before["fallbacks"], 1)
+
+    def test_real_error_removes_output(self):
+        def _broken(*_args):
+            raise OSError(errno.ENOSPC, "no space")
+
+        with mock.patch.dict(file_merge._COPY_FUNCS, {"copy": _broken}):
+            with self.assertRaises(OSError):
+                merge_chunk_files(self.chunk_files, self.output_file, "copy")
+        self.assertFalse(os.path.exists(self.output_file))
+
+    def test_invalid_strategy(self):
+        with self.assertRaises(ValueError):
+            merge_chunk_files(self.chunk_files, self.output_file, "rsync")
+
+    def test_format_addon_merge(self):
+        merge_files_auto(self.chunk_dir, self.output_file)
+        self.assertEqual(self._read_output(), self.expected)
+        merge_files_write(self.chunk_dir, self.output_file)
+        self.assertEqual(self._read_output(), self.expected)
@@ -0,0 +1,40 @@
+"""Unittest module for format addon."""
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+from utils.format_addon import StringNormalizer, process_string
+
+
+class StringNormalizerTestCase(unittest.TestCase):
+    def test_process_string(self):
+        self.assertEqual(process_string(""), "")
+        self.assertEqual(process_string("【音声合集】你好 世界mp4"), "你好 世界")
+        self.assertEqual(process_string("[123]Hello_World(2)"), "123 Hello World")
+        self.assertEqual(process_string("繁體中文測試"), "繁体中文测试")
+
+    def test_waste_word_file_reload(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            waste_word_file = os.path.join(temp_dir, "waste_words.json")
+            normalizer = StringNormalizer(waste_word_file, reload_interval=0)
+            self.assertEqual(normalizer.normalize("自定义废词 故事"), "自定义废词 故事")
+
+            with open(waste_word_file, "w", encoding="utf-8") as f:
+                json.dump(["自定义废词"], f, ensure_ascii=False)
+            os.utime(waste_word_file, (1, 1))
+            self.assertEqual(normalizer.normalize("自定义废词 故事"), "故事")
+
+            os.remove(waste_word_file)
+            self.assertEqual(normalizer.normalize("自定义废词 故事"), "自定义废词 故事")
+
+    def test_invalid_waste_word_pattern(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            waste_word_file = os.path.join(temp_dir, "waste_words.json")
+            with open(waste_word_file, "w", encoding="utf-8") as f:
+                json.dump(["abc(", "自定义废词"], f, ensure_ascii=False)
+            normalizer = StringNormalizer(waste_word_file, reload_interval=0)
+            self.assertEqual(normalizer.normalize("自定义废词 故事"), "故事")
+            self.assertEqual(normalizer.normalize("abc( 故事"), "abc 故事")
@@ -0,0 +1,77 @@
+"""Unittest module for sparse file writer."""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+from utils.sparse_file import ChunkBitmap, SparseFileWriter
+
+
+class SparseFileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "1.part")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_write_and_resume(self):
+        writer = SparseFileWriter(self.path, 10, chunk_size=4)
+        self.assertEqual(writer.chunk_count, 3)
+        self.assertEqual(os.path.getsize(self.path), 10)
+        self.assertEqual(writer.missing_ranges(), [(0, 2)])
+
+        self.assertTrue(writer.write_chunk(2, b"ij"))
+        # wrong size chunk is rejected
+        self.assertFalse(writer.write_chunk(0, b"ab"))
+        writer.close()
+
+        writer = SparseFileWriter(self.path, 10, chunk_size=4)
+        self.assertEqual(writer.missing_ranges(), [(0, 1)])
+        writer.write_chunk(0, b"abcd")
+        writer.write_chunk(1, b"efgh")
+        self.assertTrue(writer.is_complete())
+        writer.finish()
+
+        self.assertFalse(os.path.exists(self.path + ".bitmap"))
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), b"abcdefghij")
+
+    def test_bitmap_mismatch(self):
+        bitmap = ChunkBitmap(self.path + ".bitmap", 100, chunk_size=10)
+        bitmap.set(3)
+        bitmap.set(4)
+        bitmap.close()
+        self.assertEqual(bitmap.missing_ranges(), [(0, 2), (5, 9)])
+
+        # a sidecar written for another file size is discarded
+        bitmap = ChunkBitmap(self.path + ".bitmap", 200, chunk_size=10)
+        self.assertEqual(bitmap.done_count, 0)
+        self.assertEqual(bitmap.missing_ranges(), [(0, 19)])
+
+    def test_bits_persisted_after_sync(self):
+        writer = SparseFileWriter(self.path, 16, chunk_size=4, sync_chunks=2)
+        writer.write_chunk(0, b"abcd")
+        self.assertTrue(writer.bitmap.is_set(0))
+        # not fsynced yet, a crash now must not resume chunk 0 as done
+        self.assertEqual(ChunkBitmap(self.path + ".bitmap", 16, chunk_size=4).done_count, 0)
+
+        writer.write_chunk(1, b"efgh")
+        self.assertTrue(writer.needs_sync)
+        writer.sync()
+        self.assertFalse(writer.needs_sync)
+        self.assertEqual(
+            ChunkBitmap(self.path + ".bitmap", 16, chunk_size=4).missing_ranges(), [(2, 3)]
+        )
+        writer.close()
+
+    def test_oversized_part_is_truncated(self):
+        with open(self.path, "wb") as f:
+            f.write(b"x" * 20)
+        writer = SparseFileWriter(self.path, 10, chunk_size=4)
+        for idx, data in enumerate((b"abcd", b"efgh", b"ij")):
+            writer.write_chunk(idx, data)
+        writer.finish()
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), b"abcdefghij")
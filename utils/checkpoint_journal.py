@@ -0,0 +1,103 @@
+"""Append-only journal of the scan progress of every chat"""
+
+import json
+import os
+from typing import IO, Any, Callable, Dict, Optional, Union
+
+# chat id, or the username of a chat configured by name
+ChatKey = Union[int, str]
+
+
+def atomic_write(path: str, write: Callable[[IO], Any], fsync: bool = True):
+    """Write ``path`` through ``write(file)`` so it is replaced completely or not at all
+
+    The content goes to a temp file next to ``path`` first, which is then
+    renamed over it, a crash leaves either the old or the new file.
+    """
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        write(f)
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+class CheckpointJournal:
+    """Latest progress per chat, appended as one JSON line per change.
+
+    ``append`` writes only the fields of a chat that changed since they
+    were last written, so a checkpoint costs a few small appends instead
+    of dumping the whole config. ``load`` replays the lines in order, a
+    line cut off by a crash is ignored. ``compact`` atomically replaces
+    the journal with one line per chat, ``needs_compact`` tells when it
+    has grown past ``max_size`` bytes.
+    """
+
+    def __init__(self, path: str, max_size: int = 1024 * 1024, fsync: bool = True):
+        self.path = path
+        self.max_size = max_size
+        self.fsync = fsync
+        self._file: Optional[IO] = None
+        self._written: Dict[ChatKey, dict] = {}
+        self.size = os.path.getsize(path) if os.path.exists(path) else 0
+
+    def load(self) -> Dict[ChatKey, dict]:
+        """State of every chat in the journal"""
+        state: Dict[ChatKey, dict] = {}
+        if not os.path.exists(self.path):
+            return state
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # the last line of a crashed write
+                    continue
+                state.setdefault(record.pop("chat_id"), {}).update(record)
+        self._written = {key: dict(value) for key, value in state.items()}
+        return state
+
+    def _open(self) -> IO:
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        return self._file
+
+    def append(self, chat_id: ChatKey, **fields) -> bool:
+        """Record the fields of ``chat_id`` that changed, returns if any did"""
+        written = self._written.setdefault(chat_id, {})
+        changed = {
+            key: value for key, value in fields.items() if written.get(key) != value
+        }
+        if not changed:
+            return False
+        line = json.dumps({"chat_id": chat_id, **changed}) + "\n"
+        f = self._open()
+        f.write(line)
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+        self.size += len(line.encode())
+        written.update(changed)
+        return True
+
+    @property
+    def needs_compact(self) -> bool:
+        """If the journal should be folded into a snapshot"""
+        return self.size > self.max_size
+
+    def compact(self, state: Dict[ChatKey, dict]):
+        """Replace the journal with the snapshot ``state``"""
+        self.close()
+        lines = [
+            json.dumps({"chat_id": key, **value}) + "\n" for key, value in state.items()
+        ]
+        atomic_write(self.path, lambda f: f.writelines(lines), self.fsync)
+        self.size = sum(len(line.encode()) for line in lines)
+        self._written = {key: dict(value) for key, value in state.items()}
+
+    def close(self):
+        """Close the journal file"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,196 @@
+"""Resume manifest for chunked downloads"""
+
+import bisect
+import os
+import zlib
+from typing import IO, Dict, List, Optional, Tuple
+
+CHUNK_SIZE = 1024 * 1024
+
+_MANIFEST_HEADER = "#tdl-manifest"
+
+
+class ChunkManifest:
+    """Persistent record of the finished chunks of one download.
+
+    The manifest is a small append-only text file next to the chunk folder,
+    one ``index size [crc32]`` line per finished chunk. Missing chunks are kept
+    as a sorted list of inclusive ranges, so asking what is left costs
+    O(missing) instead of a directory listing and a stat per chunk.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        file_size: int,
+        chunk_size: int = CHUNK_SIZE,
+        chunk_dir: Optional[str] = None,
+    ):
+        self.path = path
+        self.file_size = file_size
+        self.chunk_size = chunk_size
+        self.chunk_count = max(1, -(-file_size // chunk_size))
+        self.chunks: Dict[int, Tuple[int, Optional[int]]] = {}
+        self.done_size = 0
+        # sorted, disjoint, inclusive (start, end) ranges of missing chunks
+        self._missing: List[Tuple[int, int]] = [(0, self.chunk_count - 1)]
+        self._file: Optional[IO[str]] = None
+
+        if not self._load() and chunk_dir and os.path.isdir(chunk_dir):
+            self._seed_from_dir(chunk_dir)
+
+    def _header(self) -> str:
+        return f"{_MANIFEST_HEADER} {self.file_size} {self.chunk_size}\n"
+
+    def chunk_length(self, idx: int) -> int:
+        """Expected byte size of chunk ``idx``"""
+        return min(self.chunk_size, self.file_size - idx * self.chunk_size)
+
+    def _load(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+
+        with open(self.path, encoding="utf-8") as f:
+            if f.readline() != self._header():
+                return False
+            for line in f:
+                fields = line.split()
+                # a torn last line from a crash is simply ignored
+                if len(fields) < 2 or not line.endswith("\n"):
+                    continue
+                try:
+                    idx, size = int(fields[0]), int(fields[1])
+                    checksum = int(fields[2]) if len(fields) > 2 else None
+                except ValueError:
+                    continue
+                self._record(idx, size, checksum)
+        return True
+
+    def _seed_from_dir(self, chunk_dir: str):
+        """Build the manifest once from a chunk folder of an older run"""
+        for file_name in os.listdir(chunk_dir):
+            if not file_name.isdigit():
+                continue
+            idx = int(file_name)
+            if 0 <= idx < self.chunk_count:
+                size = os.path.getsize(os.path.join(chunk_dir, file_name))
+                self._record(idx, size, None)
+        self._rewrite()
+
+    def _record(self, idx: int, size: int, checksum: Optional[int]) -> bool:
+        if not 0 <= idx < self.chunk_count or size != self.chunk_length(idx):
+            return False
+
+        if idx in self.chunks:
+            self.chunks[idx] = (size, checksum)
+            return True
+
+        pos = bisect.bisect_right(self._missing, (idx, self.chunk_count)) - 1
+        if pos < 0:
+            return False
+        start, end = self._missing[pos]
+        if not start <= idx <= end:
+            return False
+
+        pieces = []
+        if start < idx:
+            pieces.append((start, idx - 1))
+        if idx < end:
+            pieces.append((idx + 1, end))
+        self._missing[pos : pos + 1] = pieces
+
+        self.chunks[idx] = (size, checksum)
+        self.done_size += size
+        return True
+
+    def _rewrite(self):
+        """Write the whole manifest, used after seeding or dropping chunks"""
+        self.close()
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(self._header())
+            for idx in sorted(self.chunks):
+                size, checksum = self.chunks[idx]
+                f.write(self._line(idx, size, checksum))
+        os.replace(temp_path, self.path)
+
+    @staticmethod
+    def _line(idx: int, size: int, checksum: Optional[int]) -> str:
+        if checksum is None:
+            return f"{idx} {size}\n"
+        return f"{idx} {size} {checksum}\n"
+
+    def mark_done(self, idx: int, data: bytes, with_checksum: bool = False) -> bool:
+        """Record chunk ``idx`` as finished with the bytes written for it"""
+        checksum = zlib.crc32(data) if with_checksum else None
+        if not self._record(idx, len(data), checksum):
+            return False
+
+        manifest_file = self._file
+        if manifest_file is None:
+            if not os.path.exists(self.path):
+                with open(self.path, "w", encoding="utf-8") as f:
+                    f.write(self._header())
+            manifest_file = self._file = open(  # pylint: disable = R1732
+                self.path, "a", encoding="utf-8"
+            )
+        manifest_file.write(self._line(idx, len(data), checksum))
+        manifest_file.flush()
+        return True
+
+    def discard(self, indexes: List[int]):
+        """Forget finished chunks, e.g. after a checksum mismatch"""
+        changed = False
+        for idx in indexes:
+            if self.chunks.pop(idx, None) is None:
+                continue
+            changed = True
+            self.done_size -= self.chunk_length(idx)
+            bisect.insort(self._missing, (idx, idx))
+
+        if changed:
+            merged: List[Tuple[int, int]] = []
+            for start, end in self._missing:
+                if merged and merged[-1][1] + 1 >= start:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+                else:
+                    merged.append((start, end))
+            self._missing = merged
+            self._rewrite()
+
+    def verify(self, chunk_dir: str) -> List[int]:
+        """Re-read chunks that carry a checksum, drop and return the bad ones"""
+        bad = []
+        for idx, (_, checksum) in self.chunks.items():
+            if checksum is None:
+                continue
+            chunk_file = os.path.join(chunk_dir, f"{idx:08d}")
+            try:
+                with open(chunk_file, "rb") as f:
+                    if zlib.crc32(f.read()) == checksum:
+                        continue
+            except OSError:
+                pass
+            bad.append(idx)
+        self.discard(bad)
+        return bad
+
+    def missing_ranges(self) -> List[Tuple[int, int]]:
+        """Inclusive ``(start, end)`` ranges of chunks still missing"""
+        return list(self._missing)
+
+    def is_complete(self) -> bool:
+        """If every chunk is finished"""
+        return not self._missing and self.done_size == self.file_size
+
+    def close(self):
+        """Close the append handle"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        """Close and delete the manifest"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
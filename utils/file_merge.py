@@ -0,0 +1,226 @@
+"""Kernel side chunk merge"""
+
+import errno
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+# ioctl number of FICLONERANGE on linux, struct file_clone_range is <qQQQ
+_FICLONERANGE = 0x4020940D
+
+# strategies tried by ``auto``, fastest first
+MERGE_STRATEGIES = ["reflink", "copy_file_range", "sendfile", "copy"]
+
+# errors that mean "this strategy does not work here", not "the disk is broken"
+_UNSUPPORTED_ERRNO = {
+    errno.EXDEV,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EPERM,
+}
+
+_COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class MergeStat:
+    """Bytes and time spent per merge strategy"""
+
+    __slots__ = ("files", "bytes", "seconds", "fallbacks")
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.fallbacks = 0
+
+    def to_dict(self) -> dict:
+        """Stat with throughput in bytes per second"""
+        return {
+            "files": self.files,
+            "bytes": self.bytes,
+            "seconds": round(self.seconds, 3),
+            "fallbacks": self.fallbacks,
+            "throughput": int(self.bytes / self.seconds) if self.seconds else 0,
+        }
+
+
+_merge_stats: Dict[str, MergeStat] = {name: MergeStat() for name in MERGE_STRATEGIES}
+_merge_stats_lock = threading.Lock()
+
+
+def get_merge_stats() -> Dict[str, dict]:
+    """Throughput of every merge strategy used so far"""
+    with _merge_stats_lock:
+        return {name: stat.to_dict() for name, stat in _merge_stats.items()}
+
+
+def _record_stat(strategy: str, size: int, seconds: float, fallback: bool):
+    with _merge_stats_lock:
+        stat = _merge_stats[strategy]
+        stat.bytes += size
+        stat.seconds += seconds
+        if fallback:
+            stat.fallbacks += 1
+
+
+def _reflink(src_fd: int, dst_fd: int, size: int, dst_offset: int) -> int:
+    # pylint: disable = C0415
+    import fcntl
+    import struct
+
+    fcntl.ioctl(dst_fd, _FICLONERANGE, struct.pack("qQQQ", src_fd, 0, size, dst_offset))
+    return size
+
+
+def _copy_file_range(src_fd: int, dst_fd: int, size: int, dst_offset: int) -> int:
+    copied = 0
+    while copied < size:
+        sent = os.copy_file_range(
+            src_fd, dst_fd, size - copied, copied, dst_offset + copied
+        )
+        if sent == 0:
+            break
+        copied += sent
+    return copied
+
+
+def _sendfile(src_fd: int, dst_fd: int, size: int, dst_offset: int) -> int:
+    os.lseek(dst_fd, dst_offset, os.SEEK_SET)
+    copied = 0
+    while copied < size:
+        sent = os.sendfile(dst_fd, src_fd, copied, size - copied)
+        if sent == 0:
+            break
+        copied += sent
+    return copied
+
+
+def _copy(src_fd: int, dst_fd: int, size: int, dst_offset: int) -> int:
+    os.lseek(src_fd, 0, os.SEEK_SET)
+    os.lseek(dst_fd, dst_offset, os.SEEK_SET)
+    buffer = bytearray(min(_COPY_BUFFER_SIZE, max(size, 1)))
+    view = memoryview(buffer)
+    copied = 0
+    while copied < size:
+        if size - copied < len(buffer):
+            # the tail of the part, never read past ``size``
+            buffer = bytearray(size - copied)
+            view = memoryview(buffer)
+        read = os.readv(src_fd, [buffer])
+        if read == 0:
+            break
+        written = 0
+        while written < read:
+            written += os.write(dst_fd, view[written:read])
+        copied += read
+    return copied
+
+
+_COPY_FUNCS = {
+    "reflink": _reflink,
+    "copy_file_range": _copy_file_range,
+    "sendfile": _sendfile,
+    "copy": _copy,
+}
+
+
+def _is_available(strategy: str) -> bool:
+    if strategy == "reflink":
+        return os.name == "posix" and os.uname().sysname == "Linux"
+    if strategy == "copy_file_range":
+        return hasattr(os, "copy_file_range")
+    if strategy == "sendfile":
+        return hasattr(os, "sendfile")
+    return True
+
+
+def _candidates(strategy: str) -> List[str]:
+    if strategy == "auto":
+        return [name for name in MERGE_STRATEGIES if _is_available(name)]
+    if strategy not in _COPY_FUNCS:
+        raise ValueError(
+            f"Invalid merge strategy '{strategy}'. "
+            f"Supported are 'auto', {', '.join(repr(i) for i in MERGE_STRATEGIES)}."
+        )
+    # an explicit strategy still falls back to a plain copy
+    return [strategy, "copy"] if strategy != "copy" else ["copy"]
+
+
+def merge_chunk_files(
+    chunk_files: List[str], output_file: str, strategy: str = "auto"
+) -> Optional[str]:
+    """Concatenate ``chunk_files`` into ``output_file`` using kernel copies.
+
+    Parameters
+    ----------
+    chunk_files: List[str]
+        Chunk paths, in file order
+
+    output_file: str
+        The merged file, replaced if it exists
+
+    strategy: str
+        ``auto`` tries reflink, ``copy_file_range``, ``sendfile`` and a
+        buffered copy in that order, any other value from
+        ``MERGE_STRATEGIES`` starts with that one
+
+    Returns
+    -------
+    Optional[str]
+        The strategy that copied the last chunk, None when there were none
+    """
+    candidates = _candidates(strategy)
+    used: Optional[str] = None
+    fell_back = False
+
+    directory = os.path.dirname(output_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    dst_fd = os.open(
+        output_file,
+        os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0),
+        0o644,
+    )
+    try:
+        offset = 0
+        for chunk_file in chunk_files:
+            src_fd = os.open(chunk_file, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+            try:
+                size = os.fstat(src_fd).st_size
+                while True:
+                    used = candidates[0]
+                    start = time.perf_counter()
+                    try:
+                        copied = _COPY_FUNCS[used](src_fd, dst_fd, size, offset)
+                    except OSError as e:
+                        if e.errno not in _UNSUPPORTED_ERRNO or len(candidates) == 1:
+                            raise
+                        # drop the strategy for the rest of this merge
+                        candidates.pop(0)
+                        fell_back = True
+                        continue
+                    if copied != size:
+                        raise OSError(
+                            errno.EIO, f"short copy of {chunk_file}: {copied}/{size}"
+                        )
+                    _record_stat(used, size, time.perf_counter() - start, fell_back)
+                    fell_back = False
+                    break
+                offset += size
+            finally:
+                os.close(src_fd)
+    except BaseException:
+        os.close(dst_fd)
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        raise
+    os.close(dst_fd)
+
+    if used:
+        with _merge_stats_lock:
+            _merge_stats[used].files += 1
+    return used
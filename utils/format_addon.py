@@ -1,8 +1,12 @@
+import functools
+import threading
 import time
 import os
 from enum import Enum
+from typing import List, Optional
 from loguru import logger
 import regex as re
+import shlex
 import shutil
 import string
 import zhon.hanzi  # 导入中文标点符号集合
@@ -11,6 +15,7 @@ import mimetypes
 from opencc import OpenCC
 import json
 from ruamel.yaml.comments import CommentedSeq, CommentedMap
+from utils.file_merge import merge_chunk_files
 from utils.meta_data import MetaData
 
 def load_waste_word_json(json_file):
@@ -76,130 +81,220 @@ def validate_title_clean(title: str) -> str:
     b = re.sub('[{}]'.format(zhon.hanzi.punctuation), ' ', b)
     return b
 
-def process_string(string_a: str):
-    if not string_a or string_a == '':
-        return ''
-    a = string_a
-    # 发现文件名中有时包含两次后缀，处理掉
-    if string_a.lower().endswith('mp3'):
-        a = re.sub("mp3", "", a, flags=re.IGNORECASE)
-    elif string_a.lower().endswith('mp4'):
-        a = re.sub("mp4", "", a, flags=re.IGNORECASE)
-    elif string_a.lower().endswith('txt'):
-        a = re.sub("txt", "", a, flags=re.IGNORECASE)
-
-
-    # 清理已知的废文字
-    waste_words_patterns = ["Asm糖七baby", "ASM艺彤酱", "ASM艺彤酱", "dea诱耳", "阿木木", "菊花花", "不详", "顾骁梦",
-                            "酒Whiskey", "朗读向", "李莎", "林三岁-", "另类", "萝莉一凡", "夢冬", "南征", "清软~喵",
-                            "清软喵.*?", "绅士音声", "说人话的吊", "小芸豆儿新地点", "音声", "有声清读", "御姐音",
-                            "芝恩㱏", "烛灵儿", "（剧情）", "奶兮酱", "唐樱樱", "迷鹿", "沐醒醒子", "初霸霸", "小芸豆",
-                            "直播", "小小奶瓶儿", "渔晚", "（立体声）", "【18+中文音声】", "南飞作品", "步二", "剧情:",
-                            "阿稀稀大魔王", "大伊伊", "丸子君", "流景", "是喵宝啊", "桥桥超温柔", "椰子", "黧落大总攻",
-                            "绮夏", "小羊喵", "婉儿别闹", "林三岁", "Floa圆圆", "步二", "步一", "步三", "枸杞子",
-                            "JOK~清~", "五月织姬", "浅小茉", "夏乔恩", "迷路的卡卡酱", "陈玺颜", "织月黛黛", "剧场:",
-                            r'\[人妻熟妇\]', r'\[青春校园\]', r'\[都市生活\]', r'\[古典修真\]', r'\[武侠玄幻\]',
-                            r'\[家庭乱伦\]', r'\[现代情感\]',
-                            "是喵宝呀", "是幼情呀", "离二烟烟", "林晓蜜", "不要吃咖喱", "奶斯学姐", "人妻熟妇_",
-                            "雾心宝贝",
-                            "ainnight雨", "暴躁啊御", "羊绵绵", "月一姐姐", "井上鸢御", "大宝 ", "奶斯姐姐", "楠兮",
-                            "焱绯", "莉香", "花情女王", "耳屿剧社", "小米ASM", "香取绮罗", "雪音", "小曦老师",
-                            "辣不辣", "不二丸叽", "小萌", "小太阳贼大", "圈圈 ", "奶兮酱", "唐樱樱", "曦曦", "沐醒醒",
-                            "喵小咪", "音无来未", "温舒蕾", "林暮色", "小一熟了", "子初霸霸火箭", "（全本）", "派派小说",
-                            "【完本】", "（未删节）", "步二", "步一", "步三",
-                            "全作者", "全图文", "粉樱桃", "萝莉一凡_"
-                            "（催眠）",
-                            "（系统）",
-                            "（原创_催眠类！）",
-                            "（校对板）",
-                            "（未删节全本）","搜索视频","搜索群组","寻片交流","频道导航",
-                            "(完结 番外)", "【完】", "【人妻】", "Discuz", r"【中文.*?】", r"全本$", r"完结$", r"作者.+?$", r"（作者.+?）$",
-                            r"【18禁.*?】", r"【3D.*?】", r"【A_SMR.*?】", r"【ASMR.*?】", r"【NJ..*?】", r"【NTR.*?】",
-                            r"【Q弹一只菊.*?】",
-                            r"【R18.*?】", r"【sophia喵酱.*?】r", r"【YiyiZi.*?】", r"【安里.*?】", r"【安眠.*?】",
-                            r"【白杭芷.*?】",
-                            r"【病娇.*?】", r"【厂长.*?】", r"【晨曦.*?】", r"【纯爱.*?】", r"【刺猬猫.*?】", r"【催眠】",
-                            r"【大饼.*?】r", r"【蒂法.*?】", r"【都市】", r"【短篇.*?】", r"【耳边.*?】", r"【耳机.*?】",
-                            r"【耳语.*?】",
-                            r"【福利】", r"【付费】", r"【高考应援.*?】", r"【哈尼.*?】", r"【喊麦.*?】r", r"【杭白芷.*?】",
-                            r"【合集】", r"【哄睡.*?】", r"【回放.*?】", r"【即兴.*?】", r"【剧场】",
-                            r"【剧情】",
-                            r"【咖喱.*?】", r"【林晓蜜.*?】", r"【另类】r", r"【乱伦】", r"【绿奴】", r"【曼曼.*?】",
-                            r"【猫萝.*?】", r"【迷鹿.*?】", r"【蜜婕.*?】", r"【喵会长.*?】", r"【喵老师.*?】", r"【睦之人.*?】",
-                            r"【男性向.*?】", r"【南锦.*?】r", r"【南星社.*?】", r"【南征.*?】", r"【楠兮.*?】", r"【陪睡.*?】",
-                            r"【桥桥.*?】", r"【清软喵.*?】", r"【情感.*?】", r"【全集.*?】", r"【群[0-9].*?】",
-                            r"【人头麦.*?】r", r"【桑九.*?】", r"【闪亮银.*?】", r"【闪亮银.*?】", r"【绅士.*?】", r"【实录.*?】",
-                            r"【是幼情吖.*?】", r"【兽人.*?】", r"【双声道.*?】", r"【睡前故事.*?】", r"【岁岁.*?】r",
-                            r"【桃夭.*?】", r"(\d{4})_(\d{2})_(\d{2})_(\d{2})_(\d{2})_(\d{2})", r"(\d{4})_(\d{2})_(\d{2})",
-                            r"【同人.*?】", r"【完结.*?】", r"【完整.*?】", r"【无人声.*?】", r"【武侠.*?】", r"【希尔薇.*?】",
-                            r"【闲话家常.*?】", r"【小剧场.*?】", r"【小咖喱.*?】r", r"【小咪.*?】", r"【小墨.*?】",
-                            r"【小苮儿.*?】",
-                            r"【小遥.*?】", r"【小窈.*?】", r"【小夜.*?】", r"【小芸豆.*?】", r"【校园.*?】",
-                            r"【芯嫒.*?】",
-                            r"【羞耻.*?】r", r"【妍希.*?】", r"【厌世.*?】", r"【叶月.*?】", r"【夜听.*?】", r"【夜袭.*?】",
-                            r"【葉月.*?】",
-                            r"【音频.*?】", r"【音声.*?】", r"【幼情.*?】", r"【诱耳.*?】", r"【渔子溪.*?】r", r"【芸汐.*?】",
-                            r"【枕边.*?】", r"【直播.*?】", r"【中文.*?】", r"【助眠.*?】", r"【紫眸.*?】", r"【作者\..*?】",
-                            r"作者:.*?", r"全$"]
-
-    for waste_pattern in waste_words_patterns:
-        if re.search(waste_pattern, a, flags=re.IGNORECASE):
-            a = re.sub(waste_pattern, '', a, flags=re.IGNORECASE)
-
-    # pattern = re.compile(r'[^\w\u4e00-\u9fff\u3040-\u30ff\u31f0-\u31ff‘’-]')  # 匹配中文、引文、日文、数字字符的正则表达式范围
-    pattern = r'[^\u4e00-\u9fff\u3040-\u30ff\u31f0-\u31ff\u3400-\u4dbf\uac00-\ud7af\u3000-\u303f\ufe10-\ufe1f\ufe30-\ufe4f\uff00-\uffef\w\s\p{P}]'
-    a = re.sub(pattern, ' ', a)
-
-    # if bool(pattern.search(a)):
-    #     # 去掉开头的非汉字字符
-    #     a = re.sub(r'^[^\u4e00-\u9fa5]+', '', a)
-    # else:
-    #     # 去掉开头的非英文字符
-    #     a = re.sub(r'^[^a-zA-Z]+', '', a)
-
-    pattern = re.compile(r'(^\d+[\s_]*)([^\d].+)')
-    match = pattern.match(a)
-    if match:
-        a = match.groups()[-1]
-
-    pattern = re.compile(r'(.+\d+?)_(\d.+)')
-    match = pattern.match(a)
-    if match:
-        a = f"{match.groups()[0]}-{match.groups()[1]}"
-
-    pattern = re.compile(r'(.*?)([(（【]\d+[)）】])$')
-    match = pattern.match(a)
-    if match:
-        a = match.groups()[0]
-
-    pattern_copy = re.compile(r"([a-zA-Z0-9\u4e00-\u9fa5].+)(\([0-9]+\)+)+")
-    match = pattern_copy.match(a)
-    last_part = ''
-    if match:
-        a, last_part = match.groups()
-        last_part = re.sub(r'[()（）【】]','',last_part)
-    a = a + ' ' +  last_part
+WASTE_WORDS_PATTERNS = ["Asm糖七baby", "ASM艺彤酱", "ASM艺彤酱", "dea诱耳", "阿木木", "菊花花", "不详", "顾骁梦",
+                        "酒Whiskey", "朗读向", "李莎", "林三岁-", "另类", "萝莉一凡", "夢冬", "南征", "清软~喵",
+                        "清软喵.*?", "绅士音声", "说人话的吊", "小芸豆儿新地点", "音声", "有声清读", "御姐音",
+                        "芝恩㱏", "烛灵儿", "（剧情）", "奶兮酱", "唐樱樱", "迷鹿", "沐醒醒子", "初霸霸", "小芸豆",
+                        "直播", "小小奶瓶儿", "渔晚", "（立体声）", "【18+中文音声】", "南飞作品", "步二", "剧情:",
+                        "阿稀稀大魔王", "大伊伊", "丸子君", "流景", "是喵宝啊", "桥桥超温柔", "椰子", "黧落大总攻",
+                        "绮夏", "小羊喵", "婉儿别闹", "林三岁", "Floa圆圆", "步二", "步一", "步三", "枸杞子",
+                        "JOK~清~", "五月织姬", "浅小茉", "夏乔恩", "迷路的卡卡酱", "陈玺颜", "织月黛黛", "剧场:",
+                        r'\[人妻熟妇\]', r'\[青春校园\]', r'\[都市生活\]', r'\[古典修真\]', r'\[武侠玄幻\]',
+                        r'\[家庭乱伦\]', r'\[现代情感\]',
+                        "是喵宝呀", "是幼情呀", "离二烟烟", "林晓蜜", "不要吃咖喱", "奶斯学姐", "人妻熟妇_",
+                        "雾心宝贝",
+                        "ainnight雨", "暴躁啊御", "羊绵绵", "月一姐姐", "井上鸢御", "大宝 ", "奶斯姐姐", "楠兮",
+                        "焱绯", "莉香", "花情女王", "耳屿剧社", "小米ASM", "香取绮罗", "雪音", "小曦老师",
+                        "辣不辣", "不二丸叽", "小萌", "小太阳贼大", "圈圈 ", "奶兮酱", "唐樱樱", "曦曦", "沐醒醒",
+                        "喵小咪", "音无来未", "温舒蕾", "林暮色", "小一熟了", "子初霸霸火箭", "（全本）", "派派小说",
+                        "【完本】", "（未删节）", "步二", "步一", "步三",
+                        "全作者", "全图文", "粉樱桃", "萝莉一凡_"
+                        "（催眠）",
+                        "（系统）",
+                        "（原创_催眠类！）",
+                        "（校对板）",
+                        "（未删节全本）","搜索视频","搜索群组","寻片交流","频道导航",
+                        "(完结 番外)", "【完】", "【人妻】", "Discuz", r"【中文.*?】", r"全本$", r"完结$", r"作者.+?$", r"（作者.+?）$",
+                        r"【18禁.*?】", r"【3D.*?】", r"【A_SMR.*?】", r"【ASMR.*?】", r"【NJ..*?】", r"【NTR.*?】",
+                        r"【Q弹一只菊.*?】",
+                        r"【R18.*?】", r"【sophia喵酱.*?】r", r"【YiyiZi.*?】", r"【安里.*?】", r"【安眠.*?】",
+                        r"【白杭芷.*?】",
+                        r"【病娇.*?】", r"【厂长.*?】", r"【晨曦.*?】", r"【纯爱.*?】", r"【刺猬猫.*?】", r"【催眠】",
+                        r"【大饼.*?】r", r"【蒂法.*?】", r"【都市】", r"【短篇.*?】", r"【耳边.*?】", r"【耳机.*?】",
+                        r"【耳语.*?】",
+                        r"【福利】", r"【付费】", r"【高考应援.*?】", r"【哈尼.*?】", r"【喊麦.*?】r", r"【杭白芷.*?】",
+                        r"【合集】", r"【哄睡.*?】", r"【回放.*?】", r"【即兴.*?】", r"【剧场】",
+                        r"【剧情】",
+                        r"【咖喱.*?】", r"【林晓蜜.*?】", r"【另类】r", r"【乱伦】", r"【绿奴】", r"【曼曼.*?】",
+                        r"【猫萝.*?】", r"【迷鹿.*?】", r"【蜜婕.*?】", r"【喵会长.*?】", r"【喵老师.*?】", r"【睦之人.*?】",
+                        r"【男性向.*?】", r"【南锦.*?】r", r"【南星社.*?】", r"【南征.*?】", r"【楠兮.*?】", r"【陪睡.*?】",
+                        r"【桥桥.*?】", r"【清软喵.*?】", r"【情感.*?】", r"【全集.*?】", r"【群[0-9].*?】",
+                        r"【人头麦.*?】r", r"【桑九.*?】", r"【闪亮银.*?】", r"【闪亮银.*?】", r"【绅士.*?】", r"【实录.*?】",
+                        r"【是幼情吖.*?】", r"【兽人.*?】", r"【双声道.*?】", r"【睡前故事.*?】", r"【岁岁.*?】r",
+                        r"【桃夭.*?】", r"(\d{4})_(\d{2})_(\d{2})_(\d{2})_(\d{2})_(\d{2})", r"(\d{4})_(\d{2})_(\d{2})",
+                        r"【同人.*?】", r"【完结.*?】", r"【完整.*?】", r"【无人声.*?】", r"【武侠.*?】", r"【希尔薇.*?】",
+                        r"【闲话家常.*?】", r"【小剧场.*?】", r"【小咖喱.*?】r", r"【小咪.*?】", r"【小墨.*?】",
+                        r"【小苮儿.*?】",
+                        r"【小遥.*?】", r"【小窈.*?】", r"【小夜.*?】", r"【小芸豆.*?】", r"【校园.*?】",
+                        r"【芯嫒.*?】",
+                        r"【羞耻.*?】r", r"【妍希.*?】", r"【厌世.*?】", r"【叶月.*?】", r"【夜听.*?】", r"【夜袭.*?】",
+                        r"【葉月.*?】",
+                        r"【音频.*?】", r"【音声.*?】", r"【幼情.*?】", r"【诱耳.*?】", r"【渔子溪.*?】r", r"【芸汐.*?】",
+                        r"【枕边.*?】", r"【直播.*?】", r"【中文.*?】", r"【助眠.*?】", r"【紫眸.*?】", r"【作者\..*?】",
+                        r"作者:.*?", r"全$"]
+
+# 运行目录下的废文字JSON列表 文件修改后自动重新载入
+WASTE_WORD_FILE = "waste_words.json"
+
+_RE_DOUBLE_EXT = {ext: re.compile(ext, flags=re.IGNORECASE) for ext in ['mp3', 'mp4', 'txt']}
+_RE_UNKNOWN_CHARS = re.compile(
+    r'[^\u4e00-\u9fff\u3040-\u30ff\u31f0-\u31ff\u3400-\u4dbf\uac00-\ud7af\u3000-\u303f\ufe10-\ufe1f\ufe30-\ufe4f'
+    r'\uff00-\uffef\w\s\p{P}]')
+_RE_LEADING_NUMBER = re.compile(r'(^\d+[\s_]*)([^\d].+)')
+_RE_NUMBER_UNDERSCORE = re.compile(r'(.+\d+?)_(\d.+)')
+_RE_TRAILING_INDEX = re.compile(r'(.*?)([(（【]\d+[)）】])$')
+_RE_COPY_SUFFIX = re.compile(r"([a-zA-Z0-9\u4e00-\u9fa5].+)(\([0-9]+\)+)+")
+_RE_BRACKETS = re.compile(r'[()（）【】]')
+_RE_PUNCTUATION = re.compile('[{}]'.format(string.punctuation))
+_RE_HANZI_PUNCTUATION = re.compile('[{}]'.format(zhon.hanzi.punctuation))
+_RE_OTHERS = re.compile(r"[\/\\\:\*\?\"\<\>#\.\|\n/\:*?\"<>\|_ ，、。？！@#￥%……&*（）+：；《》+【】\]\[]")
+
+
+class StringNormalizer:
+    """Compiled ``process_string`` pipeline.
+
+    The waste word patterns are compiled once, and additionally merged into a
+    single alternation that is used as a prefilter: only names that contain
+    any waste word pay for the per pattern pass, which keeps the original
+    pattern order and so the original result. Results are kept in a bounded
+    LRU cache, which is dropped whenever the waste word file changes.
+    """
 
-    # 去除英文标点符号
-    a = re.sub('[{}]'.format(string.punctuation), ' ', a)
+    def __init__(self, waste_word_file: Optional[str] = WASTE_WORD_FILE, cache_size: int = 4096,
+                 reload_interval: float = 1.0):
+        self.waste_word_file = waste_word_file
+        self.cache_size = cache_size
+        self.reload_interval = reload_interval
+        self._file_mtime: Optional[float] = None
+        self._next_check: float = 0
+        self._lock = threading.Lock()
+        self._converter = OpenCC('t2s')
+        self._compile(WASTE_WORDS_PATTERNS)
+        self._check_reload()
+
+    def _compile(self, patterns: List[str]):
+        compiled = []
+        for pattern in patterns:
+            try:
+                compiled.append((pattern, re.compile(pattern, flags=re.IGNORECASE)))
+            except re.error as e:
+                logger.warning(f"skip invalid waste word pattern {pattern!r}: {e}")
+        self.patterns = [item for _, item in compiled]
+        self._any_waste = re.compile('|'.join(f'(?:{pattern})' for pattern, _ in compiled), flags=re.IGNORECASE)
+        self._cached = functools.lru_cache(maxsize=self.cache_size)(self._process)
+
+    def _check_reload(self):
+        if not self.waste_word_file:
+            return
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.reload_interval
 
-    # 去除中文标点符号
-    a = re.sub('[{}]'.format(zhon.hanzi.punctuation), ' ', a)
+        try:
+            mtime = os.path.getmtime(self.waste_word_file)
+        except OSError:
+            mtime = None
+        if mtime == self._file_mtime:
+            return
+
+        with self._lock:
+            if mtime == self._file_mtime:
+                return
+            # 不管文件能否读取都记下mtime 坏文件不会每次调用都重新加载
+            self._file_mtime = mtime
+            extra = []
+            try:
+                extra = load_waste_word_json(self.waste_word_file) or []
+            except Exception as e:
+                logger.warning(f"failed to load {self.waste_word_file}: {e}")
+            self._compile(WASTE_WORDS_PATTERNS + [i for i in extra if isinstance(i, str) and i])
+
+    def t2s(self, string_a: str) -> str:
+        with self._lock:
+            return self._converter.convert(string_a)
+
+    def normalize(self, string_a: str) -> str:
+        if not string_a or string_a == '':
+            return ''
+        self._check_reload()
+        return self._cached(string_a)
+
+    def _remove_waste_words(self, a: str) -> str:
+        if not self._any_waste.search(a):
+            return a
+        for pattern in self.patterns:
+            a = pattern.sub('', a)
+        return a
+
+    def _process(self, string_a: str) -> str:
+        a = string_a
+        # 发现文件名中有时包含两次后缀，处理掉
+        lower_a = string_a.lower()
+        for ext, pattern in _RE_DOUBLE_EXT.items():
+            if lower_a.endswith(ext):
+                a = pattern.sub("", a)
+                break
+
+        # 清理已知的废文字
+        a = self._remove_waste_words(a)
+
+        a = _RE_UNKNOWN_CHARS.sub(' ', a)
+
+        match = _RE_LEADING_NUMBER.match(a)
+        if match:
+            a = match.groups()[-1]
+
+        match = _RE_NUMBER_UNDERSCORE.match(a)
+        if match:
+            a = f"{match.groups()[0]}-{match.groups()[1]}"
+
+        match = _RE_TRAILING_INDEX.match(a)
+        if match:
+            a = match.groups()[0]
+
+        match = _RE_COPY_SUFFIX.match(a)
+        last_part = ''
+        if match:
+            a, last_part = match.groups()
+            last_part = _RE_BRACKETS.sub('', last_part)
+        a = a + ' ' + last_part
+
+        # 去除英文标点符号
+        a = _RE_PUNCTUATION.sub(' ', a)
+
+        # 去除中文标点符号
+        a = _RE_HANZI_PUNCTUATION.sub(' ', a)
+
+        # 去除其他
+        a = _RE_OTHERS.sub(" ", a).replace('  ', ' ').replace('--', '-').replace('——', '-').replace('～', '-').strip()
+
+        while '  ' in a:
+            a = a.replace('  ', ' ')
+        return self.t2s(a)
+
+
+_string_normalizer: Optional[StringNormalizer] = None
+
+
+def get_string_normalizer() -> StringNormalizer:
+    global _string_normalizer
+    if _string_normalizer is None:
+        _string_normalizer = StringNormalizer()
+    return _string_normalizer
+
+
+def set_waste_word_file(waste_word_file: Optional[str]):
+    global _string_normalizer
+    _string_normalizer = StringNormalizer(waste_word_file)
 
-    # 去除其他
-    r_str = r"[\/\\\:\*\?\"\<\>#\.\|\n/\:*?\"<>\|_ ，、。？！@#￥%……&*（）+：；《》+【】\]\[]"
-    a = re.sub(r_str, " ", a).replace('  ', ' ').replace('--', '-').replace('——', '-').replace('～', '-').strip()
 
-    while '  ' in a:
-        a = a.replace('  ', ' ')
-    result = t2s(a)
-    # print(f"trans from :  {string_a}=TO==>{result}\n")
-    return result
+def process_string(string_a: str):
+    return get_string_normalizer().normalize(string_a)
 
 
 def t2s(string_a):
-    converter = OpenCC('t2s')
-    return converter.convert(string_a)
+    return get_string_normalizer().t2s(string_a)
 
 
 def string_similar(s1, s2):
@@ -363,7 +458,7 @@ def find_missing_files(folder_path, max_number):
         return missing_ranges
 
 def merge_files_cat(folder_path, output_file ):
-    os.system(f"cat '{folder_path}'/* > {output_file}")
+    os.system(f"cat {shlex.quote(folder_path)}/* > {shlex.quote(output_file)}")
 
 def merge_files_shutil(folder_path, output_file):
     # 验证路径是否存在
@@ -422,14 +517,17 @@ def merge_files_write(folder_path, output_file, batch_size=1000):
     files = os.listdir(folder_path)
     files.sort()  # 确保文件按照一致的顺序合并
 
-    if os.path.exists(output_file):
-        os.remove(output_file)
+    # 固定大小缓冲区逐块复制 不再整块读入内存
+    merge_chunk_files([os.path.join(folder_path, i) for i in files], output_file, 'copy')
+
+
+def merge_files_auto(folder_path, output_file):
+    # 优先使用内核复制(reflink/copy_file_range/sendfile) 不支持时自动回退
+    files = os.listdir(folder_path)
+    files.sort()  # 确保文件按照一致的顺序合并
 
-    with open(output_file, 'ab') as output_file:
-        for file_name in files:
-            file_path = os.path.join(folder_path, file_name)
-            with open(file_path, 'rb') as source:
-                output_file.write(source.read())
+    strategy = merge_chunk_files([os.path.join(folder_path, i) for i in files], output_file, 'auto')
+    logger.debug(f"merged {output_file} with {strategy}")
 
 
 def get_folder_files_size(folder_path):
@@ -502,15 +600,17 @@ def save_chunk_to_file(chunk, file_path, file_name):
 
 
 
-def _get_msg_db_status(msg_dict: dict ,db, similar_set, sizerange_min):
+def _get_msg_db_status(msg_dict: dict ,db, similar_set, sizerange_min, msg_db_status: Optional[int] = None):
+    # msg_db_status 已由 get_status_batch 批量查出时直接使用
     msg_chat_id = msg_dict.get('chat_id')
-    try:
-        msg_db_status = db.getStatus(msg_chat_id, msg_dict.get('message_id'))
-    except Exception as e:
-        logger.error(
-            f"[{e}].",
-            exc_info=True,
-        )
+    if msg_db_status is None:
+        try:
+            msg_db_status = db.getStatus(msg_chat_id, msg_dict.get('message_id'))
+        except Exception as e:
+            logger.error(
+                f"[{e}].",
+                exc_info=True,
+            )
 
     if msg_db_status == 0:  #数据库里没这条数据
         db_files = db.get_similar_files(msg_dict, similar_set, sizerange_min, [1, 2])  #看看是否有等价内容数据 4因为依附于1 暂时不管
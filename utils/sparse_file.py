@@ -0,0 +1,231 @@
+"""Preallocated single-file chunk writer"""
+
+import os
+import struct
+import threading
+from typing import List, Tuple
+
+CHUNK_SIZE = 1024 * 1024
+
+_BITMAP_MAGIC = b"TDLB"
+_BITMAP_HEADER = struct.Struct("<4sQQ")
+
+
+class ChunkBitmap:
+    """Bitmap sidecar recording which chunks of a file are complete.
+
+    The sidecar holds a small header (magic, file size, chunk size) followed by
+    one bit per chunk, marking a chunk rewrites only the byte holding its bit.
+    """
+
+    def __init__(self, path: str, file_size: int, chunk_size: int = CHUNK_SIZE):
+        self.path = path
+        self.file_size = file_size
+        self.chunk_size = chunk_size
+        self.chunk_count = max(1, -(-file_size // chunk_size))
+        self.bits = bytearray((self.chunk_count + 7) // 8)
+        self.done_count = 0
+        self._fd = -1
+        self._load()
+        # bits in the sidecar, ``mark`` only changes ``bits``
+        self._persisted = bytearray(self.bits)
+
+    def _header(self) -> bytes:
+        return _BITMAP_HEADER.pack(_BITMAP_MAGIC, self.file_size, self.chunk_size)
+
+    def _load(self):
+        header = self._header()
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                data = f.read()
+            if data[: len(header)] == header and len(data) == len(header) + len(
+                self.bits
+            ):
+                self.bits[:] = data[len(header) :]
+                self.done_count = sum(bin(byte).count("1") for byte in self.bits)
+                return
+
+        # missing or written for another file, start over
+        with open(self.path, "wb") as f:
+            f.write(header + bytes(self.bits))
+
+    def is_set(self, idx: int) -> bool:
+        """If chunk ``idx`` is complete"""
+        return bool(self.bits[idx >> 3] & (1 << (idx & 7)))
+
+    def mark(self, idx: int) -> bool:
+        """Mark chunk ``idx`` complete in memory only, returns if it was not yet"""
+        if self.is_set(idx):
+            return False
+        self.bits[idx >> 3] |= 1 << (idx & 7)
+        self.done_count += 1
+        return True
+
+    def persist(self, indices: List[int]):
+        """Write the bits of ``indices`` to the sidecar
+
+        Only these bits are added to what the sidecar holds, chunks marked
+        meanwhile are not claimed before their own ``persist``.
+        """
+        if self._fd < 0:
+            self._fd = os.open(self.path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+        for idx in indices:
+            self._persisted[idx >> 3] |= 1 << (idx & 7)
+        for byte_idx in sorted({idx >> 3 for idx in indices}):
+            _pwrite(
+                self._fd,
+                bytes([self._persisted[byte_idx]]),
+                _BITMAP_HEADER.size + byte_idx,
+            )
+
+    def set(self, idx: int):
+        """Mark chunk ``idx`` complete and persist its bit"""
+        if self.mark(idx):
+            self.persist([idx])
+
+    def is_complete(self) -> bool:
+        """If every chunk is complete"""
+        return self.done_count == self.chunk_count
+
+    def missing_ranges(self) -> List[Tuple[int, int]]:
+        """Inclusive ``(start, end)`` ranges of chunks still missing"""
+        ranges = []
+        start = None
+        for idx in range(self.chunk_count):
+            if not self.is_set(idx):
+                if start is None:
+                    start = idx
+            elif start is not None:
+                ranges.append((start, idx - 1))
+                start = None
+        if start is not None:
+            ranges.append((start, self.chunk_count - 1))
+        return ranges
+
+    def close(self):
+        """Close the sidecar"""
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def remove(self):
+        """Close and delete the sidecar"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _pwrite(fd: int, data: bytes, offset: int):
+    """Write ``data`` at ``offset`` without moving a shared file position"""
+    if hasattr(os, "pwrite"):
+        os.pwrite(fd, data, offset)
+    else:
+        os.lseek(fd, offset, os.SEEK_SET)
+        os.write(fd, data)
+
+
+def _preallocate(fd: int, size: int):
+    """Reserve ``size`` bytes, fall back to a sparse file"""
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            pass
+    os.ftruncate(fd, size)
+
+
+class SparseFileWriter:
+    """Write chunks of a download in place into one preallocated file.
+
+    Chunks land at ``idx * chunk_size`` in ``path`` and are recorded in the
+    ``path + ".bitmap"`` sidecar, so a restart resumes from the bitmap and the
+    finished file only needs to be moved, never merged. Bits reach the
+    sidecar only after the data file is fsynced, by ``sync`` once
+    ``needs_sync`` (every ``sync_chunks`` chunks) and on ``close``, so a crash
+    can lose recent chunks but the bitmap never claims a chunk whose data is
+    not on disk. ``sync`` may run on another thread while chunks are written.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        file_size: int,
+        chunk_size: int = CHUNK_SIZE,
+        sync_chunks: int = 16,
+    ):
+        self.path = path
+        self.file_size = file_size
+        self.chunk_size = chunk_size
+        self.sync_chunks = max(1, sync_chunks)
+        self._unsynced: List[int] = []
+        self._sync_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.bitmap = ChunkBitmap(f"{path}.bitmap", file_size, chunk_size)
+
+        is_new = not os.path.exists(path) or os.path.getsize(path) != file_size
+        self._fd = os.open(
+            path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644
+        )
+        if is_new:
+            # a stale larger file would keep its tail after the last chunk
+            os.ftruncate(self._fd, 0)
+            _preallocate(self._fd, file_size)
+            if self.bitmap.done_count:
+                # data file is gone or wrong, the bitmap can not be trusted
+                self.bitmap.remove()
+                self.bitmap = ChunkBitmap(f"{path}.bitmap", file_size, chunk_size)
+
+    @property
+    def chunk_count(self) -> int:
+        """Number of chunks in the file"""
+        return self.bitmap.chunk_count
+
+    def write_chunk(self, idx: int, data: bytes) -> bool:
+        """Write chunk ``idx`` at its offset"""
+        expected = min(self.chunk_size, self.file_size - idx * self.chunk_size)
+        if len(data) != expected:
+            return False
+        _pwrite(self._fd, data, idx * self.chunk_size)
+        if self.bitmap.mark(idx):
+            self._unsynced.append(idx)
+        return True
+
+    @property
+    def needs_sync(self) -> bool:
+        """If ``sync_chunks`` chunks are waiting for ``sync``"""
+        return len(self._unsynced) >= self.sync_chunks
+
+    def sync(self):
+        """Fsync the data file, then persist the bits of the chunks written before"""
+        with self._sync_lock:
+            if not self._unsynced or self._fd < 0:
+                return
+            # chunks written while fsyncing wait for the next sync
+            pending, self._unsynced = self._unsynced, []
+            os.fsync(self._fd)
+            self.bitmap.persist(pending)
+
+    def missing_ranges(self) -> List[Tuple[int, int]]:
+        """Inclusive ``(start, end)`` ranges of chunks still missing"""
+        return self.bitmap.missing_ranges()
+
+    def is_complete(self) -> bool:
+        """If every chunk has been written"""
+        return self.bitmap.is_complete()
+
+    def close(self):
+        """Close data file and sidecar"""
+        if self._fd >= 0:
+            self.sync()
+            os.close(self._fd)
+            self._fd = -1
+        self.bitmap.close()
+
+    def finish(self):
+        """Flush the complete file to disk and drop the sidecar"""
+        os.fsync(self._fd)
+        self._unsynced = []
+        self.close()
+        self.bitmap.remove()